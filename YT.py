@@ -1,21 +1,23 @@
-import yt_dlp
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import threading
+from collections import deque
 from datetime import datetime
-import re
 from tkinter.font import Font
-import queue
 import sys
 import random
 import colorsys
-from mutagen.easyid3 import EasyID3
-from mutagen.id3 import ID3, APIC, COMM
-import requests
 import os
 import math
 import time
 
+from ytmp3.engine import DownloadEngine
+from ytmp3.jobs import (
+    ALBUM_CANCELED, ALBUM_FINISHED, ALBUM_RESTRICTED, ALBUM_SELECTED, ARCHIVED,
+    CONVERTING, DOWNLOADING, FINISHED, QUEUED, SKIPPED,
+)
+from ytmp3.urls import validate_urls
+
 # Then use:
 current_date = datetime.now().strftime("%d-%m-%y")
 
@@ -295,6 +297,58 @@ class AnimatedButton(RoundedButton):
             self.configure(state='disabled')  # Disable button immediately after click
             self.command()
 
+class UIDispatcher:
+    """Run callables on the Tk thread.
+
+    Worker threads append to a deque and wake the Tk loop with one virtual
+    event; nothing runs while there is no work. Each wake-up drains the
+    whole deque, handing control back to Tk for a moment whenever a batch
+    takes longer than ``budget`` seconds so the window keeps redrawing.
+    """
+
+    EVENT = "<<UIDispatch>>"
+
+    def __init__(self, root, budget=0.05):
+        self.root = root
+        self.budget = budget
+        self.tasks = deque()
+        self.lock = threading.Lock()
+        self.wakeup_pending = False
+        root.bind(self.EVENT, self.drain)
+
+    def put(self, task):
+        with self.lock:
+            self.tasks.append(task)
+            if self.wakeup_pending:
+                return  # đã có một lần đánh thức đang chờ, nó sẽ chạy luôn task này
+            self.wakeup_pending = True
+        try:
+            self.root.event_generate(self.EVENT, when="tail")
+        except (tk.TclError, RuntimeError):
+            # window already closed; không để cờ kẹt ở True, nếu không put() sau sẽ không bao giờ đánh thức lại
+            with self.lock:
+                self.wakeup_pending = False
+
+    def qsize(self):
+        return len(self.tasks)
+
+    def drain(self, event=None):
+        deadline = time.monotonic() + self.budget
+        while True:
+            with self.lock:
+                if not self.tasks:
+                    self.wakeup_pending = False
+                    return
+                task = self.tasks.popleft()
+            try:
+                task()
+            except Exception as e:
+                print(f"Error in UI queue processing: {str(e)}")
+            if time.monotonic() >= deadline:
+                # Hết thời gian: để Tk vẽ lại và xử lý thao tác người dùng rồi làm tiếp
+                self.root.after(1, self.drain)
+                return
+
 class MP3Converter:
     def __init__(self, root):
         self.root = root
@@ -350,7 +404,9 @@ class MP3Converter:
                 "choose_folder": "Choose Folder",
                 "download": "Download MP3",
                 "download_flac": "Download FLAC",
+                "download_original": "Download Audio",
                 "progress": "Download Progress",
+                "parallel_downloads": "parallel",
                 "help": "Help",
                 "ready": "Ready to download!",
                 "starting": "Starting downloads...",
@@ -369,7 +425,12 @@ class MP3Converter:
                 "copy": "Copy",
                 "paste": "Paste",
                 "select_all": "Select All",
+                "profile_batch": "Profile next download (cProfile + tracemalloc)",
+                "profile_saved": "Profile saved to:\n{}",
+                "resume_title": "Unfinished downloads",
+                "resume_prompt": "{} downloads from the last session did not finish.\nContinue them now?",
                 "flac_format": "FLAC Format (High Quality)",
+                "original_format": "Original Audio (No Re-encoding)",
                 "track_selection_title": "Track Selection",
                 "select_tracks_to_download": "Select tracks to download",
                 "select_all": "Select All",
@@ -384,8 +445,8 @@ class MP3Converter:
                 "skipped_tracks": "{} tracks were skipped due to geo-restriction",
                 "geo_restricted": "All tracks are geo-restricted",
                 "geo_failed": "❌ Geo-restricted: {}",
+                "already_downloaded": "⏭️ Already in your library: {}",
                 "loading_album": "⏳ Loading album information...",
-                "checking_tracks": "⏳ Checking tracks in album: {}",
                 "checking_track": "⏳ Checking track {}/{} in {}",
                 "found_tracks": "✅ Found {} available tracks in {}",
                 "loading_track": "⏳ Loading track information..."
@@ -397,7 +458,9 @@ class MP3Converter:
                 "choose_folder": "Chọn thư mục",
                 "download": "Tải MP3",
                 "download_flac": "Tải FLAC",
+                "download_original": "Tải âm thanh",
                 "progress": "Tiến trình tải",
+                "parallel_downloads": "song song",
                 "help": "Trợ giúp",
                 "ready": "Sẵn sàng tải!",
                 "starting": "Đang bắt đầu tải xuống...",
@@ -416,7 +479,12 @@ class MP3Converter:
                 "copy": "Sao chép",
                 "paste": "Dán",
                 "select_all": "Chọn tất cả",
+                "profile_batch": "Đo hiệu năng lần tải tiếp theo (cProfile + tracemalloc)",
+                "profile_saved": "Đã lưu kết quả đo hiệu năng vào:\n{}",
+                "resume_title": "Tải xuống chưa hoàn tất",
+                "resume_prompt": "Còn {} lượt tải từ lần trước chưa xong.\nTải tiếp ngay bây giờ?",
                 "flac_format": "Định dạng FLAC (Chất lượng cao)",
+                "original_format": "Âm thanh gốc (Không mã hóa lại)",
                 "track_selection_title": "Chọn bài hát",
                 "select_tracks_to_download": "Chọn bài hát để tải xuống",
                 "select_all": "Chọn tất cả",
@@ -431,9 +499,9 @@ class MP3Converter:
                 "skipped_tracks": "{} bài hát đã bị bỏ qua do hạn chế theo vùng",
                 "geo_restricted": "Tất cả bài hát bị hạn chế theo vùng",
                 "geo_failed": "❌ Bị chặn theo vùng: {}",
+                "already_downloaded": "⏭️ Đã có trong thư viện: {}",
                 "skipped_tracks": "{} bài hát đã bị bỏ qua do hạn chế theo vùng",
                 "loading_album": "⏳ Đang tải thông tin album...",
-                "checking_tracks": "⏳ Đang kiểm tra các bài hát trong album: {}",
                 "checking_track": "⏳ Đang kiểm tra bài {}/{} trong {}",
                 "found_tracks": "✅ Đã tìm thấy {} bài hát có thể tải trong {}",
                 "loading_track": "⏳ Đang tải thông tin bài hát..."
@@ -446,19 +514,21 @@ class MP3Converter:
         self.configure_styles()
 
         # Application variables
-        self.downloading_songs = []
+        self.concurrency = {}  # host -> current number of parallel downloads
+        self.profile_next_batch = tk.BooleanVar(value=False)  # hidden toggle, Shift + right-click
+        self.showing_jobs = False  # song_list shows job rows (True) or a status message
+        self.followed_job = None  # active job the progress list auto-scrolls to
         self.progress_var = tk.IntVar()
         self.save_path = os.path.expanduser("~/Downloads")
+
+        # Headless download engine, the GUI only renders its events
+        self.engine = DownloadEngine(save_path=self.save_path, select_tracks=self.select_album_tracks)
+        self.engine.subscribe(self.on_engine_event)
+        # Tải sẵn player YouTube / client_id SoundCloud vào cache trong lúc người dùng dán link
+        threading.Thread(target=self.engine.warm_up, daemon=True).start()
         
-        # Download tracking
-        self.total_downloads = 0
-        self.completed_downloads = 0
-        self.failed_downloads = 0
-        self.download_lock = threading.Lock()
-        
-        # UI update queue to prevent freezing
-        self.ui_queue = queue.Queue()
-        self.root.after(50, self.process_ui_queue)  # Process UI updates more frequently
+        # UI updates from worker threads, run on the Tk thread only when they arrive
+        self.ui_queue = UIDispatcher(self.root)
 
         # Font configuration
         self.title_font = Font(family="Helvetica", size=15, weight="bold")
@@ -469,19 +539,11 @@ class MP3Converter:
         self.main_frame = tk.Frame(self.root, bg=self.current_theme["bg"])
         self.main_frame.pack(fill=tk.BOTH, expand=True, padx=12, pady=12)
 
-        # Add ffmpeg path
-        if getattr(sys, 'frozen', False):
-            # If running as compiled bundle
-            self.ffmpeg_path = os.path.join(sys._MEIPASS, 'bin', 'ffmpeg')
-        else:
-            # If running as script
-            self.ffmpeg_path = '/usr/local/bin/ffmpeg'  # Default system path
-
         # Build UI
         self.create_ui()
-        
-        # Track album info extraction to prevent redundant operations
-        self.album_info_cache = {}
+
+        # Lần trước bị tắt giữa chừng: hỏi có tải tiếp không khi cửa sổ đã hiện
+        self.root.after(500, self.offer_resume)
 
     def configure_styles(self):
         # Progress bar style
@@ -625,7 +687,7 @@ class MP3Converter:
             self.format_frame,
             text=self.language_strings[self.language]["flac_format"],
             variable=self.use_flac,
-            command=self.update_download_button_text,
+            command=lambda: self.on_format_toggled(self.use_flac),
             bg=self.current_theme["bg"],
             fg=self.current_theme["fg"],
             selectcolor=self.current_theme["entry_bg"],
@@ -635,6 +697,22 @@ class MP3Converter:
         )
         self.format_checkbox.pack(side=tk.LEFT)
 
+        # Giữ nguyên luồng âm thanh gốc (.opus/.m4a/.ogg), không mã hóa lại
+        self.use_original = tk.BooleanVar(value=False)
+        self.original_checkbox = tk.Checkbutton(
+            self.format_frame,
+            text=self.language_strings[self.language]["original_format"],
+            variable=self.use_original,
+            command=lambda: self.on_format_toggled(self.use_original),
+            bg=self.current_theme["bg"],
+            fg=self.current_theme["fg"],
+            selectcolor=self.current_theme["entry_bg"],
+            activebackground=self.current_theme["bg"],
+            activeforeground=self.current_theme["fg"],
+            font=self.normal_font
+        )
+        self.original_checkbox.pack(side=tk.LEFT, padx=(10, 0))
+
         # Create and bind the context menu
         self.create_context_menu()
         self.url_text.bind('<Button-3>', self.show_context_menu)  # Right-click
@@ -755,27 +833,6 @@ class MP3Converter:
 
         self.update_song_list(self.tr("ready"))
 
-    def process_ui_queue(self):
-        """Process UI update requests from the queue to prevent freezing"""
-        try:
-            # Process up to 5 updates at a time for better responsiveness
-            for _ in range(5):
-                if self.ui_queue.empty():
-                    break
-                
-                # Get task with a timeout to prevent hanging
-                try:
-                    task = self.ui_queue.get(block=True, timeout=0.1)
-                    task()
-                    self.ui_queue.task_done()
-                except queue.Empty:
-                    break
-        except Exception as e:
-            print(f"Error in UI queue processing: {str(e)}")
-        finally:
-            # Always schedule the next check (faster interval for better responsiveness)
-            self.root.after(20, self.process_ui_queue)  # Reduced from 50ms to 20ms
-
     def tr(self, key):
         return self.language_strings[self.language][key]
 
@@ -813,21 +870,21 @@ class MP3Converter:
         
         # Update format checkbox
         self.format_checkbox.config(text=self.tr("flac_format"))
+        self.original_checkbox.config(text=self.tr("original_format"))
         
         # Update download button
-        if not hasattr(self.download_button, 'is_animating') or not self.download_button.is_animating:
-            if self.use_flac.get():
-                self.download_button.configure(text=self.tr("download_flac"))
-            else:
-                self.download_button.configure(text=self.tr("download"))
+        self.update_download_button_text()
         
         # Update progress frame title
-        self.progress_frame.config(text=self.tr("progress"))
+        self.update_progress_title()
         
         # Update status message if it's the default message
         current_text = self.song_list.get("1.0", tk.END).strip()
         if current_text in [self.tr("ready"), self.language_strings["en"]["ready"], self.language_strings["vi"]["ready"]]:
             self.update_song_list(self.tr("ready"))
+        elif self.engine.jobs.records():
+            # Danh sách được vẽ từ trạng thái job nên đổi ngôn ngữ giữa chừng vẫn đúng
+            self.update_song_list()
 
     def update_path_label(self):
         self.path_var.set(f"{self.tr('save_to')} {self.save_path}")
@@ -838,918 +895,158 @@ class MP3Converter:
             self.save_path = directory
             self.update_path_label()
 
-    def normalize_url(self, raw_url):
-        """Chuẩn hóa URL từ nhiều định dạng khác nhau thành URL chính thức"""
-        # Bỏ khoảng trắng ở đầu và cuối URL
-        url = raw_url.strip()
-        
-        # Xử lý URL có ký tự @ ở đầu
-        if url.startswith('@'):
-            # Kiểm tra xem sau @ có phải là URL đầy đủ không
-            if url[1:].strip().startswith(('http://', 'https://', 'www.')):
-                url = url[1:].strip()
-            # Nếu @ là một phần của tên kênh YouTube
-            else:
-                # Giữ nguyên @ nếu nó là username của kênh
-                pass
-        
-        # Xử lý URL thiếu phần domain (ví dụ: "watch?v=nsm32kHAaEA&list=...")
-        if url.startswith('watch?v='):
-            url = 'https://www.youtube.com/' + url
-        
-        # Chuyển YouTube mobile (m.youtube.com) sang desktop
-        if 'm.youtube.com' in url:
-            url = url.replace('m.youtube.com', 'www.youtube.com')
-        
-        # Chuyển YouTube Music sang link thường
-        if 'music.youtube.com' in url:
-            url = url.replace('music.youtube.com', 'www.youtube.com')
-        
-        # Đảm bảo URL YouTube có giao thức
-        if 'youtube.com' in url or 'youtu.be' in url:
-            if not url.startswith(('http://', 'https://')):
-                if url.startswith('www.'):
-                    url = 'https://' + url
-                else:
-                    url = 'https://www.' + url
-        
-        # Trích xuất video ID từ URL YouTube
-        youtube_watch_pattern = re.compile(r'(?:youtube\.com/watch\?v=|youtu\.be/)([a-zA-Z0-9_-]{11})')
-        youtube_match = youtube_watch_pattern.search(url)
-        if youtube_match:
-            video_id = youtube_match.group(1)
-            # Tạo URL chuẩn với video ID
-            return f"https://www.youtube.com/watch?v={video_id}"
-        
-        # Kiểm tra nếu URL là link rút gọn youtu.be
-        youtu_be_pattern = re.compile(r'^(https?://)?(www\.)?youtu\.be/([a-zA-Z0-9_-]{11})')
-        youtu_be_match = youtu_be_pattern.match(url)
-        if youtu_be_match:
-            video_id = youtu_be_match.group(3)
-            return f"https://www.youtube.com/watch?v={video_id}"
-        
-        # Chuyển YouTube Shorts sang link chính
-        shorts_pattern = re.compile(r'^(https?://)?(www\.|m\.)?youtube\.com/shorts/([a-zA-Z0-9_-]{11})')
-        shorts_match = shorts_pattern.match(url)
-        if shorts_match:
-            video_id = shorts_match.group(3)
-            return f"https://www.youtube.com/watch?v={video_id}"
-        
-        # Kiểm tra nếu URL là ID video YouTube trực tiếp
-        youtube_id_pattern = re.compile(r'^[a-zA-Z0-9_-]{11}$')
-        if youtube_id_pattern.match(url):
-            return f"https://www.youtube.com/watch?v={url}"
-        
-        # Đảm bảo URL SoundCloud có giao thức
-        if 'soundcloud.com' in url and not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-        
-        # Nếu không có quy tắc nào áp dụng, trả về URL gốc
-        return url
-
-    def is_valid_url(self, url):
-        """Check if the input is a valid YouTube or SoundCloud URL"""
-        # Chuẩn hóa URL trước khi kiểm tra
-        url = self.normalize_url(url)
-        
-        # Simple regex pattern for URL validation
-        url_pattern = re.compile(
-            r'^(https?://)?(www\.)?(youtube\.com|youtu\.be|soundcloud\.com)/.+',
-            re.IGNORECASE
-        )
-        return bool(url_pattern.match(url))
-
-    def validate_urls(self, urls):
-        """Validate a list of URLs, returning valid ones and invalid ones"""
-        valid_urls = []
-        invalid_urls = []
-        
-        for raw_url in urls:
-            if not raw_url.strip():  # Skip empty lines
-                continue
-            
-            # Chuẩn hóa URL
-            url = self.normalize_url(raw_url)
-            
-            if self.is_valid_url(url):
-                valid_urls.append(url)  # Lưu URL đã chuẩn hóa
+    def on_engine_event(self, event, data):
+        """Engine events arrive on worker threads, hand them over to the Tk thread"""
+        self.ui_queue.put(lambda: self.handle_engine_event(event, data))
+
+    def handle_engine_event(self, event, data):
+        """Translate an engine event into the localized progress list"""
+        if event == 'status':
+            self.update_song_list(self.tr(data['key']).format(*data['args']))
+        elif event == 'concurrency':
+            if data['stage'] == 'download':
+                self.concurrency[data['host']] = data['limit']
+                self.update_progress_title()
+        elif event == 'totals':
+            total = data['total']
+            self.progress_var.set(int(data['completed'] * 100 / total) if total > 0 else 0)
+        elif 'job_id' in data:
+            # Trạng thái đã được engine ghi vào self.engine.jobs, chỉ cần vẽ lại dòng của job đó
+            self.render_job(data['job_id'])
+
+    def job_lines(self, record):
+        """Localized progress lines of one job record"""
+        title = record.title or record.url or ''
+        if record.kind == 'album':
+            album_msg = self.tr("album").format(title)
+            if record.state == ALBUM_SELECTED:
+                lines = [f"{album_msg} ({record.selected} {self.tr('selected_tracks')})"]
+            elif record.state == ALBUM_CANCELED:
+                lines = [f"{album_msg} ({self.tr('canceled')})"]
+            elif record.state == ALBUM_RESTRICTED:
+                lines = [f"{album_msg} ({self.tr('geo_restricted')})"]
+            elif record.state == ALBUM_FINISHED:
+                if self.language == 'vi':
+                    lines = [f"Album: {title} - Tải xong {record.completed}/{record.total} bài"]
+                else:  # 'en' hoặc mặc định là tiếng Anh
+                    lines = [f"Album: {title} - Downloaded {record.completed}/{record.total} tracks"]
             else:
-                invalid_urls.append(raw_url)  # Giữ nguyên URL gốc cho thông báo lỗi
-        
-        return valid_urls, invalid_urls
-
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            downloaded = d.get('downloaded_bytes', 0)
-            total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 1)
-            if total > 0:
-                percentage = int((downloaded / total) * 100)
-                title = d.get('info_dict', {}).get('title', 'Unknown')
-                downloading_msg = f" {self.tr('downloading').format(title)} - {percentage}%"
-                
-                # Update the status message with percentage
-                def update_status():
-                    with self.download_lock:
-                        for i, msg in enumerate(self.downloading_songs):
-                            if title in msg and "" in msg:
-                                self.downloading_songs[i] = downloading_msg
-                                self.update_song_list()
-                                break
-                
-                self.ui_queue.put(update_status)
-        
-        elif d['status'] == 'finished':
-            title = None
-            if 'info_dict' in d and 'title' in d['info_dict']:
-                title = d['info_dict']['title']
-            else:
-                filename = d.get('filename', '').split('/')[-1]
-                title = filename
-            
+                lines = [album_msg]
+            if record.skipped:
+                lines.append(f"⚠️ {self.tr('skipped_tracks').format(record.skipped)}")
+            return lines
+
+        if record.state == QUEUED:
+            track_msg = self.tr("track").format(title)
+            if record.count:
+                track_msg = f"{track_msg} ({record.index + 1}/{record.count})"
+            return [track_msg]
+        if record.state == DOWNLOADING:
+            if record.percent is None:
+                return [self.tr("downloading").format(title)]
+            return [f" {self.tr('downloading').format(title)} - {record.percent}%"]
+        if record.state == CONVERTING:
             # Thêm hỗ trợ đa ngôn ngữ cho thông báo chuyển đổi
             converting_text = "Converting" if self.language == "en" else "Đang chuyển đổi"
-            converting_msg = f"⚙️ {converting_text}: {title}"
-            
-            def update_converting_status():
-                with self.download_lock:
-                    found = False
-                    for i, msg in enumerate(self.downloading_songs):
-                        if title in msg and "⏳" in msg:
-                            self.downloading_songs[i] = converting_msg
-                            found = True
-                            self.update_song_list()
-                    
-                    if not found:
-                        self.update_song_list()
-            
-            self.ui_queue.put(update_converting_status)
-
-    def is_soundcloud_url(self, url):
-        return 'soundcloud.com' in url.lower()
-
-    def get_info(self, url, cache=True):
-        """Get information about a URL with optional caching to prevent repeated API calls"""
-        if cache and url in self.album_info_cache:
-            return self.album_info_cache[url]
-        
-        try:
-            # Cấu hình cơ bản cho yt-dlp với tối ưu hóa tốc độ
-            ydl_opts = {
-                'quiet': True,
-                'format': 'bestaudio/best',
-                'socket_timeout': 10,  # Giảm timeout xuống
-                'extractor_args': {
-                    'soundcloud': {
-                        'client_id': 'iZIs9mchVcX5lhVRyQGGAYlNPVldzAoX'
-                    }
-                },
-                'no_warnings': True,
-                'extract_flat': True,  # Chỉ lấy thông tin cơ bản
-                'force_generic_extractor': False,  # Tắt generic extractor
-                'concurrent_fragment_downloads': 8,  # Tăng số lượng tải song song
-                'buffersize': 1024,  # Tăng buffer size
-            }
-            
-            if self.is_soundcloud_url(url):
-                # Thông báo đang tải thông tin album
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    # Lấy thông tin cơ bản trước
-                    info_dict = ydl.extract_info(url, download=False, process=False)
-                    
-                    # Kiểm tra xem có phải là playlist không
-                    if info_dict.get('_type') == 'playlist':
-                        # Nếu là playlist/album thì hiển thị loading_album
-                        self.update_song_list(self.tr("loading_album"))
-                    else:
-                        # Nếu là bài hát đơn thì hiển thị loading_track
-                        self.update_song_list(self.tr("loading_track"))
-                    
-                    if info_dict.get('_type') == 'playlist':
-                        entries = info_dict.get('entries', [])
-                        original_count = len(entries)
-                        available_entries = []
-                        
-                        # Cập nhật thông báo với tên album
-                        album_title = info_dict.get('title', 'Unknown Album')
-                        self.update_song_list(self.tr("checking_tracks").format(album_title))
-                        
-                        # Tạo và quản lý các luồng kiểm tra song song
-                        max_threads = 5  # Số luồng tối đa
-                        thread_semaphore = threading.Semaphore(max_threads)
-                        threads = []
-                        entries_lock = threading.Lock()
-                        
-                        def check_track(entry, index):
-                            try:
-                                with thread_semaphore:
-                                    # Cập nhật trạng thái kiểm tra track
-                                    self.update_song_list(
-                                        self.tr("checking_track").format(index + 1, original_count, album_title)
-                                    )
-                                    
-                                    track_url = entry.get('url', entry.get('webpage_url'))
-                                    if not track_url:
-                                        return
-                                    
-                                    # Tối ưu options cho kiểm tra track
-                                    track_opts = {
-                                        'quiet': True,
-                                        'format': 'bestaudio/best',
-                                        'socket_timeout': 10,
-                                        'no_warnings': True,
-                                        'extract_flat': False,
-                                        'force_generic_extractor': False,
-                                        'extractor_args': {
-                                            'soundcloud': {
-                                                'client_id': 'iZIs9mchVcX5lhVRyQGGAYlNPVldzAoX'
-                                            }
-                                        }
-                                    }
-                                    
-                                    with yt_dlp.YoutubeDL(track_opts) as track_ydl:
-                                        track_info = track_ydl.extract_info(track_url, download=False)
-                                        
-                                        if track_info and 'url' in track_info:
-                                            entry['title'] = track_info.get('title', entry.get('title', 'Unknown'))
-                                            entry['artist'] = track_info.get('artist', track_info.get('uploader', 'Unknown Artist'))
-                                            
-                                            with entries_lock:
-                                                available_entries.append(entry)
-                                                
-                            except Exception as e:
-                                print(f"Error checking track {index + 1}: {str(e)}")
-                        
-                        # Tạo và khởi chạy các luồng
-                        for i, entry in enumerate(entries):
-                            thread = threading.Thread(
-                                target=check_track,
-                                args=(entry, i),
-                                daemon=True
-                            )
-                            threads.append(thread)
-                            thread.start()
-                            
-                            # Đợi một chút giữa các lần tạo thread để tránh quá tải
-                            time.sleep(0.1)
-                        
-                        # Đợi tất cả các luồng hoàn thành
-                        for thread in threads:
-                            thread.join()
-                        
-                        # Cập nhật thông tin album
-                        info_dict['entries'] = available_entries
-                        info_dict['original_entries_count'] = original_count
-                        
-                        # Thông báo hoàn thành kiểm tra
-                        self.update_song_list(
-                            self.tr("found_tracks").format(len(available_entries), album_title)
-                        )
-                    
-                    else:
-                        # Đơn track, hiển thị loading track
-                        self.update_song_list(self.tr("loading_track"))
-            else:
-                # YouTube URL, hiển thị loading track
-                self.update_song_list(self.tr("loading_track"))
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info_dict = ydl.extract_info(url, download=False, process=False)
-            
-            # Cache kết quả
-            if cache:
-                self.album_info_cache[url] = info_dict
-            return info_dict
-                
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Error getting info: {error_msg}")
-            
-            if self.is_soundcloud_url(url):
-                return {
-                    'title': 'Unknown Album',
-                    '_type': 'playlist',
-                    'entries': [],
-                    'original_entries_count': 0
-                }
-            
-            return None
+            return [f"⚙️ {converting_text}: {title}"]
+        if record.state == FINISHED:
+            return [self.tr("downloaded").format(title)]
+        if record.state == SKIPPED:
+            return [self.tr("geo_failed").format(title)]
+        if record.state == ARCHIVED:
+            return [self.tr("already_downloaded").format(title)]
+        error_msg = self.tr("failed").format(record.url)
+        if record.error:
+            error_msg = f"{error_msg} ({record.error[:50]})"
+        return [error_msg]
+
+    def update_progress_title(self):
+        """Show the current number of parallel downloads per site next to the progress title"""
+        title = self.tr("progress")
+        if self.concurrency:
+            hosts = ", ".join(f"{host.capitalize()} {limit}" for host, limit in sorted(self.concurrency.items()))
+            title = f"{title} ({hosts} {self.tr('parallel_downloads')})"
+        self.progress_frame.config(text=title)
 
     def count_total_downloads(self, urls):
         """Count total downloads, but do this in a background thread"""
         # Initially set to number of URLs as minimum
         initial_count = len(urls)
-        self.ui_queue.put(lambda: self.update_total_downloads(initial_count))
-        
+
         # Start a thread to get the actual count
         threading.Thread(target=self._count_downloads_thread, args=(urls,), daemon=True).start()
-        
+
         return initial_count
-    
+
     def _count_downloads_thread(self, urls):
         """Background thread to count actual downloads including album tracks"""
-        total = 0
-        
-        for url in urls:
-            try:
-                if self.is_soundcloud_url(url):
-                    info = self.get_info(url)
-                    if info:
-                        if info.get('_type') == 'playlist':
-                            # Count each track in the playlist
-                            total += len(info.get('entries', []))
-                        else:
-                            # Single track
-                            total += 1
-                else:
-                    # YouTube URL counts as 1
-                    total += 1
-            except Exception:
-                # If we can't get info, still count it as 1
-                total += 1
-        
-        # Update the total count in the UI thread
-        self.ui_queue.put(lambda: self.update_total_downloads(max(total, len(urls))))
-
-    def update_total_downloads(self, count):
-        """Update the total download count and adjust progress bar"""
-        with self.download_lock:
-            old_total = self.total_downloads
-            self.total_downloads = count
-            
-            # Adjust progress bar based on new total
-            if old_total > 0 and self.completed_downloads > 0:
-                overall_percent = (self.completed_downloads * 100) / self.total_downloads
-                self.progress_var.set(int(overall_percent))
-
-    def sanitize_filename(self, filename):
-        return re.sub(r'[\\/*?:"<>|]', "_", filename)
+        self.engine.set_total_downloads(self.engine.count_total_downloads(urls))
 
     def update_song_list(self, message=None):
         # Use UI queue to update song list safely
-        def update():
-            self.song_list.config(state=tk.NORMAL)
-            self.song_list.delete(1.0, tk.END)
-            
-            if message:
-                self.song_list.insert(tk.END, message)
-                self.song_list.see("1.0")
-            elif self.downloading_songs:
-                # First, insert all songs
-                for i, song in enumerate(self.downloading_songs):
-                    self.song_list.insert(tk.END, f"{song}\n")
-                
-                # Then find the active download to scroll to
-                for i, song in enumerate(self.downloading_songs):
-                    # Check for active download or conversion
-                    if "⏳" in song or "⚙️" in song:
-                        self.song_list.see(f"{i+1}.0")
-                        break
-                    # Check for completed album
-                    elif "Album:" in song and "Tải xong" in song:
-                        self.song_list.see("1.0")
-                        break
-                else:
-                    # If no active downloads found, scroll to top
-                    self.song_list.see("1.0")
-            else:
-                self.song_list.insert(tk.END, self.tr("success"))
-                self.song_list.see("1.0")
-            
-            self.song_list.config(state=tk.DISABLED)
-        
-        self.ui_queue.put(update)
-
-    def add_downloading_song(self, song):
-        # Use UI queue to update downloading songs safely
-        def update():
-            with self.download_lock:  # Lock to protect downloading_songs
-                # Thêm bài hát vào danh sách
-                self.downloading_songs.append(song)
-                
-                # Cập nhật danh sách và cuộn đến bài hát vừa thêm
-                self.update_song_list()
-                
-                # Tìm vị trí của bài hát vừa thêm để cuộn đến
-                position = f"{len(self.downloading_songs)}.0"
-                self.song_list.config(state=tk.NORMAL)
-                self.song_list.see(position)
-                self.song_list.config(state=tk.DISABLED)
-        
-        self.ui_queue.put(update)
-
-    def update_download_status(self, old_text, new_text):
-        # Use UI queue to update download status safely
-        def update():
-            with self.download_lock:
-                if old_text in self.downloading_songs:
-                    index = self.downloading_songs.index(old_text)
-                    self.downloading_songs[index] = new_text
-                else:
-                    self.downloading_songs.append(new_text)
-                    index = len(self.downloading_songs) - 1
-                
-                # Update the list and scroll to the updated/new item
-                self.song_list.config(state=tk.NORMAL)
-                self.song_list.delete(1.0, tk.END)
-                
-                # Insert all songs
-                for song in self.downloading_songs:
-                    self.song_list.insert(tk.END, f"{song}\n")
-                
-                # Scroll to the updated/new item if it's an active download
-                if "⏳" in new_text or "⚙️" in new_text:
-                    self.song_list.see(f"{index+1}.0")
-                elif "Album:" in new_text and "Tải xong" in new_text:
-                    self.song_list.see("1.0")
-                
-                self.song_list.config(state=tk.DISABLED)
-        
-        self.ui_queue.put(update)
-
-    def download_soundcloud_album(self, url):
-        # Get album info (using cached version if available)
-        info = self.get_info(url)
-        if not info:
-            error_msg = self.tr("failed").format(url)
-            self.add_downloading_song(error_msg)
-            return False
-        
-        album_title = info.get('title', 'Unknown Album')
-        album_msg = self.tr("album").format(album_title)
-        self.add_downloading_song(album_msg)
-        
-        album_path = os.path.join(self.save_path, self.sanitize_filename(album_title))
-        os.makedirs(album_path, exist_ok=True)
-        
-        success = True
-        if info.get('_type') == 'playlist':
-            entries = info.get('entries', [])
-            
-            # Thêm thông báo nếu một số bài hát bị bỏ qua do geo-restriction
-            original_count = info.get('original_entries_count', 0)
-            if original_count > 0 and original_count > len(entries):
-                skipped_msg = f"⚠️ {self.tr('skipped_tracks').format(original_count - len(entries))}"
-                self.add_downloading_song(skipped_msg)
-            
-            # Show dialog with tracks for selection
-            if entries:
-                # Đảm bảo cờ skip_final_message được khởi tạo
-                if not hasattr(self, 'skip_final_message'):
-                    self.skip_final_message = False
-                    
-                tracks_to_download = self.show_album_track_selection(album_title, entries)
-                
-                # Kiểm tra nếu đã hủy (danh sách trống và was_canceled = True)
-                if not tracks_to_download and hasattr(self, 'was_canceled') and self.was_canceled:
-                    # Đánh dấu album là đã hủy trong danh sách
-                    cancel_msg = f"{album_msg} ({self.tr('canceled')})"
-                    self.update_download_status(album_msg, cancel_msg)
-                    
-                    # Đánh dấu download này đã hoàn thành
-                    with self.download_lock:
-                        self.completed_downloads += 1
-                    
-                    # Không cần hiển thị thông báo ở đây vì đã được hiển thị trong show_album_track_selection
-                    return False
-                elif not tracks_to_download:
-                    # Nếu không có bài hát nào được chọn nhưng không phải do hủy
-                    # (có thể người dùng bỏ chọn tất cả và nhấn xác nhận)
-                    cancel_msg = f"{album_msg} (0 {self.tr('selected_tracks')})"
-                    self.update_download_status(album_msg, cancel_msg)
-                    
-                    with self.download_lock:
-                        self.completed_downloads += 1
-                    
-                    return False
-                
-                # Cập nhật thông báo số lượng bài hát đã chọn
-                selected_msg = f"{album_msg} ({len(tracks_to_download)} {self.tr('selected_tracks')})"
-                self.update_download_status(album_msg, selected_msg)
-            else:
-                tracks_to_download = []
-                
-                # Nếu không có bài hát nào có thể tải do geo-restriction
-                if not entries:
-                    error_msg = f"{album_msg} ({self.tr('geo_restricted')})"
-                    self.update_download_status(album_msg, error_msg)
-                    
-                    with self.download_lock:
-                        self.completed_downloads += 1
-                        self.failed_downloads += 1
-                    
-                    return False
-            
-            # Create a list of tracks to download
-            track_downloads = []
-            for idx, entry in enumerate(entries):
-                # Skip tracks that were removed by user
-                track_url = entry.get('url', entry.get('webpage_url'))
-                if not track_url or idx not in tracks_to_download:
-                    continue
-                    
-                track_title = entry.get('title', 'Unknown Track')
-                track_msg = self.tr("track").format(track_title)
-                self.add_downloading_song(track_msg)
-                track_downloads.append((track_url, track_msg))
-            
-            # Lưu số lượng bài hát trong album để theo dõi tiến trình
-            album_tracks_count = len(track_downloads)
-            
-            # Điều chỉnh total_downloads để tính chính xác số lượng bài hát sẽ tải
-            with self.download_lock:
-                # Giảm đi 1 vì album chỉ tính là 1 download trong total_downloads ban đầu
-                self.total_downloads = self.total_downloads - 1 + album_tracks_count
-                # Cập nhật thanh tiến trình
-                self.ui_queue.put(lambda: self.progress_var.set(int(self.completed_downloads * 100 / self.total_downloads) if self.total_downloads > 0 else 0))
-                
-                # Tạo hoặc cập nhật từ điển theo dõi album
-                if not hasattr(self, 'albums_in_progress'):
-                    self.albums_in_progress = {}
-                self.albums_in_progress[album_title] = {
-                    'total': album_tracks_count,
-                    'completed': 0,
-                    'failed': 0
-                }
-            
-            # Tạo và quản lý các luồng tải song song
-            max_concurrent_downloads = 4  # Giới hạn số lượng tải đồng thời
-            download_threads = []
-            active_threads = []
-            download_semaphore = threading.Semaphore(max_concurrent_downloads)
-            
-            # Tạo hàm wrapper để giới hạn số lượng tải song song
-            def download_track_with_semaphore(idx, track_url, track_msg):
-                nonlocal success
-                # Cập nhật tiến trình
-                progress_msg = f"{track_msg} ({idx+1}/{album_tracks_count})"
-                self.update_download_status(track_msg, progress_msg)
-                
-                # Đợi cho đến khi có slot trống
-                download_semaphore.acquire()
-                try:
-                    # Tải bài hát
-                    track_success = self.download_track(track_url, album_path, progress_msg)
-                    
-                    # Cập nhật trạng thái album
-                    with self.download_lock:
-                        if album_title in self.albums_in_progress:
-                            if track_success:
-                                self.albums_in_progress[album_title]['completed'] += 1
-                            else:
-                                self.albums_in_progress[album_title]['failed'] += 1
-                                success = False
-                finally:
-                    # Luôn đảm bảo giải phóng semaphore ngay cả khi xảy ra lỗi
-                    download_semaphore.release()
-            
-            # Khởi tạo và khởi chạy các luồng tải
-            for idx, (track_url, track_msg) in enumerate(track_downloads):
-                thread = threading.Thread(
-                    target=download_track_with_semaphore, 
-                    args=(idx, track_url, track_msg),
-                    daemon=True
-                )
-                download_threads.append(thread)
-                thread.start()
-                active_threads.append(thread)
-                
-                # Đợi để tránh tạo quá nhiều request cùng lúc
-                time.sleep(0.5)
-            
-            # Đợi tất cả các luồng hoàn thành
-            for thread in download_threads:
-                thread.join()
-            
-            # Album tải xong, cập nhật trạng thái
-            with self.download_lock:
-                if album_title in self.albums_in_progress:
-                    album_stats = self.albums_in_progress[album_title]
-                    total_processed = album_stats['completed'] + album_stats['failed']
-                    
-                    # Xóa khỏi danh sách theo dõi
-                    del self.albums_in_progress[album_title]
-                    
-                    if self.language == 'vi':
-                        album_summary = f"Album: {album_title} - Tải xong {album_stats['completed']}/{album_stats['total']} bài"
-                    else:  # 'en' hoặc mặc định là tiếng Anh
-                        album_summary = f"Album: {album_title} - Downloaded {album_stats['completed']}/{album_stats['total']} tracks"
-                    
-                    self.update_download_status(album_msg, album_summary)
-                    
-                    # Kiểm tra nếu tất cả download đã hoàn thành
-                    if self.completed_downloads >= self.total_downloads and not self.albums_in_progress:
-                        self.progress_var.set(100)
-        
-        return success
-
-    def download_track(self, url, output_path=None, track_msg=None):
-        try:
-            info = self.get_info(url, cache=False)
-            if not info:
-                error_msg = self.tr("geo_failed").format(url) if "geo restriction" in str(url) else self.tr("failed").format(url)
-                self.add_downloading_song(error_msg)
-                
-                with self.download_lock:
-                    self.completed_downloads += 1
-                
-                return False
-            
-            title = info.get('title', 'Unknown Track')
-            downloading_msg = self.tr("downloading").format(title)
-            
-            if not track_msg:
-                self.add_downloading_song(downloading_msg)
-            else:
-                self.update_download_status(track_msg, downloading_msg)
-            
-            sanitized_title = self.sanitize_filename(title)
-            
-            # Tạo tên file với đường dẫn đầy đủ
-            if output_path:
-                base_path = output_path
-            else:
-                base_path = self.save_path
-            
-            # Chọn định dạng audio
-            audio_format = 'flac' if self.use_flac.get() else 'mp3'
-            
-            # Tạo tên file duy nhất
-            counter = 1
-            base_filename = os.path.join(base_path, sanitized_title)
-            final_filename = f"{base_filename}.{audio_format}"
-            
-            while os.path.exists(final_filename):
-                final_filename = f"{base_filename} ({counter}).{audio_format}"
-                counter += 1
-            
-            # Define metadata
-            artist = info.get('artist', info.get('uploader', 'Unknown Artist'))
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            
-            # Tạo postprocessor_args như một list đơn
-            postprocessor_args = []
-            
-            # Thêm audio arguments nếu là MP3
-            if not self.use_flac.get():
-                postprocessor_args.extend([
-                    '-b:a', '320k',
-                    '-ar', '48000',
-                    '-ac', '2'
-                ])
-            
-            # Thêm metadata arguments
-            postprocessor_args.extend([
-                '-metadata', f'title={title}',
-                '-metadata', f'artist={artist}',
-                '-metadata', f'album=Downloaded from YTMP3',
-                '-metadata', f'date={current_date}',
-                '-metadata', f'comment=Downloaded on {current_date}',
-                '-metadata', f'source={url}',  # Thêm URL gốc vào trường source
-                '-metadata', f'purl={url}',    # Thêm URL gốc vào trường purl (purchase URL)
-                '-metadata', f'copyright=Source URL: {url}'  # Hiển thị rõ ràng hơn trong trường copyright
-            ])
-
-            # Cấu hình yt-dlp với tên file duy nhất
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': os.path.splitext(final_filename)[0],
-                'progress_hooks': [self.progress_hook],
-                'postprocessor_hooks': [self.postprocessor_hook],
-                'socket_timeout': 180,
-                'nocheckcertificate': True,
-                'ffmpeg_location': self.ffmpeg_path,
-                'cachedir': False,
-                'writethumbnail': True,
-                'skip_download_archive': True,
-                'noplaylist': False,
-                'extract_flat': False,
-                'geo_bypass': True,
-                'geo_bypass_country': 'US',
-                'no_warnings': True,
-                'retries': 5,
-                'fragment_retries': 5,
-                'extractor_retries': 5,
-                'skip_unavailable_fragments': True,
-                # Thêm các tùy chọn mới để fix lỗi 403
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                    'Sec-Fetch-Mode': 'navigate',
-                },
-                # Cache optimization
-                'rm_cachedir': True,
-                'postprocessors': [
-                    {
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': audio_format,
-                        'preferredquality': 'best',
-                    },
-                    {
-                        'key': 'EmbedThumbnail',
-                    },
-                    {
-                        'key': 'FFmpegMetadata',
-                        'add_metadata': True,
-                    },
-                ],
-                'add_metadata': True,
-                'postprocessor_args': postprocessor_args  # Sử dụng list đơn
-            }
-            
-            # Download with unique filename
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            
-            return True
-        
-        except Exception as e:
-            error_msg = f"{self.tr('failed').format(url)} ({str(e)[:50]})"
-            self.update_download_status(downloading_msg if 'downloading_msg' in locals() else track_msg, error_msg)
-            
-            with self.download_lock:
-                self.completed_downloads += 1
-                self.failed_downloads += 1
-            
-            print(f"Download error: {str(e)}")
-            return False
-
-    def postprocessor_hook(self, d):
-        """Hook to track post-processing progress"""
-        if d['status'] == 'finished':
-            if 'info_dict' in d:
-                info_dict = d['info_dict']
-                title = info_dict.get('title', '')
-                
-                # Update UI to show processing status
-                def update_processing_status():
-                    with self.download_lock:
-                        if self.language == 'en':
-                            processing_msg = f"⚙️ Converting: {title}"
-                            processing_text = "⚙️ Converting"
-                        else:  # Vietnamese
-                            processing_msg = f"⚙️ Đang chuyển đổi: {title}"
-                            processing_text = "⚙️ Đang chuyển đổi"
-
-                        for i, msg in enumerate(self.downloading_songs):
-                            if title in msg and (processing_text in msg or 
-                                               "⚙️ Converting" in msg or 
-                                               "⚙️ Đang chuyển đổi" in msg or
-                                               "⚙️ Đang xử lý" in msg):
-                                self.downloading_songs[i] = processing_msg
-                                break
-                        self.update_song_list()
-                
-                self.ui_queue.put(update_processing_status)
-            
-            # Don't increment completed_downloads here, wait until the file is fully processed
-            
-            # Delay success message for UI update until after FFmpeg processing is complete
-            threading.Timer(0.5, lambda: self.mark_download_complete(d)).start()
-
-    def mark_download_complete(self, d):
-        """Mark a download as complete after processing is finished"""
-        title = d.get('info_dict', {}).get('title', 'Unknown')
-        
-        # Now mark as completed
-        with self.download_lock:
-            if self.total_downloads > 0:
-                self.completed_downloads += 1
-        
-        success_msg = self.tr("downloaded").format(title)
-        
-        def update_final_status():
-            with self.download_lock:
-                for i, msg in enumerate(self.downloading_songs):
-                    # Kiểm tra cả phiên bản tiếng Anh và tiếng Việt của thông báo chuyển đổi
-                    if title in msg and ("⚙️ Converting" in msg or "⚙️ Đang xử lý" in msg or 
-                                       "⚙️ Converting" in msg or "⚙️ Đang chuyển đổi" in msg):
-                        self.downloading_songs[i] = success_msg
-                        break
-                self.update_song_list()
+        self.ui_queue.put(lambda: self.show_song_list(message))
+
+    def show_song_list(self, message=None):
+        """Redraw the whole progress list: a status message, or every job row (runs on the Tk thread)"""
+        self.song_list.config(state=tk.NORMAL)
+        self.song_list.delete(1.0, tk.END)
+        self.showing_jobs = False
+        self.followed_job = None
+        
+        records = self.engine.jobs.records()
+        if message:
+            self.song_list.insert(tk.END, message)
+            self.song_list.see("1.0")
+        elif records:
+            # Mỗi job có một tag riêng để sau này chỉ cần thay đúng các dòng của nó
+            for record in records:
+                self.song_list.insert(tk.END, self.job_text(record), f"job{record.job_id}")
+                if self.followed_job is None and record.active:
+                    self.followed_job = record.job_id
+            self.showing_jobs = True
+            self.song_list.see(f"job{self.followed_job}.first" if self.followed_job else "1.0")
+        else:
+            self.song_list.insert(tk.END, self.tr("success"))
+            self.song_list.see("1.0")
         
-        self.ui_queue.put(update_final_status)
+        self.song_list.config(state=tk.DISABLED)
 
-    def download_video(self, url):
-        try:
-            if self.is_soundcloud_url(url):
-                info = self.get_info(url)
-                if info and info.get('_type') == 'playlist':
-                    return self.download_soundcloud_album(url)
-                else:
-                    return self.download_track(url)
-            
-            # YouTube download logic
-            info = self.get_info(url, cache=False)
-            if not info:
-                error_msg = self.tr("failed").format(url)
-                self.add_downloading_song(error_msg)
-                
-                with self.download_lock:
-                    self.completed_downloads += 1
-                
-                return False
-            
-            title = info.get('title', 'Unknown')
-            artist = info.get('artist', info.get('uploader', 'Unknown Artist'))
-            downloading_msg = self.tr("downloading").format(title)
-            self.add_downloading_song(downloading_msg)
+    def job_text(self, record):
+        return "".join(f"{line}\n" for line in self.job_lines(record))
 
-            sanitized_title = self.sanitize_filename(title)
-            
-            # Tạo tên file duy nhất
-            counter = 1
-            base_filename = os.path.join(self.save_path, sanitized_title)
-            audio_format = 'flac' if self.use_flac.get() else 'mp3'
-            final_filename = f"{base_filename}.{audio_format}"
-            
-            # Kiểm tra và thêm số nếu file đã tồn tại
-            while os.path.exists(final_filename):
-                final_filename = f"{base_filename} ({counter}).{audio_format}"
-                counter += 1
-            
-            # Sử dụng tên file không có phần mở rộng cho yt-dlp
-            filename = os.path.splitext(final_filename)[0]
+    def render_job(self, job_id):
+        """Replace only the lines of one job in the progress list (runs on the Tk thread)"""
+        record = self.engine.jobs.get(job_id)
+        if record is None:
+            return
+        if not self.showing_jobs:
+            # Danh sách đang hiển thị thông báo trạng thái, vẽ lại toàn bộ một lần
+            self.show_song_list()
+            return
 
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            
-            # Choose audio format based on user selection
-            audio_format = 'flac' if self.use_flac.get() else 'mp3'
-            audio_quality = 'best' if self.use_flac.get() else '320'
-            
-            # Use best audio format
-            format_selection = 'bestaudio'
-            
-            # Simplified options focusing on basic functionality
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': os.path.splitext(filename)[0],
-                'progress_hooks': [self.progress_hook],
-                'postprocessor_hooks': [self.postprocessor_hook],
-                'socket_timeout': 60,
-                'nocheckcertificate': True,
-                'ffmpeg_location': self.ffmpeg_path,
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                    'Sec-Fetch-Mode': 'navigate',
-                },
-                # Cache optimization
-                'rm_cachedir': True,
-                'cachedir': False,  # Disable cache to avoid disk I/O
-                'writethumbnail': True,
-                'postprocessors': [
-                    {
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': audio_format,
-                        'preferredquality': audio_quality,
-                    },
-                    {
-                        'key': 'EmbedThumbnail',
-                    },
-                    {
-                        'key': 'FFmpegMetadata',
-                        'add_metadata': True,
-                    },
-                ],
-                # Add custom metadata fields
-                'add_metadata': True,
-                # Correctly format the postprocessor_args as a flat list
-                'postprocessor_args': [
-                    '-metadata', f'title={title}',
-                    '-metadata', f'artist={artist}',
-                    '-metadata', f'album=Downloaded from YTMP3',
-                    '-metadata', f'date={current_date}',
-                    '-metadata', f'comment=Downloaded on {current_date}',
-                    '-metadata', f'comment=Source: {url}',
-                # Alternative fields for source URL to ensure compatibility with different players
-                    '-metadata', f'Where from={url}',
-                    '-metadata', f'copyright=Source: {url}',
-                ]
-            }
-            
-            # Add MP3-specific options if not using FLAC
-            if not self.use_flac.get():
-                ydl_opts['postprocessor_args'].extend([
-                    '-b:a', '320k',  # Constant bitrate of 320kbps
-                    '-ar', '48000',  # 48kHz sample rate
-                    '-ac', '2'       # Stereo audio (2 channels)
-                ])
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            
-            return True
-        except Exception as e:
-            error_msg = f"{self.tr('failed').format(url)} ({str(e)[:50]})"
-            self.update_download_status(downloading_msg if 'downloading_msg' in locals() else url, error_msg)
-            
-            with self.download_lock:
-                self.completed_downloads += 1
-                self.failed_downloads += 1
-            
-            print(f"Download error: {str(e)}")
-            return False
+        tag = f"job{job_id}"
+        self.song_list.config(state=tk.NORMAL)
+        ranges = self.song_list.tag_ranges(tag)
+        if ranges:
+            start = self.song_list.index(ranges[0])
+            self.song_list.delete(ranges[0], ranges[1])
+            self.song_list.insert(start, self.job_text(record), tag)
+        else:
+            self.song_list.insert(tk.END, self.job_text(record), tag)
+        self.song_list.config(state=tk.DISABLED)
+
+        # Tự cuộn theo một job đang tải; khi nó xong thì chuyển sang job tiếp theo đang tải
+        followed = self.engine.jobs.get(self.followed_job) if self.followed_job is not None else None
+        if record.active and (followed is None or not followed.active):
+            self.followed_job = job_id
+            self.song_list.see(f"{tag}.first")
+
+    def select_album_tracks(self, album_title, entries, checks=None):
+        """Track selection callback for the engine, None means the user canceled"""
+        tracks_to_download = self.show_album_track_selection(album_title, entries, checks)
+        if not tracks_to_download and self.was_canceled:
+            return None
+        return tracks_to_download
 
     def download_all_videos(self):
         """Tải xuống tất cả video từ URLs được nhập"""
@@ -1766,7 +1063,7 @@ class MP3Converter:
             return
         
         # Validate URLs - quá trình này đã bao gồm việc chuẩn hóa URL
-        valid_urls, invalid_urls = self.validate_urls(urls)
+        valid_urls, invalid_urls = validate_urls(urls)
         
         # If there are invalid URLs, show an error message and stop animation
         if invalid_urls:
@@ -1804,13 +1101,11 @@ class MP3Converter:
                 message
             )
 
-        # Clear any cached album info
-        self.album_info_cache = {}
-        
-        # Reset progress counters
+        # Reset progress counters and cached album info
+        self.engine.save_path = self.save_path
+        self.engine.audio_format = self.selected_audio_format()
+        self.engine.reset_batch()
         self.progress_var.set(0)
-        self.downloading_songs = []
-        self.failed_downloads = 0
         self.update_song_list(self.tr("starting"))
         
         # Disable download button and change its appearance
@@ -1819,169 +1114,84 @@ class MP3Converter:
         self.download_button._draw()
         
         # Set initial count and start background counting
-        self.total_downloads = self.count_total_downloads(valid_urls)
-        self.completed_downloads = 0
+        self.engine.total_downloads = self.count_total_downloads(valid_urls)
+
+        # Queue every URL; the engine's worker pool limits how many run at once.
+        # The batch is finalized as soon as the last URL (with all its album tracks) resolves.
+        if self.profile_next_batch.get():
+            self.profile_next_batch.set(False)
+            self.engine.start_profiling()
+        self.engine.start_batch(valid_urls, on_done=lambda: self.ui_queue.put(self.finalize_batch))
+
+    def offer_resume(self):
+        """Offer to continue the downloads an earlier session left unfinished (Tk thread)"""
+        unfinished = self.engine.unfinished_jobs()
+        if not unfinished:
+            return
+        if not messagebox.askyesno(self.tr("resume_title"), self.tr("resume_prompt").format(len(unfinished))):
+            self.engine.discard_unfinished()
+            return
 
-        # Start downloads in separate threads
-        for url in valid_urls:
-            t = threading.Thread(target=self.download_video, args=(url,), daemon=True)
-            t.start()
+        self.engine.audio_format = self.selected_audio_format()
+        self.engine.reset_batch(len(unfinished))
+        self.progress_var.set(0)
+        self.update_song_list(self.tr("starting"))
 
-        # Create a separate thread to monitor download progress and completion
-        threading.Thread(target=self.monitor_downloads, args=(valid_urls,), daemon=True).start()
+        self.download_button.configure(state='disabled')
+        self.download_button.current_color = self.download_button.disabled_color
+        self.download_button._draw()
 
-    def monitor_downloads(self, urls):
-        """Monitor download progress and update UI when complete"""
-        check_interval = 0.5  # seconds
-        max_checks = 14400  # 2 hours (2*60*60/0.5)
-        checks = 0
-        
-        start_time = datetime.now()
-        max_download_time = 60 * 120  # 2 hours maximum
-        
-        completion_detected = False
-        last_completed = 0
-        no_progress_count = 0
-        
-        # Kiểm tra ngay lập tức xem có nên bỏ qua không
+        self.engine.resume_batch(on_done=lambda: self.ui_queue.put(self.finalize_batch))
+
+    def finalize_batch(self):
+        """Re-enable the download button and show the summary of the finished batch (Tk thread)"""
+        profile_dir = self.engine.stop_profiling()
+        if profile_dir:
+            print(f"Profile written to {profile_dir}")
+            messagebox.showinfo(self.tr("info_title"), self.tr("profile_saved").format(profile_dir))
+
+        # Kiểm tra cờ skip_final_message
         if hasattr(self, 'skip_final_message') and self.skip_final_message:
-            # Đặt lại cờ và thoát khỏi vòng lặp giám sát
+            # Đặt lại cờ
             self.skip_final_message = False
             return
         
-        while checks < max_checks:
-            threading.Event().wait(check_interval)
-            checks += 1
-            
-            # Kiểm tra trong mỗi vòng lặp
-            if hasattr(self, 'skip_final_message') and self.skip_final_message:
-                # Đặt lại cờ và thoát khỏi vòng lặp giám sát
-                self.skip_final_message = False
-                return
-            
-            elapsed_seconds = (datetime.now() - start_time).total_seconds()
-            if elapsed_seconds > max_download_time:
-                print(f"Download timed out after {max_download_time/60} minutes")
-                break
-            
-            with self.download_lock:
-                # Check all albums for completion
-                all_albums_complete = True
-                if hasattr(self, 'albums_in_progress') and self.albums_in_progress:
-                    for album_name, stats in self.albums_in_progress.items():
-                        total_processed = stats['completed'] + stats['failed']
-                        print(f"Checking album {album_name}: {stats['completed']}/{stats['total']} completed, {stats['failed']} failed")
-                        if total_processed < stats['total']:
-                            all_albums_complete = False
-                            break
-                
-                # Check for any active downloads or conversions
-                tracks_in_progress = False
-                for status in self.downloading_songs:
-                    if any(indicator in status for indicator in ["⚙️ Converting", "⏳", "Đang tải"]):
-                        tracks_in_progress = True
-                        break
-                
-                # Update progress tracking
-                if last_completed == self.completed_downloads:
-                    no_progress_count += 1
-                else:
-                    no_progress_count = 0
-                    last_completed = self.completed_downloads
-                
-                # Only consider downloads complete when:
-                # 1. All regular downloads are complete
-                # 2. All albums are complete
-                # 3. No active conversions or downloads
-                # 4. At least one download has completed
-                download_complete = (
-                    (self.completed_downloads >= self.total_downloads) and
-                    all_albums_complete and 
-                    (not tracks_in_progress) and
-                    (self.completed_downloads > 0)
-                )
-                
-                # Consider downloads stalled if no progress for 30 seconds
-                stalled_downloads = (
-                    no_progress_count > 60 and 
-                    self.completed_downloads > 0 and 
-                    not tracks_in_progress and
-                    all_albums_complete  # Only consider stalled if albums are complete
-                )
-                
-                if download_complete or stalled_downloads:
-                    completion_detected = True
-                    break
-            
-            # Debug output
-            if hasattr(self, 'albums_in_progress') and self.albums_in_progress:
-                print(f"Still waiting: completed={self.completed_downloads}, total={self.total_downloads}, albums_complete={all_albums_complete}, tracks_in_progress={tracks_in_progress}")
-
-        print("Download monitor ended, scheduling finalize")
+        # Stop the download button animation
+        self.download_button.stop_animation()
         
-        # All downloads complete or stopped
-        def finalize():
-            print("Finalizing download process")
-            
-            # Kiểm tra cờ skip_final_message
-            if hasattr(self, 'skip_final_message') and self.skip_final_message:
-                # Đặt lại cờ
-                self.skip_final_message = False
-                return
-            
-            # Stop the download button animation
-            self.download_button.stop_animation()
-            
-            # Re-enable download button and restore its appearance
-            self.download_button.configure(state='normal')
-            self.download_button.current_color = self.download_button.color
-            self.download_button._draw()
-            
-            try:
-                # Show appropriate message
-                if checks >= max_checks:
+        # Re-enable download button and restore its appearance
+        self.download_button.configure(state='normal')
+        self.download_button.current_color = self.download_button.color
+        self.download_button._draw()
+        
+        try:
+            # Show appropriate message
+            if self.engine.failed_downloads > 0:
+                if self.engine.failed_downloads == self.engine.total_downloads:
                     messagebox.showinfo(
-                        self.tr("success_title"),
-                        f"Đã hết thời gian chờ sau 2 giờ. Một số tệp có thể chưa tải xong."
+                        self.tr("error_title"),
+                        f"Tất cả {self.engine.failed_downloads} tệp đều tải thất bại!"
                     )
-                elif self.failed_downloads > 0:
-                    if self.failed_downloads == self.total_downloads:
-                        messagebox.showinfo(
-                            self.tr("error_title"),
-                            f"Tất cả {self.failed_downloads} tệp đều tải thất bại!"
-                        )
-                    else:
-                        messagebox.showinfo(
-                            self.tr("success_title"),
-                            f"Đã tải {self.completed_downloads - self.failed_downloads} thành công và {self.failed_downloads} thất bại trong tổng số {self.total_downloads} tệp!"
-                        )
                 else:
                     messagebox.showinfo(
                         self.tr("success_title"),
-                        self.tr("success")
+                        f"Đã tải {self.engine.completed_downloads - self.engine.failed_downloads} thành công và {self.engine.failed_downloads} thất bại trong tổng số {self.engine.total_downloads} tệp!"
                     )
-                
-                print("MessageBox showed successfully")
-                
-                # Cập nhật giao diện
-                self.url_text.delete(1.0, tk.END)
-                self.update_song_list(self.tr("ready"))
-                
-                # Reset counters
-                self.total_downloads = 0
-                self.completed_downloads = 0
-                self.failed_downloads = 0
-                
-                # Clear the cache to free memory
-                self.album_info_cache = {}
-                if hasattr(self, 'albums_in_progress'):
-                    self.albums_in_progress = {}
+            else:
+                messagebox.showinfo(
+                    self.tr("success_title"),
+                    self.tr("success")
+                )
             
-            except Exception as e:
-                print(f"Error showing message box: {str(e)}")
+            # Cập nhật giao diện
+            self.url_text.delete(1.0, tk.END)
+            self.update_song_list(self.tr("ready"))
+            
+            # Reset counters and clear the cache to free memory
+            self.engine.reset_batch()
         
-        self.ui_queue.put(finalize)
-        print("Finalize function put into queue correctly")
+        except Exception as e:
+            print(f"Error showing message box: {str(e)}")
 
     def show_help(self):
         help_text = {
@@ -2078,11 +1288,22 @@ Xử lý lỗi:
         self.context_menu.add_separator()
         self.context_menu.add_command(label=self.tr("select_all"), command=lambda: self.handle_menu_action("select_all"))
 
+        # Menu ẩn (Shift + chuột phải): giống menu trên, thêm công tắc đo hiệu năng
+        self.debug_context_menu = tk.Menu(self.root, tearoff=0)
+        self.debug_context_menu.add_command(label=self.tr("paste"), command=lambda: self.handle_menu_action("paste"))
+        self.debug_context_menu.add_command(label=self.tr("cut"), command=lambda: self.handle_menu_action("cut"))
+        self.debug_context_menu.add_command(label=self.tr("copy"), command=lambda: self.handle_menu_action("copy"))
+        self.debug_context_menu.add_separator()
+        self.debug_context_menu.add_command(label=self.tr("select_all"), command=lambda: self.handle_menu_action("select_all"))
+        self.debug_context_menu.add_separator()
+        self.debug_context_menu.add_checkbutton(label=self.tr("profile_batch"), variable=self.profile_next_batch)
+
     def show_context_menu(self, event):
+        menu = self.debug_context_menu if event.state & 0x0001 else self.context_menu  # Shift held
         try:
-            self.context_menu.tk_popup(event.x_root, event.y_root)
+            menu.tk_popup(event.x_root, event.y_root)
         finally:
-            self.context_menu.grab_release()
+            menu.grab_release()
 
     def handle_menu_action(self, action):
         try:
@@ -2150,13 +1371,14 @@ Xử lý lỗi:
             self.button_container.configure(bg=self.current_theme["bg"])
         
         # Update format checkbox
-        self.format_checkbox.configure(
-            bg=self.current_theme["bg"],
-            fg=self.current_theme["fg"],
-            selectcolor=self.current_theme["entry_bg"],
-            activebackground=self.current_theme["bg"],
-            activeforeground=self.current_theme["fg"]
-        )
+        for checkbox in (self.format_checkbox, self.original_checkbox):
+            checkbox.configure(
+                bg=self.current_theme["bg"],
+                fg=self.current_theme["fg"],
+                selectcolor=self.current_theme["entry_bg"],
+                activebackground=self.current_theme["bg"],
+                activeforeground=self.current_theme["fg"]
+            )
         self.format_frame.configure(bg=self.current_theme["bg"])
         
         # Update all frames' backgrounds
@@ -2354,13 +1576,28 @@ Xử lý lỗi:
             "progress_color": button_color
         }
 
+    def selected_audio_format(self):
+        if self.use_original.get():
+            return 'original'
+        return 'flac' if self.use_flac.get() else 'mp3'
+
+    def on_format_toggled(self, var):
+        """FLAC and original audio exclude each other; unchecking both means MP3"""
+        if var.get():
+            for other in (self.use_flac, self.use_original):
+                if other is not var:
+                    other.set(False)
+        self.update_download_button_text()
+
     def update_download_button_text(self):
         """Update download button text based on selected format"""
         if not hasattr(self.download_button, 'is_animating') or not self.download_button.is_animating:
-            if self.use_flac.get():
-                self.download_button.configure(text=self.tr("download_flac"))
-            else:
-                self.download_button.configure(text=self.tr("download"))
+            button_text = {
+                'mp3': "download",
+                'flac': "download_flac",
+                'original': "download_original",
+            }[self.selected_audio_format()]
+            self.download_button.configure(text=self.tr(button_text))
 
     # Thêm phương thức mới để hiển thị và ẩn nút ngôn ngữ
     def _show_language_button(self, event):
@@ -2447,8 +1684,12 @@ Xử lý lỗi:
         # Đặt timer ID về None
         self.hide_timer_id = None
 
-    def show_album_track_selection(self, album_title, entries):
-        """Display dialog to select which tracks to download from the album"""
+    def show_album_track_selection(self, album_title, entries, checks=None):
+        """Display dialog to select which tracks to download from the album.
+
+        ``checks`` are the engine's background availability checks, one Future
+        per entry; rows are updated as they resolve.
+        """
         # Create and configure the dialog window
         track_dialog = tk.Toplevel(self.root)
         track_dialog.title(f"{album_title} - {self.tr('track_selection_title')}")
@@ -2476,7 +1717,18 @@ Xử lý lỗi:
             bg=self.current_theme["bg"],
             fg=self.current_theme["fg"]
         )
-        heading.pack(pady=(0, 15), anchor=tk.W)
+        heading.pack(pady=(0, 5 if checks else 15), anchor=tk.W)
+
+        # Trạng thái kiểm tra bài hát, cập nhật dần khi từng bài được kiểm tra xong
+        check_label = tk.Label(
+            frame,
+            text=self.tr('checking_track').format(0, len(entries), album_title) if checks else "",
+            font=self.normal_font,
+            bg=self.current_theme["bg"],
+            fg=self.current_theme["fg"]
+        )
+        if checks:
+            check_label.pack(pady=(0, 10), anchor=tk.W)
         
         # Create scrollable frame for tracks
         track_container = tk.Frame(frame, bg=self.current_theme["bg"])
@@ -2496,11 +1748,14 @@ Xử lý lỗi:
         
         # Track selection vars and buttons
         track_vars = {}
+        track_checks = {}
+        unavailable = set()
         
         # Select/Deselect all functionality
         def select_all():
-            for var in track_vars.values():
-                var.set(True)
+            for idx, var in track_vars.items():
+                if idx not in unavailable:
+                    var.set(True)
         
         def deselect_all():
             for var in track_vars.values():
@@ -2560,6 +1815,9 @@ Xử lý lỗi:
                 font=self.normal_font
             )
             check.pack(side=tk.LEFT, padx=(5, 0), anchor=tk.W)
+            track_checks[idx] = check
+            if checks and not checks[idx].done():
+                check.config(text=f"⏳ {idx+1}. {track_title}")
             
             # Create remove button
             def create_remove_command(idx_to_remove):
@@ -2585,6 +1843,35 @@ Xử lý lỗi:
             canvas.configure(scrollregion=canvas.bbox("all"))
         
         inner_frame.bind("<Configure>", update_scrollregion)
+
+        checked = [0]
+
+        def show_check_result(idx, available):
+            # Chạy trên luồng Tk qua ui_queue; hộp thoại có thể đã đóng
+            if not track_dialog.winfo_exists():
+                return
+            title = entries[idx].get('title', 'Unknown Track')
+            if available:
+                track_checks[idx].config(text=f"{idx+1}. {title}")
+            else:
+                unavailable.add(idx)
+                track_vars[idx].set(False)
+                track_checks[idx].config(text=f"{idx+1}. {self.tr('geo_failed').format(title)}", state=tk.DISABLED)
+            checked[0] += 1
+            if checked[0] < len(entries):
+                check_label.config(text=self.tr('checking_track').format(checked[0], len(entries), album_title))
+            else:
+                check_label.config(text=self.tr('found_tracks').format(len(entries) - len(unavailable), album_title))
+
+        def on_checked(idx):
+            def done(future):
+                if not future.cancelled():
+                    available = future.result() is not None
+                    self.ui_queue.put(lambda: show_check_result(idx, available))
+            return done
+
+        for idx, future in enumerate(checks or []):
+            future.add_done_callback(on_checked(idx))
         
         # Make canvas responsive to mouse wheel
         def on_mousewheel(event):
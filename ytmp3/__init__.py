@@ -0,0 +1,5 @@
+"""YTMP3 - YouTube & SoundCloud to MP3 converter"""
+from .engine import AUDIO_FORMATS, DownloadEngine
+from .urls import normalize_url, validate_urls
+
+__all__ = ['AUDIO_FORMATS', 'DownloadEngine', 'normalize_url', 'validate_urls']
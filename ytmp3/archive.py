@@ -0,0 +1,193 @@
+"""Archive of downloaded tracks keyed by extractor and ID, bootstrapped from the tags of the library"""
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from .urls import canonical_url, is_soundcloud_url
+
+try:
+    import mutagen
+except ImportError:  # tags are read with ffprobe instead
+    mutagen = None
+
+LIBRARY_EXTS = ('mp3', 'flac', 'opus', 'm4a', 'ogg')
+SCAN_WORKERS = 8
+FFPROBE_TIMEOUT = 30
+
+# URL nguồn được ghi vào các thẻ source, purl, comment, copyright... khi tải
+URL_RE = re.compile(r'https?://[^\s\'"<>]+')
+
+
+def archive_key(url):
+    """'<extractor> <id>' of a track URL, worked out without any network request; None if it can't be.
+
+    YouTube keys use the video ID, like yt-dlp's --download-archive. The
+    numeric ID of a SoundCloud track needs an extraction, so SoundCloud is
+    keyed by the permalink path (user/track) instead. Albums and playlists
+    have no key: their tracks are looked up one by one.
+    """
+    url = canonical_url(url)
+    parts = urlsplit(url)
+    if is_soundcloud_url(url):
+        path = parts.path.strip('/')
+        if path.count('/') != 1 or '/sets/' in f'/{path}/':
+            return None
+        return f'soundcloud {path.lower()}'
+    if 'youtube.com' in parts.netloc:
+        video_id = parse_qs(parts.query).get('v')
+        if video_id:
+            return f'youtube {video_id[0]}'
+    return None
+
+
+def find_ffprobe(ffmpeg_path=None):
+    """ffprobe next to ``ffmpeg_path`` (the bundled one), else the one on PATH"""
+    if ffmpeg_path:
+        name = 'ffprobe.exe' if ffmpeg_path.lower().endswith('.exe') else 'ffprobe'
+        candidate = os.path.join(os.path.dirname(ffmpeg_path), name)
+        if os.path.isfile(candidate):
+            return candidate
+    return shutil.which('ffprobe')
+
+
+def read_tag_values(path, ffprobe=None):
+    """Every tag value of an audio file as text (mutagen if installed, else ffprobe)"""
+    if mutagen is not None:
+        try:
+            audio = mutagen.File(path)
+        except Exception:
+            return []
+        if audio is None or not audio.tags:
+            return []
+        return [str(value) for value in audio.tags.values()]
+
+    try:
+        result = subprocess.run(
+            [ffprobe, '-v', 'quiet', '-print_format', 'json', '-show_entries', 'format_tags:stream_tags', path],
+            capture_output=True, timeout=FFPROBE_TIMEOUT, check=True)
+        probe = json.loads(result.stdout or b'{}')
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return []
+    tags = [probe.get('format', {}).get('tags', {})]
+    tags += [stream.get('tags', {}) for stream in probe.get('streams', [])]
+    return [str(value) for group in tags for value in group.values()]
+
+
+def source_keys(path, ffprobe=None):
+    """Archive keys of the source URLs found in the tags of ``path``"""
+    keys = set()
+    for url in URL_RE.findall('\n'.join(read_tag_values(path, ffprobe))):
+        key = archive_key(url.rstrip('.,;)'))
+        if key:
+            keys.add(key)
+    return sorted(keys)
+
+
+class DownloadArchive:
+    """SQLite archive: key -> file it was downloaded to, plus the tag scan cache of the library.
+
+    ``lookup`` only answers for files that still exist, so deleting a track
+    from the library makes it downloadable again. ``scan`` reads the tags of
+    the files that are new or changed (size, mtime) since the last scan, in
+    parallel, and files every source URL it finds.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS archive (key TEXT PRIMARY KEY, path TEXT NOT NULL, added REAL NOT NULL)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS scanned ('
+            ' path TEXT PRIMARY KEY,'
+            ' mtime REAL NOT NULL,'
+            ' size INTEGER NOT NULL)'
+        )
+
+    def add(self, key, path):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO archive VALUES (?, ?, ?)', (key, path, time.time()))
+
+    def lookup(self, key):
+        """File an earlier download of ``key`` went to, or None if there is none (any more)"""
+        with self._lock:
+            row = self._conn.execute('SELECT path FROM archive WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(row[0]):
+            with self._lock:
+                self._conn.execute('DELETE FROM archive WHERE key = ? AND path = ?', (key, row[0]))
+            return None
+        return row[0]
+
+    def scan(self, folder, ffprobe=None, workers=SCAN_WORKERS):
+        """Archive the tracks of ``folder`` and its subfolders from their tags; returns counters of the scan"""
+        stats = {'files': 0, 'read': 0, 'keys': 0}
+        if mutagen is None and not ffprobe:
+            print("Library scan skipped: neither mutagen nor ffprobe is available to read tags")
+            return stats
+
+        files = {}
+        for root, _, names in os.walk(folder):
+            for name in names:
+                if '.ytmp3-' in name or name.rsplit('.', 1)[-1].lower() not in LIBRARY_EXTS:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (st.st_mtime, st.st_size)
+        stats['files'] = len(files)
+
+        prefix = os.path.join(folder, '')
+        with self._lock:
+            known = {path: (mtime, size) for path, mtime, size in self._conn.execute(
+                'SELECT path, mtime, size FROM scanned WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))}
+        # Chỉ đọc lại thẻ của file mới hoặc đã thay đổi từ lần quét trước
+        changed = [path for path, signature in files.items() if known.get(path) != signature]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ytmp3-scan') as pool:
+            found = list(pool.map(lambda path: source_keys(path, ffprobe), changed))
+        stats['read'] = len(changed)
+        stats['keys'] = sum(len(keys) for keys in found)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for path, keys in zip(changed, found):
+                    mtime, size = files[path]
+                    self._conn.execute('INSERT OR REPLACE INTO scanned VALUES (?, ?, ?)', (path, mtime, size))
+                    for key in keys:
+                        self._conn.execute('INSERT OR REPLACE INTO archive VALUES (?, ?, ?)', (key, path, now))
+                for path in known.keys() - files.keys():
+                    self._conn.execute('DELETE FROM scanned WHERE path = ?', (path,))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return stats
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM archive').fetchone()[0]
+            scanned = self._conn.execute('SELECT COUNT(*) FROM scanned').fetchone()[0]
+        return {'entries': entries, 'scanned_files': scanned}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM archive')
+            self._conn.execute('DELETE FROM scanned')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,511 @@
+"""Offline benchmark: a local media server and a stub extractor feeding the real download pipeline.
+
+``python -m ytmp3 bench --tracks 20 --jobs 1,4,8`` serves synthetic WAV
+files (plain HTTP and HLS) from 127.0.0.1, runs the engine's extract ->
+download -> ffmpeg -> tag stages on them at each concurrency level and
+compares tracks/min, CPU time per track, peak RSS and UI-queue latency
+with a stored baseline. Every output file is also checked for its cover
+art and source URL tag. Each level runs in a fresh process so its peak
+RSS isn't that of the levels before it, with the per-host limit pinned to
+the level instead of ramping up from 2.
+"""
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+
+from .archive import find_ffprobe, read_tag_values
+from .engine import DownloadEngine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import mutagen
+except ImportError:  # the output check uses ffprobe instead
+    mutagen = None
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SEGMENT_SECONDS = 4  # length of one HLS segment
+MODES = ('http', 'hls')
+
+# Chỉ số được so với baseline: tên -> True nếu giá trị lớn hơn là tốt hơn
+COMPARED_METRICS = {
+    'tracks_per_min': True,
+    'cpu_seconds_per_track': False,
+    'ui_latency_p95_ms': False,
+}
+UI_LATENCY_FLOOR_MS = 5  # below this, UI latency changes are noise
+
+
+# -- synthetic media ------------------------------------------------------
+
+def make_wav(seconds, frequency=441):
+    """A stereo 16-bit sine tone; 441 Hz fits exactly 100 samples per period at 44.1 kHz"""
+    period = SAMPLE_RATE // frequency
+    frame = b''.join(
+        struct.pack('<hh', value, value)
+        for value in (int(12000 * math.sin(2 * math.pi * i / period)) for i in range(period))
+    )
+    frames = SAMPLE_RATE * seconds
+    data = frame * (frames // period)
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + len(data), b'WAVE', b'fmt ', 16, 1, CHANNELS, SAMPLE_RATE,
+        SAMPLE_RATE * CHANNELS * 2, CHANNELS * 2, 16, b'data', len(data))
+    return header + data
+
+
+def make_png(size=16, color=(200, 40, 40)):
+    """A solid-color PNG used as cover art"""
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff)
+    row = b'\x00' + bytes(color) * size
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * size))
+            + chunk(b'IEND', b''))
+
+
+def make_hls(wav, seconds):
+    """Split a WAV file into HLS segments; concatenated they give back the exact file"""
+    segment_bytes = SAMPLE_RATE * CHANNELS * 2 * SEGMENT_SECONDS
+    segments = [wav[i:i + segment_bytes] for i in range(0, len(wav), segment_bytes)]
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}', '#EXT-X-MEDIA-SEQUENCE:0']
+    remaining = seconds
+    for i in range(len(segments)):
+        duration = min(SEGMENT_SECONDS, remaining)
+        remaining -= duration
+        lines += [f'#EXTINF:{duration:.3f},', f'seg{i}.wav']
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines).encode() + b'\n', segments
+
+
+def make_aac(wav, ffmpeg_path):
+    """The WAV encoded to AAC once as a .m4a file and once as HLS (MPEG-TS segments), like YouTube/SoundCloud serve it.
+
+    Returns (m4a bytes, playlist, {segment name: bytes}).
+    """
+    workdir = tempfile.mkdtemp(prefix='ytmp3-bench-aac-')
+    try:
+        wav_path = os.path.join(workdir, 'track.wav')
+        with open(wav_path, 'wb') as f:
+            f.write(wav)
+        encode = [ffmpeg_path, '-v', 'error', '-y', '-i', wav_path, '-c:a', 'aac', '-b:a', '128k']
+        subprocess.run(encode + [os.path.join(workdir, 'track.m4a')], check=True)
+        subprocess.run(encode + ['-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+                                 '-hls_segment_filename', os.path.join(workdir, 'seg%d.ts'),
+                                 os.path.join(workdir, 'index.m3u8')], check=True)
+        files = {}
+        for name in os.listdir(workdir):
+            with open(os.path.join(workdir, name), 'rb') as f:
+                files[name] = f.read()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    segments = {name: data for name, data in files.items() if name.endswith('.ts')}
+    return files['track.m4a'], files['index.m3u8'], segments
+
+
+# -- local server ---------------------------------------------------------
+
+class MediaServer:
+    """Threaded HTTP server on 127.0.0.1 for the bench files, with Range support and optional throttling.
+
+    Paths: /media/track.wav, /media/cover.png, /media/hls/index.m3u8 and
+    /media/hls/seg<N>.wav. Every track URL serves the same bytes. With
+    ``codec='aac'`` (needs ``ffmpeg_path``) the track is /media/track.m4a
+    and the HLS segments seg<N>.ts, the streams 'original' mode remuxes.
+    """
+
+    def __init__(self, seconds=30, throttle=0, codec='wav', ffmpeg_path=None):
+        wav = make_wav(seconds)
+        self.codec = codec
+        self.files = {'/media/cover.png': (make_png(), 'image/png')}
+        if codec == 'aac':
+            track, playlist, segments = make_aac(wav, ffmpeg_path)
+            self.files['/media/track.m4a'] = (track, 'audio/mp4')
+            for name, segment in segments.items():
+                self.files[f'/media/hls/{name}'] = (segment, 'video/mp2t')
+        else:
+            track = wav
+            playlist, segments = make_hls(wav, seconds)
+            self.files['/media/track.wav'] = (wav, 'audio/wav')
+            for i, segment in enumerate(segments):
+                self.files[f'/media/hls/seg{i}.wav'] = (segment, 'audio/wav')
+        self.files['/media/hls/index.m3u8'] = (playlist, 'application/vnd.apple.mpegurl')
+        self.track_bytes = len(track)
+        self.throttle = throttle  # bytes per second per connection, 0 = unlimited
+        self.requests = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_file(head=True)
+
+            def do_GET(self):
+                self.send_file()
+
+            def send_file(self, head=False):
+                server.requests += 1
+                # Mọi bài dùng chung một file: /media/<bài>/... -> /media/...
+                path = re.sub(r'^/media/t\d+/', '/media/', self.path.split('?')[0])
+                if path not in server.files:
+                    self.send_error(404)
+                    return
+                body, content_type = server.files[path]
+                start, end, status = 0, len(body) - 1, 200
+                match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), end) if match.group(2) else end
+                    else:
+                        start = max(len(body) - int(match.group(2)), 0)
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(body)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    status = 206
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                if status == 206:
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+                self.end_headers()
+                if not head:
+                    server.write(self.wfile, body[start:end + 1])
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self._httpd.server_address[1]}'
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='ytmp3-bench-server', daemon=True)
+
+    def write(self, wfile, data):
+        if not self.throttle:
+            wfile.write(data)
+            return
+        chunk = 64 * 1024
+        start = time.monotonic()
+        for offset in range(0, len(data), chunk):
+            wfile.write(data[offset:offset + chunk])
+            delay = start + (offset + chunk) / self.throttle - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def track_url(self, mode, index):
+        return f'{self.base_url}/bench/{self.codec}/{mode}/{index}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+# -- stub extractor -------------------------------------------------------
+
+class BenchIE(InfoExtractor):
+    """Stub extractor for MediaServer URLs: builds the info dict without any request"""
+
+    IE_NAME = 'ytmp3:bench'
+    _VALID_URL = r'https?://127\.0\.0\.1:(?P<port>\d+)/bench/(?P<codec>wav|aac)/(?P<mode>http|hls)/(?P<id>\d+)'
+
+    def _real_extract(self, url):
+        port, codec, mode, track_id = self._match_valid_url(url).group('port', 'codec', 'mode', 'id')
+        media = f'http://127.0.0.1:{port}/media/t{track_id}'
+        if mode == 'hls':
+            fmt = {'format_id': 'hls', 'url': f'{media}/hls/index.m3u8', 'protocol': 'm3u8_native'}
+        else:
+            fmt = {'format_id': 'http', 'url': f'{media}/track.{"m4a" if codec == "aac" else "wav"}'}
+        if codec == 'aac':
+            fmt.update({'ext': 'm4a', 'acodec': 'aac', 'vcodec': 'none', 'asr': SAMPLE_RATE})
+        else:
+            fmt.update({'ext': 'wav', 'acodec': 'pcm_s16le', 'vcodec': 'none', 'asr': SAMPLE_RATE})
+        return {
+            'id': f'bench{track_id}',
+            'title': f'Bench Track {int(track_id):03d}',
+            'artist': 'YTMP3 Bench',
+            'formats': [fmt],
+            'thumbnail': f'{media}/cover.png',
+        }
+
+
+@contextlib.contextmanager
+def bench_extractor():
+    """Make every YoutubeDL created inside the block try BenchIE first"""
+    original = yt_dlp.YoutubeDL.add_default_info_extractors
+
+    def add_default_info_extractors(ydl):
+        ydl.add_info_extractor(BenchIE())
+        original(ydl)
+
+    yt_dlp.YoutubeDL.add_default_info_extractors = add_default_info_extractors
+    try:
+        yield
+    finally:
+        yt_dlp.YoutubeDL.add_default_info_extractors = original
+
+
+# -- measurements ---------------------------------------------------------
+
+class UIQueueProbe:
+    """Stand-in for the Tk thread: one consumer renders every published event from the job registry.
+
+    Latency is the time an event waits between being published by the
+    engine and being handled, the same hop the GUI's UIDispatcher makes.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.latencies = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='ytmp3-bench-ui', daemon=True)
+        self._thread.start()
+
+    def __call__(self, event, data):
+        self._queue.put((time.monotonic(), data.get('job_id')))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            published, job_id = item
+            record = self.engine.jobs.get(job_id)
+            if record is not None:
+                # Tương đương việc dựng các dòng hiển thị của một job
+                str((record.title, record.state, record.percent, record.downloaded_bytes))
+            self.latencies.append(time.monotonic() - published)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def _usage():
+    """(cpu seconds of this process and its ffmpeg children, peak RSS in MiB of each)"""
+    if resource is None:
+        return time.process_time(), None, None
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = self_usage.ru_utime + self_usage.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss là KiB trên Linux, byte trên macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return cpu, self_usage.ru_maxrss / scale, children.ru_maxrss / scale
+
+
+def has_cover(path, ffprobe=None):
+    """True if ``path`` has embedded cover art (mutagen if installed, else ffprobe)"""
+    if mutagen is not None:
+        try:
+            audio = mutagen.File(path)
+        except Exception:
+            return False
+        if audio is None:
+            return False
+        if getattr(audio, 'pictures', None):
+            return True  # FLAC
+        keys = [str(key).lower() for key in (audio.tags.keys() if audio.tags else ())]
+        return any(key.startswith('apic') or key in ('covr', 'metadata_block_picture') for key in keys)
+
+    try:
+        result = subprocess.run(
+            [ffprobe, '-v', 'quiet', '-print_format', 'json', '-show_entries', 'stream_disposition=attached_pic', path],
+            capture_output=True, timeout=30, check=True)
+        streams = json.loads(result.stdout or b'{}').get('streams', [])
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return False
+    return any(stream.get('disposition', {}).get('attached_pic') for stream in streams)
+
+
+def missing_tags(path, ffprobe=None):
+    """What the tag stage should have written into ``path`` but didn't: 'cover' and/or 'source'"""
+    missing = []
+    if not has_cover(path, ffprobe):
+        missing.append('cover')
+    # URL nguồn được ghi vào source/purl/comment, như một bài tải thật
+    if '/bench/' not in '\n'.join(read_tag_values(path, ffprobe)):
+        missing.append('source')
+    return missing
+
+
+def run_level(urls, mode, jobs, audio_format, workdir, transcode_workers=None, ffmpeg_path=None):
+    """Download ``urls`` with ``jobs`` parallel downloads and return the measurements.
+
+    Peak RSS is that of the whole process: call it through
+    ``run_level_isolated`` to measure one level on its own.
+    """
+    tracks = len(urls)
+    output = tempfile.mkdtemp(prefix=f'{mode}-{jobs}-', dir=workdir)
+    engine = DownloadEngine(
+        save_path=output, audio_format=audio_format, ffmpeg_path=ffmpeg_path, max_workers=jobs,
+        host_limits={'youtube': jobs}, cache_dir=os.path.join(workdir, 'cache'), persistent_cache=False,
+        transcode_workers=transcode_workers)
+    # Giữ cố định số lượt tải song song bằng jobs, không đo giai đoạn tăng dần từ 2 (AIMD)
+    engine.scheduler.adaptive = False
+    engine.download_stage.adaptive = False
+    probe = UIQueueProbe(engine)
+    engine.subscribe(probe)
+    ffprobe = find_ffprobe(ffmpeg_path)
+
+    cpu_before, _, _ = _usage()
+    start = time.monotonic()
+    try:
+        results = engine.run_batch(urls)
+        elapsed = time.monotonic() - start
+        cpu_after, peak_rss, peak_child_rss = _usage()
+        untagged = None  # không có mutagen lẫn ffprobe để kiểm tra
+        if mutagen is not None or ffprobe:
+            untagged = sum(1 for name in os.listdir(output) if missing_tags(os.path.join(output, name), ffprobe))
+    finally:
+        probe.close()
+        engine.shutdown()
+        shutil.rmtree(output, ignore_errors=True)
+
+    done = sum(1 for result in results if result)
+    return {
+        'mode': mode,
+        'jobs': jobs,
+        'tracks': tracks,
+        'failed': tracks - done,
+        'seconds': round(elapsed, 3),
+        'tracks_per_min': round(done * 60 / elapsed, 2) if elapsed else 0.0,
+        'cpu_seconds_per_track': round((cpu_after - cpu_before) / done, 3) if done else None,
+        'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+        'peak_ffmpeg_rss_mb': round(peak_child_rss, 1) if peak_child_rss is not None else None,
+        'ui_latency_p50_ms': round(probe.percentile(50) * 1000, 2),
+        'ui_latency_p95_ms': round(probe.percentile(95) * 1000, 2),
+        'ui_latency_max_ms': round(max(probe.latencies, default=0) * 1000, 2),
+        'ui_events': len(probe.latencies),
+        'untagged': untagged,
+    }
+
+
+def _run_level_in_process(*args):
+    with bench_extractor():
+        return run_level(*args)
+
+
+def run_level_isolated(*args):
+    """``run_level`` in a new process: its peak RSS (and ffmpeg's) is of this level only"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_run_level_in_process, *args).result()
+
+
+def run_benchmark(tracks=20, jobs=(1, 4, 8), modes=MODES, seconds=30, audio_format='mp3', throttle=0,
+                  transcode_workers=None, ffmpeg_path=None, log=print):
+    """Run every (mode, jobs) combination against one local server and return the result rows"""
+    rows = []
+    workdir = tempfile.mkdtemp(prefix='ytmp3-bench-')
+    try:
+        # 'original' giữ nguyên luồng gốc: phát AAC như YouTube/SoundCloud, WAV thì không gắn được ảnh bìa
+        codec = 'aac' if audio_format == 'original' else 'wav'
+        with MediaServer(seconds=seconds, throttle=throttle, codec=codec, ffmpeg_path=ffmpeg_path) as server, \
+                bench_extractor():
+            for mode in modes:
+                for level in jobs:
+                    urls = [server.track_url(mode, i) for i in range(tracks)]
+                    row = run_level_isolated(urls, mode, level, audio_format, workdir, transcode_workers, ffmpeg_path)
+                    row['format'] = audio_format
+                    log(format_row(row))
+                    rows.append(row)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+# -- baselines ------------------------------------------------------------
+
+def row_key(row):
+    return f"{row['mode']}/{row['format']}/{row['jobs']}"
+
+
+def format_row(row):
+    cpu = row['cpu_seconds_per_track']
+    rss = row['peak_rss_mb']
+    return (f"{row['mode']:>4} {row['format']:>8} jobs={row['jobs']:<3} "
+            f"{row['tracks_per_min']:8.1f} tracks/min  "
+            f"{cpu if cpu is not None else '-':>6} CPU s/track  "
+            f"peak RSS {rss if rss is not None else '-'} MiB  "
+            f"UI p50/p95/max {row['ui_latency_p50_ms']}/{row['ui_latency_p95_ms']}/{row['ui_latency_max_ms']} ms"
+            + (f"  {row['failed']} failed" if row['failed'] else '')
+            + (f"  {row['untagged']} without cover art or source tag" if row.get('untagged') else ''))
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_baseline(path, rows, config):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    baseline = {'saved': time.time(), 'config': config, 'results': {row_key(row): row for row in rows}}
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def tag_problems(rows):
+    """One message per level whose output files lack cover art or the source URL tag"""
+    return [f"{row_key(row)}: {row['untagged']} of {row['tracks'] - row['failed']} files without cover art or source tag"
+            for row in rows if row.get('untagged')]
+
+
+def compare(rows, baseline, tolerance=0.15):
+    """Return one message per metric that got worse than the baseline by more than ``tolerance``"""
+    regressions = []
+    for row in rows:
+        old = baseline.get('results', {}).get(row_key(row))
+        if not old:
+            continue
+        if row['failed'] > old.get('failed', 0):
+            regressions.append(f"{row_key(row)}: {row['failed']} failed tracks (baseline {old.get('failed', 0)})")
+        for name, higher_is_better in COMPARED_METRICS.items():
+            new_value, old_value = row.get(name), old.get(name)
+            if not new_value or not old_value:
+                continue
+            if name.startswith('ui_latency') and max(new_value, old_value) < UI_LATENCY_FLOOR_MS:
+                continue
+            change = (new_value - old_value) / old_value
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{row_key(row)}: {name} {old_value} -> {new_value} ({change:+.0%})")
+    return regressions
@@ -0,0 +1,351 @@
+"""Command line entry point: ``python -m ytmp3 batch urls.txt --format mp3 --jobs 4``"""
+import argparse
+import os
+import sys
+import threading
+
+from .archive import DownloadArchive, find_ffprobe
+from .engine import AUDIO_FORMATS, DownloadEngine, default_ffmpeg_path
+from .events import DEFAULT_PROGRESS_RATE
+from .metadata import SQLiteMetadataStore
+from .metrics import write_json
+from .paths import user_cache_dir
+from .scheduler import DEFAULT_CONNECTION_BUDGET
+from .segmented import DEFAULT_CONNECTIONS
+from .urls import validate_urls
+from .ytcache import YtDlpCache
+
+STATUS_MESSAGES = {
+    "loading_album": "Loading album information...",
+    "loading_track": "Loading track information...",
+}
+
+
+class ConsoleReporter:
+    """Print engine events as plain log lines"""
+
+    def __init__(self, verbose=False, stream=None):
+        self.verbose = verbose
+        self.stream = stream or sys.stdout
+        self.finished = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def log(self, message):
+        with self.lock:
+            print(message, file=self.stream, flush=True)
+
+    def __call__(self, event, data):
+        if event == 'status':
+            if self.verbose:
+                self.log(STATUS_MESSAGES[data['key']].format(*data['args']))
+        elif event == 'album_started':
+            self.log(f"Album: {data['title']}")
+        elif event == 'album_skipped':
+            self.log(f"  {data['count']} tracks were skipped due to geo-restriction")
+        elif event == 'album_restricted':
+            self.log(f"Album: {data['title']} (all tracks are geo-restricted)")
+        elif event == 'album_finished':
+            self.log(f"Album: {data['title']} - Downloaded {data['completed']}/{data['total']} tracks")
+        elif event == 'concurrency':
+            self.log(f"Parallel {data['stage']} jobs for {data['host']}: {data['limit']}")
+        elif event == 'job_started':
+            self.log(f"[{data['job_id']}] Downloading: {data['title']}")
+        elif event == 'job_progress':
+            if self.verbose:
+                self.log(f"[{data['job_id']}] {data['percent']}%")
+        elif event == 'job_finished':
+            with self.lock:
+                if data['job_id'] in self.finished:
+                    return
+                self.finished.add(data['job_id'])
+            self.log(f"[{data['job_id']}] Downloaded: {data['title']}")
+        elif event == 'job_archived':
+            self.log(f"[{data['job_id']}] Already downloaded: {data['path']}")
+        elif event == 'job_skipped':
+            self.log(f"[{data['job_id']}] Skipped (not available): {data['title']}")
+        elif event == 'job_connections':
+            if self.verbose:
+                speeds = ", ".join(f"{speed / (1024 * 1024):.1f}" for speed in data['speeds'])
+                self.log(f"[{data['job_id']}] {len(data['speeds'])} connections: {speeds} MiB/s")
+        elif event == 'job_fragments':
+            if self.verbose:
+                self.log(f"[{data['job_id']}] {data['fragments']} fragments over {data['connections']} connections: "
+                         f"{data['latency']:.2f}s per fragment, {data['speed'] / (1024 * 1024):.1f} MiB/s")
+        elif event == 'track_checked':
+            if self.verbose and not data['available']:
+                self.log(f"  Track {data['index'] + 1} is not available: {data['title']}")
+        elif event == 'job_failed':
+            with self.lock:
+                self.failed.add(data['job_id'])
+            error = f" ({data['error']})" if data['error'] else ""
+            self.log(f"[{data['job_id']}] Failed: {data['url']}{error}")
+
+
+def read_urls(path):
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    # Bỏ qua dòng trống và dòng chú thích
+    return [line for line in lines if line.strip() and not line.lstrip().startswith('#')]
+
+
+def cmd_batch(args):
+    valid_urls, invalid_urls = validate_urls(read_urls(args.file) if args.file else [])
+    for url in invalid_urls:
+        print(f"Skipping invalid URL: {url}", file=sys.stderr)
+    if not valid_urls and not args.resume and not args.discard_unfinished:
+        print("No valid YouTube or SoundCloud URLs found", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output, exist_ok=True)
+    host_limits = {}
+    if args.youtube_jobs:
+        host_limits['youtube'] = args.youtube_jobs
+    if args.soundcloud_jobs:
+        host_limits['soundcloud'] = args.soundcloud_jobs
+
+    engine = DownloadEngine(
+        save_path=args.output,
+        audio_format=args.format,
+        ffmpeg_path=args.ffmpeg,
+        max_workers=args.jobs,
+        host_limits=host_limits,
+        persistent_cache=not args.no_cache,
+        transcode_workers=args.transcode_jobs,
+        progress_rate=args.progress_rate,
+        download_connections=args.connections,
+        max_connections=args.max_connections,
+        archive=not args.no_archive,
+        staging_dir=args.staging_dir,
+    )
+    reporter = ConsoleReporter(verbose=args.verbose)
+    engine.subscribe(reporter)
+
+    unfinished = engine.unfinished_jobs()
+    if args.discard_unfinished:
+        # Bỏ hẳn các bài dở: xóa file tạm và trả lại tên file đã giữ
+        engine.discard_unfinished()
+        print(f"Discarded {len(unfinished)} unfinished jobs")
+        if not valid_urls:
+            return 0
+    elif args.resume:
+        print(f"Resuming {len(unfinished)} unfinished jobs")
+    elif unfinished:
+        print(f"{len(unfinished)} jobs of an earlier batch are unfinished, add --resume to continue them "
+              f"or --discard-unfinished to drop them")
+
+    if not args.no_warm_up:
+        engine.warm_up(valid_urls)
+    if args.profile:
+        engine.start_profiling(args.profile)
+    try:
+        engine.run_batch(valid_urls, resume=args.resume)
+    finally:
+        if args.profile:
+            print(f"Profile written to {engine.stop_profiling()}")
+
+    # Báo cáo thời gian từng giai đoạn, dùng để chỉnh số lượng tải song song
+    try:
+        if args.report:
+            write_json(args.report, engine.batch_report())
+        if args.metrics_file:
+            engine.metrics.write_prometheus(args.metrics_file)
+    except OSError as e:
+        print(f"Could not write the batch report: {str(e)}", file=sys.stderr)
+
+    print(f"Done: {len(reporter.finished)} downloaded, {len(reporter.failed)} failed")
+    if args.verbose:
+        stats = engine.info_cache_stats()
+        print(f"Metadata cache: {stats['hits']} hits, {stats['disk_hits']} disk hits, "
+              f"{stats['misses']} misses, {stats['coalesced']} coalesced")
+        for name, stage in engine.stage_stats().items():
+            # Hàng đợi đầy nhiều lần nghĩa là giai đoạn này đang giữ chậm giai đoạn trước nó
+            print(f"Stage {name}: {stage['workers']} workers, {stage['completed']} jobs, "
+                  f"peak queue {stage['peak_pending']}, waited {stage['full_wait_time']:.1f}s on a full queue")
+        progress = engine.progress_stats()
+        if progress:
+            print(f"Progress events: {progress['offered']} received, {progress['published']} published, "
+                  f"{progress['merged']} merged, {progress['dropped']} dropped, peak queue {progress['peak_pending']}")
+        connections = engine.connection_stats()
+        print(f"Connections: peak {connections['peak']} of {connections['total']}, "
+              f"{connections['waits']} downloads waited for one")
+        for host, fragments in connections['fragments'].items():
+            print(f"Fragments in parallel for {host}: {fragments['limit']}")
+    return 1 if reporter.failed else 0
+
+
+def cmd_cache(args):
+    ytdlp_cache = YtDlpCache(os.path.join(user_cache_dir(), 'yt-dlp'))
+    if args.only != 'metadata':
+        if args.action == 'clear':
+            ytdlp_cache.clear()
+            print("yt-dlp cache cleared")
+        elif args.action == 'purge':
+            print(f"Removed {ytdlp_cache.prune()} least recently used yt-dlp cache files")
+        else:
+            print(f"yt-dlp cache: {ytdlp_cache.root}")
+            print(f"  {ytdlp_cache.size() / 1024:.1f} KiB of {ytdlp_cache.max_bytes // (1024 * 1024)} MiB")
+    if args.only == 'yt-dlp':
+        return 0
+
+    store = SQLiteMetadataStore(os.path.join(user_cache_dir(), 'metadata.sqlite3'))
+    try:
+        if args.action == 'clear':
+            store.clear()
+            print("Metadata cache cleared")
+        elif args.action == 'purge':
+            print(f"Removed {store.purge_expired()} expired entries")
+        else:
+            stats = store.stats()
+            print(f"Metadata cache: {store.path}")
+            print(f"  {stats['entries']} entries, {stats['bytes'] / 1024:.1f} KiB of {stats['max_bytes'] // (1024 * 1024)} MiB")
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_archive(args):
+    archive = DownloadArchive(os.path.join(user_cache_dir(), 'archive.sqlite3'))
+    try:
+        if args.action == 'clear':
+            archive.clear()
+            print("Download archive cleared")
+            return 0
+        if args.action == 'scan':
+            stats = archive.scan(args.folder, find_ffprobe(args.ffmpeg or default_ffmpeg_path()))
+            print(f"Scanned {args.folder}: {stats['files']} audio files, {stats['read']} read, "
+                  f"{stats['keys']} source URLs found")
+        stats = archive.stats()
+        print(f"Download archive: {archive.path}")
+        print(f"  {stats['entries']} tracks, {stats['scanned_files']} library files scanned")
+    finally:
+        archive.close()
+    return 0
+
+
+def cmd_bench(args):
+    # Chỉ nạp khi cần: bench đăng ký thêm extractor giả cho yt-dlp
+    from . import bench
+
+    ffmpeg_path = args.ffmpeg or default_ffmpeg_path()
+    if not ffmpeg_path:
+        print("ffmpeg is required for the benchmark, put it on PATH or pass --ffmpeg", file=sys.stderr)
+        return 2
+    jobs = [int(level) for level in args.jobs.split(',')]
+    modes = bench.MODES if args.mode == 'both' else (args.mode,)
+    print(f"Benchmarking {args.tracks} tracks of {args.seconds}s per run ({args.format}), jobs {args.jobs}")
+    rows = bench.run_benchmark(tracks=args.tracks, jobs=jobs, modes=modes, seconds=args.seconds,
+                               audio_format=args.format, throttle=args.throttle * 1024,
+                               transcode_workers=args.transcode_jobs, ffmpeg_path=ffmpeg_path)
+
+    config = {'tracks': args.tracks, 'seconds': args.seconds, 'throttle_kib': args.throttle}
+    baseline = bench.load_baseline(args.baseline)
+    status = 0
+    # Thiếu ảnh bìa hoặc thẻ nguồn là lỗi, có baseline hay không
+    for message in bench.tag_problems(rows):
+        print(f"MISSING TAGS {message}")
+        status = 1
+    if baseline is None:
+        print(f"No baseline at {args.baseline}")
+    elif baseline.get('config') != config:
+        print(f"Baseline at {args.baseline} was recorded with {baseline.get('config')}, not comparing")
+    else:
+        regressions = bench.compare(rows, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            status = 1
+        else:
+            print(f"No regression against the baseline (tolerance {args.tolerance:.0%})")
+
+    if args.save_baseline or baseline is None:
+        bench.save_baseline(args.baseline, rows, config)
+        print(f"Baseline saved to {args.baseline}")
+    return status
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ytmp3', description="YouTube & SoundCloud to MP3 converter")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch', help="download every URL listed in a file")
+    batch.add_argument('file', nargs='?', help="text file with one URL per line ('-' reads stdin)")
+    batch.add_argument('--format', choices=AUDIO_FORMATS, default='mp3')
+    batch.add_argument('--jobs', '-j', type=int, default=8,
+                       help="most tracks downloaded in parallel, the actual number adapts to the connection (default: 8)")
+    batch.add_argument('--youtube-jobs', type=int, default=None, help="most parallel YouTube downloads (default: 8)")
+    batch.add_argument('--soundcloud-jobs', type=int, default=None, help="most parallel SoundCloud downloads (default: 8)")
+    batch.add_argument('--transcode-jobs', type=int, default=None,
+                       help="parallel ffmpeg conversions (default: number of CPU cores)")
+    batch.add_argument('--output', '-o', default=os.path.expanduser("~/Downloads"), help="output folder")
+    batch.add_argument('--ffmpeg', default=None, help="path to the ffmpeg binary")
+    batch.add_argument('--staging-dir', default=None, metavar='DIR',
+                       help="work folder for downloads and conversions, e.g. a tmpfs "
+                            "(default: $YTMP3_STAGING_DIR or 'staging' in the cache folder)")
+    batch.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                       help="connections per large single-file download, 1 turns it off (default: 4)")
+    batch.add_argument('--max-connections', type=int, default=DEFAULT_CONNECTION_BUDGET,
+                       help="most connections open at once across all downloads, including HLS/DASH fragments "
+                            "(default: 32)")
+    batch.add_argument('--progress-rate', type=float, default=DEFAULT_PROGRESS_RATE,
+                       help="most progress updates per second, 0 prints every update (default: 10)")
+    batch.add_argument('--verbose', '-v', action='store_true', help="also print progress and status lines")
+    batch.add_argument('--report', default=None, metavar='FILE',
+                       help="write a JSON report with the time, bytes, failures and retries of every stage")
+    batch.add_argument('--metrics-file', default=None, metavar='FILE',
+                       help="write the same timings in the Prometheus text format (e.g. for node_exporter)")
+    batch.add_argument('--profile', nargs='?', const=os.path.join(user_cache_dir(), 'profiles'), default=None,
+                       metavar='DIR', help="profile the batch (cProfile + tracemalloc) into a timestamped folder in DIR")
+    unfinished = batch.add_mutually_exclusive_group()
+    unfinished.add_argument('--resume', action='store_true',
+                            help="first continue the jobs an interrupted batch left unfinished (the file is then optional)")
+    unfinished.add_argument('--discard-unfinished', action='store_true',
+                            help="drop the jobs an interrupted batch left unfinished, with their partial files "
+                                 "(the file is then optional)")
+    batch.add_argument('--no-cache', action='store_true', help="don't read or write the on-disk metadata cache")
+    batch.add_argument('--no-archive', action='store_true',
+                       help="download tracks again even if they are already in the output folder")
+    batch.add_argument('--no-warm-up', action='store_true',
+                       help="don't prefetch the YouTube player / SoundCloud client id before downloading")
+    batch.set_defaults(func=cmd_batch)
+
+    cache = subparsers.add_parser('cache', help="inspect or clear the on-disk metadata and yt-dlp caches")
+    cache.add_argument('action', choices=('stats', 'purge', 'clear'), nargs='?', default='stats')
+    cache.add_argument('--only', choices=('metadata', 'yt-dlp'), default=None, help="limit the action to one cache")
+    cache.set_defaults(func=cmd_cache)
+
+    archive = subparsers.add_parser('archive', help="inspect, build or clear the archive of downloaded tracks")
+    archive.add_argument('action', choices=('stats', 'scan', 'clear'), nargs='?', default='stats')
+    archive.add_argument('--folder', default=os.path.expanduser("~/Downloads"),
+                         help="library folder whose tags 'scan' reads (default: ~/Downloads)")
+    archive.add_argument('--ffmpeg', default=None, help="path to the ffmpeg binary (ffprobe is looked up next to it)")
+    archive.set_defaults(func=cmd_archive)
+
+    bench = subparsers.add_parser('bench', help="offline benchmark against a local media server")
+    bench.add_argument('--tracks', type=int, default=20, help="tracks per run (default: 20)")
+    bench.add_argument('--jobs', default='1,4,8', help="comma-separated parallel download levels (default: 1,4,8)")
+    bench.add_argument('--mode', choices=('http', 'hls', 'both'), default='both',
+                       help="serve tracks as single files, HLS playlists or both (default: both)")
+    bench.add_argument('--seconds', type=int, default=30, help="length of each synthetic track (default: 30)")
+    bench.add_argument('--format', choices=AUDIO_FORMATS, default='mp3')
+    bench.add_argument('--transcode-jobs', type=int, default=None,
+                       help="parallel ffmpeg conversions (default: number of CPU cores)")
+    bench.add_argument('--ffmpeg', default=None, help="path to the ffmpeg binary")
+    bench.add_argument('--throttle', type=int, default=0, metavar='KIB',
+                       help="limit each server connection to KIB KiB/s, 0 = unlimited (default: 0)")
+    bench.add_argument('--baseline', default=os.path.join(user_cache_dir(), 'bench-baseline.json'),
+                       help="baseline file to compare with, created on the first run")
+    bench.add_argument('--save-baseline', action='store_true', help="replace the baseline with this run")
+    bench.add_argument('--tolerance', type=float, default=0.15,
+                       help="relative change counted as a regression (default: 0.15)")
+    bench.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,1434 @@
+"""Download engine for YTMP3, independent of the Tk GUI.
+
+The engine owns everything that talks to yt-dlp: metadata lookups, album
+expansion, track downloads and the batch counters. Front-ends (the Tk app
+in YT.py and the ``python -m ytmp3`` CLI) subscribe to its events instead
+of being called back directly, so the engine never touches Tk.
+
+Subscribers are called as ``callback(event, data)`` from worker threads.
+Events and their ``data`` keys:
+
+    status          key, args            - loading/checking messages
+    album_started   job_id, title
+    album_skipped   job_id, count        - tracks dropped by geo-restriction
+    album_selected  job_id, title, selected
+    album_canceled  job_id, title
+    album_restricted job_id, title       - no downloadable track left
+    album_finished  job_id, title, completed, total
+    job_added       job_id, title, index, count  - album track queued
+    job_started     job_id, title, url
+    job_progress    job_id, title, percent, downloaded_bytes, total_bytes, speed
+                                         - coalesced, see progress_rate
+    job_converting  job_id, title
+    job_finished    job_id, title
+    job_failed      job_id, url, error
+    job_skipped     job_id, title, url   - album track found unavailable by the track check
+    job_archived    job_id, title, url, path - already in the library, nothing downloaded
+    job_connections job_id, speeds       - bytes/s of each connection of a segmented download
+    job_fragments   job_id, fragments, connections, latency, speed
+                                         - a HLS/DASH download: fragment count, fragments
+                                           fetched in parallel, mean seconds per fragment, bytes/s
+    track_checked   job_id, index, title, available
+                                         - one album track checked while the selection dialog is open
+    concurrency     stage, host, limit   - adaptive limit of 'extract', 'download' or 'fragment' changed
+    totals          total, completed
+"""
+import contextlib
+import copy
+import glob
+import hashlib
+import itertools
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import yt_dlp
+from yt_dlp.networking import Request
+
+from .events import DEFAULT_PROGRESS_RATE, EventCoalescer
+from .filenames import FilenameReservations
+from .scheduler import DEFAULT_CONNECTION_BUDGET, FRAGMENT_MAX_CONCURRENCY, ConnectionBudget, DownloadScheduler, FragmentConcurrency, host_for_url
+from .segmented import DEFAULT_CONNECTIONS, MIN_RANGE_SIZE, SegmentedDownloader
+from .archive import DownloadArchive, archive_key, find_ffprobe
+from .jobs import CountdownLatch, JobRegistry
+from .journal import UNFINISHED_MAX_AGE, JobJournal
+from .metadata import MetadataCache, SQLiteMetadataStore
+from .metrics import POSTPROCESSOR_STAGES, BatchMetrics, YtDlpLogger
+from .paths import user_cache_dir, user_staging_dir
+from .profiling import BatchProfiler
+from .urls import canonical_url, is_soundcloud_url, sanitize_filename
+from .ytcache import YtDlpCache
+
+SOUNDCLOUD_CLIENT_ID = 'iZIs9mchVcX5lhVRyQGGAYlNPVldzAoX'
+
+AUDIO_FORMATS = ('mp3', 'flac', 'original')
+
+# Lỗi cho thấy nguồn đang quá tải hoặc giới hạn truy cập: giảm số lượng tải song song
+BACKOFF_ERRORS = ('HTTP Error 429', 'Too Many Requests', 'HTTP Error 5', 'timed out', 'Connection reset')
+
+# Giao thức tải theo từng fragment của yt-dlp (concurrent_fragment_downloads)
+FRAGMENT_PROTOCOLS = ('m3u8_native', 'http_dash_segments')
+
+# Tracks are downloaded and converted under "<job staging dir>/track.ytmp3-part*"
+# and moved to the final name only once ffmpeg is done with them
+STAGING_SUFFIX = '.ytmp3-part'
+STAGING_NAME = 'track' + STAGING_SUFFIX
+
+# Thư mục tạm không thuộc bài nào trong nhật ký được xóa khi khởi động, trừ khi
+# vừa được ghi gần đây (có thể là của một tiến trình YTMP3 khác đang chạy)
+STAGING_ORPHAN_AGE = 15 * 60
+
+# 'original' giữ nguyên luồng âm thanh gốc (không mã hóa lại), đuôi file tùy theo codec
+ORIGINAL_AUDIO_EXTS = ('opus', 'm4a', 'ogg', 'mp3', 'flac')
+
+# Thêm các header để fix lỗi 403
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-us,en;q=0.5',
+    'Sec-Fetch-Mode': 'navigate',
+}
+
+
+def is_backoff_error(error):
+    """True for throttling, server errors and timeouts, i.e. errors that mean 'slow down'"""
+    if isinstance(error, TimeoutError):
+        return True
+    message = str(error)
+    return any(pattern in message for pattern in BACKOFF_ERRORS)
+
+
+def default_ffmpeg_path():
+    """Return the ffmpeg bundled with the app, falling back to the system one"""
+    if getattr(sys, 'frozen', False):
+        # If running as compiled bundle
+        return os.path.join(sys._MEIPASS, 'bin', 'ffmpeg')
+    if os.path.exists('/usr/local/bin/ffmpeg'):
+        return '/usr/local/bin/ffmpeg'
+    # Headless Linux boxes usually have ffmpeg somewhere on PATH
+    return shutil.which('ffmpeg')
+
+
+class DownloadEngine:
+    def __init__(self, save_path=None, audio_format='mp3', ffmpeg_path=None, select_tracks=None,
+                 max_workers=8, host_limits=None, cache_dir=None, persistent_cache=True, transcode_workers=None,
+                 progress_rate=DEFAULT_PROGRESS_RATE, download_connections=DEFAULT_CONNECTIONS,
+                 max_connections=DEFAULT_CONNECTION_BUDGET, journal=True, archive=True, staging_dir=None):
+        self.save_path = save_path or os.path.expanduser("~/Downloads")
+        self.audio_format = audio_format
+        self.ffmpeg_path = ffmpeg_path or default_ffmpeg_path()
+        self.cache_dir = cache_dir or user_cache_dir()
+        # Every job downloads and converts in its own folder under this one
+        # (local disk or a tmpfs), only the finished file goes to save_path
+        self.staging_dir = staging_dir or user_staging_dir(self.cache_dir)
+        # Large progressive streams are fetched over this many connections (1 = off)
+        self.download_connections = download_connections
+        # Every download takes its connections (ranges, HLS/DASH fragments or
+        # just one) from this budget; fragment concurrency is tuned per host
+        self.connections = ConnectionBudget(max_connections)
+        self.fragment_concurrency = FragmentConcurrency(maximum=min(FRAGMENT_MAX_CONCURRENCY, self.connections.total))
+
+        # yt-dlp's own cache (player JS, signature functions, SoundCloud
+        # client id) is shared by every worker instead of being disabled
+        self.ytdlp_cache = YtDlpCache(os.path.join(self.cache_dir, 'yt-dlp'))
+
+        # Each track goes through three stages with their own workers: extract
+        # (yt-dlp API calls), download (network) and transcode/tag (ffmpeg, CPU),
+        # so bandwidth and CPU are used at the same time. Every track of every
+        # batch is queued on the extract stage; the queues in front of the later
+        # stages are bounded so a slow stage holds back the one before it.
+        # Network stages adapt their per-host concurrency (max_workers and
+        # host_limits are the ceilings): up while throughput improves, down
+        # on throttling, server errors and timeouts.
+        self.scheduler = DownloadScheduler(
+            max_workers=max_workers, host_limits=host_limits, name='extract', adaptive=True,
+            on_limit_change=lambda host, limit: self.emit('concurrency', stage='extract', host=host, limit=limit))
+        self.download_stage = DownloadScheduler(
+            max_workers=max_workers, host_limits=host_limits, max_pending=2 * max_workers, name='download',
+            adaptive=True,
+            on_limit_change=lambda host, limit: self.emit('concurrency', stage='download', host=host, limit=limit))
+        transcode_workers = transcode_workers or os.cpu_count() or 2
+        self.transcode_stage = DownloadScheduler(max_workers=transcode_workers, max_pending=2 * transcode_workers,
+                                                 name='transcode')
+
+        # SoundCloud URLs need an extraction (and maybe the track selection
+        # dialog) before we know which tracks to queue; that happens here so
+        # it never holds a download slot.
+        self._resolver = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ytmp3-resolve')
+
+        # Album tracks are checked (removed, geo-restricted...) here while the
+        # selection dialog is already showing the flat track list
+        self._checker = ThreadPoolExecutor(max_workers=5, thread_name_prefix='ytmp3-check')
+
+        # Called as select_tracks(album_title, entries) and returns the list of
+        # selected entry indexes, or None if the user canceled. Headless runs
+        # leave it unset and download every available track.
+        self.select_tracks = select_tracks
+
+        # Unique output names, from one listing per folder instead of a stat per candidate
+        self.filenames = FilenameReservations()
+
+        # Download tracking
+        self.total_downloads = 0
+        self.completed_downloads = 0
+        self.failed_downloads = 0
+        self.albums_in_progress = {}
+        self.download_lock = threading.Lock()
+
+        # Track album info extraction to prevent redundant operations. Results
+        # are kept on disk so re-running a batch doesn't extract everything again.
+        store = None
+        if persistent_cache:
+            try:
+                store = SQLiteMetadataStore(os.path.join(self.cache_dir, 'metadata.sqlite3'))
+            except (OSError, sqlite3.Error) as e:
+                print(f"Persistent metadata cache disabled: {str(e)}")
+        self.info_cache = MetadataCache(store=store)
+
+        # Tracks already in the library (by extractor and ID) are skipped
+        # before any extraction. The archive is filled by every download and
+        # bootstrapped from the source URL tags of the save folder.
+        self.archive = None
+        if archive:
+            try:
+                self.archive = DownloadArchive(os.path.join(self.cache_dir, 'archive.sqlite3'))
+            except (OSError, sqlite3.Error) as e:
+                print(f"Download archive disabled: {str(e)}")
+        self._scanned_folders = set()  # folders whose tags were scanned during this batch
+        self._scan_lock = threading.Lock()
+
+        # State of every job of the batch, kept up to date from the events below
+        self.jobs = JobRegistry()
+
+        # The same states on disk, so a batch cut short by a crash or a
+        # restart can be resumed (see resume_batch)
+        self.journal = None
+        if journal:
+            try:
+                self.journal = JobJournal(os.path.join(self.cache_dir, 'journal.sqlite3'))
+            except (OSError, sqlite3.Error) as e:
+                print(f"Job journal disabled: {str(e)}")
+        self.expire_unfinished()
+        self._hold_unfinished_names()
+        self.sweep_staging()
+
+        # Time, bytes, failures and retries of every stage of the current batch
+        self.metrics = BatchMetrics()
+        self.profiler = None  # BatchProfiler while a batch is being profiled
+
+        self._subscribers = []
+        self._job_ids = itertools.count(1)
+        self._resolved_jobs = set()  # jobs already counted as finished or failed
+
+        # Progress is written to self.jobs right away but only the latest
+        # state per job reaches subscribers, at most progress_rate times a
+        # second (0 publishes every event)
+        self.progress_events = None
+        if progress_rate:
+            self.progress_events = EventCoalescer(self._publish, max_rate=progress_rate)
+
+    # -- events -----------------------------------------------------------
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def emit(self, event, **data):
+        self.jobs.apply(event, data)
+        if self.journal is not None:
+            self.journal.apply(event, data)
+        if self.progress_events is not None and 'job_id' in data:
+            if event == 'job_progress':
+                self.progress_events.offer(data['job_id'], event, data)
+                return
+            # Tiến độ cũ không được đến sau job_converting/job_finished
+            self.progress_events.discard(data['job_id'])
+        self._publish(event, data)
+
+    def _publish(self, event, data):
+        for callback in list(self._subscribers):
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"Error in event subscriber for {event}: {str(e)}")
+
+    def new_job_id(self):
+        return next(self._job_ids)
+
+    # -- batch ------------------------------------------------------------
+
+    def reset_batch(self, total=0):
+        """Reset counters before a new batch (cached metadata expires on its own)"""
+        with self.download_lock:
+            self.total_downloads = total
+            self.completed_downloads = 0
+            self.failed_downloads = 0
+            self.albums_in_progress = {}
+            self._resolved_jobs = set()
+        self._scanned_folders = set()  # quét lại (chỉ file mới/đổi) ở lượt tải sau
+        self.filenames.forget()
+        self._hold_unfinished_names()
+        self.jobs.clear()
+        self.metrics = BatchMetrics()
+
+    def shutdown(self):
+        """Stop every worker thread; queued jobs are canceled"""
+        for stage in (self.scheduler, self.download_stage, self.transcode_stage):
+            stage.shutdown(wait=False)
+        self._resolver.shutdown(wait=False, cancel_futures=True)
+        self._checker.shutdown(wait=False, cancel_futures=True)
+        if self.progress_events is not None:
+            self.progress_events.close()
+
+    def warm_up(self, urls=None):
+        """Trim the yt-dlp cache and fill it for the hosts a batch will use"""
+        self.ytdlp_cache.prune()
+        hosts = ('youtube', 'soundcloud')
+        if urls is not None:
+            hosts = sorted({host_for_url(url) for url in urls})
+        self.ytdlp_cache.warm_up(hosts, {'http_headers': HTTP_HEADERS})
+
+    def start_batch(self, urls, on_done=None):
+        """Queue every URL and return one Future per URL without blocking.
+
+        ``on_done()`` is called once, on a worker thread, right after the
+        last of those Futures resolves (downloaded, failed or canceled).
+        """
+        futures = [self.submit_url(url) for url in urls]
+        self._when_done(futures, on_done)
+        return futures
+
+    def unfinished_jobs(self):
+        """Journal entries of the jobs an earlier run queued but never finished"""
+        if self.journal is None:
+            return []
+        return self.journal.unfinished()
+
+    def discard_unfinished(self):
+        """Forget the unfinished jobs of earlier runs instead of resuming them"""
+        if self.journal is not None:
+            for entry in self.journal.unfinished():
+                self._remove_staging_files(self._entry_staging_path(entry), entry.final_filename)
+            self.journal.clear()
+
+    def expire_unfinished(self, max_age=UNFINISHED_MAX_AGE):
+        """Forget the unfinished jobs nobody resumed for ``max_age`` seconds; returns how many"""
+        if self.journal is None:
+            return 0
+        expired = self.journal.expire(max_age)
+        for entry in expired:
+            self._remove_staging_files(self._entry_staging_path(entry), entry.final_filename)
+        if expired:
+            print(f"Dropped {len(expired)} unfinished jobs not resumed for {max_age // (24 * 3600)} days")
+        return len(expired)
+
+    def _hold_unfinished_names(self):
+        """Reserve the final names of the journal's unfinished jobs, so no new job is given one of them"""
+        for entry in self.unfinished_jobs():
+            if entry.final_filename:
+                self.filenames.claim(entry.final_filename, _final_exts(entry.final_filename), entry.entry_id)
+
+    def resume_batch(self, on_done=None):
+        """Queue the unfinished jobs of the journal like start_batch and return their Futures.
+
+        Each job keeps its output folder and, once it got that far, its
+        final filename, so yt-dlp picks up the partial files it left.
+        """
+        # Giữ tên của mọi bài tải tiếp trước khi bài mới nào kịp chọn tên
+        self._hold_unfinished_names()
+        futures = []
+        for entry in self.unfinished_jobs():
+            job_id = self.new_job_id()
+            self.journal.bind(job_id, entry.entry_id)
+            if entry.kind == 'track':
+                futures.append(self._submit_job(host_for_url(entry.url), self.download_track, entry.url,
+                                                entry.output_dir, job_id))
+            else:
+                futures.append(self.submit_url(entry.url, job_id, entry.output_dir))
+        self._when_done(futures, on_done)
+        return futures
+
+    def _when_done(self, futures, on_done):
+        def done():
+            # Nhật ký chỉ giữ lại những gì còn phải tải
+            if self.journal is not None:
+                self.journal.prune()
+            if on_done is not None:
+                on_done()
+        latch = CountdownLatch(len(futures), done)
+        for future in futures:
+            future.add_done_callback(latch.count_down)
+
+    def run_batch(self, urls, resume=False):
+        """Download every URL (after the unfinished jobs of the journal with ``resume``) and block until done.
+
+        With ``resume``, URLs that are among the resumed jobs are not queued a second time.
+        """
+        unfinished = self.unfinished_jobs() if resume else []
+        resumed = {entry.canonical for entry in unfinished}
+        urls = [url for url in urls if canonical_url(url) not in resumed]
+        self.reset_batch(len(urls) + len(unfinished))
+        futures = self.resume_batch() if resume else []
+        futures += self.start_batch(urls)
+        wait(futures)
+        return [not future.exception() and future.result() for future in futures]
+
+    def count_total_downloads(self, urls):
+        """Count actual downloads including album tracks"""
+        total = 0
+
+        for url in urls:
+            try:
+                if is_soundcloud_url(url):
+                    info = self.get_info(url)
+                    if info:
+                        if info.get('_type') == 'playlist':
+                            # Count each track in the playlist
+                            total += len(info.get('entries', []))
+                        else:
+                            # Single track
+                            total += 1
+                else:
+                    # YouTube URL counts as 1
+                    total += 1
+            except Exception:
+                # If we can't get info, still count it as 1
+                total += 1
+
+        return max(total, len(urls))
+
+    def set_total_downloads(self, count):
+        with self.download_lock:
+            self.total_downloads = count
+            completed = self.completed_downloads
+        self.emit('totals', total=count, completed=completed)
+
+    # -- extraction -------------------------------------------------------
+
+    def get_info(self, url, cache=True):
+        """Get information about a URL with optional caching to prevent repeated API calls.
+
+        Concurrent lookups of the same canonical URL share one extraction,
+        even with ``cache=False``. Albums come back with their flat entry
+        list; use check_track to find out which entries can be downloaded.
+        """
+        try:
+            return self.info_cache.get_or_load(
+                canonical_url(url),
+                # sanitize_info turns lazy entry lists etc. into plain JSON-able data for the disk cache
+                lambda: yt_dlp.YoutubeDL.sanitize_info(
+                    self._timed_call('info', host_for_url(url), self._extract_info, url)),
+                use_cache=cache
+            )
+
+        except Exception as e:
+            print(f"Error getting info: {str(e)}")
+
+            if is_soundcloud_url(url):
+                return {
+                    'title': 'Unknown Album',
+                    '_type': 'playlist',
+                    'entries': [],
+                }
+
+            return None
+
+    def batch_report(self):
+        """Per-stage timings of the current batch plus its counters, as a JSON-able dict"""
+        with self.download_lock:
+            counters = {
+                'total': self.total_downloads,
+                'completed': self.completed_downloads,
+                'failed': self.failed_downloads,
+            }
+        return self.metrics.report(
+            downloads=counters, pipeline=self.stage_stats(), connections=self.connection_stats(),
+            metadata_cache=self.info_cache_stats())
+
+    def start_profiling(self, base_dir=None):
+        """Profile everything the engine runs until stop_profiling (output under <cache>/profiles by default)"""
+        self.profiler = BatchProfiler(base_dir or os.path.join(self.cache_dir, 'profiles')).start()
+        return self.profiler.directory
+
+    def stop_profiling(self):
+        """Write the profile of the batch and return its directory, or None if not profiling"""
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return None
+        return profiler.stop()
+
+    def _profiled(self, fn):
+        # Mỗi tác vụ chạy trên luồng worker được đo khi đang bật profiling
+        profiler = self.profiler
+        return profiler.wrap(fn) if profiler is not None else fn
+
+    def _timed_call(self, stage, host, fn, *args):
+        with self.metrics.timed(stage, host):
+            return fn(*args)
+
+    def _ydl_logger(self, stage, opts, host):
+        return YtDlpLogger(self.metrics, stage, host, warnings=not opts.get('no_warnings'))
+
+    def progress_stats(self):
+        """Counters of the progress coalescing (None when every event is published)"""
+        if self.progress_events is None:
+            return None
+        return self.progress_events.stats()
+
+    def stage_stats(self):
+        """Queue and worker counters of the pipeline stages, to see where work backs up"""
+        return {
+            'extract': self.scheduler.stats(),
+            'download': self.download_stage.stats(),
+            'transcode': self.transcode_stage.stats(),
+        }
+
+    def connection_stats(self):
+        """Use of the connection budget and the fragment concurrency of every host"""
+        return dict(self.connections.stats(), fragments=self.fragment_concurrency.stats())
+
+    def info_cache_stats(self):
+        """Hit/miss/coalesced/eviction counters of the metadata cache"""
+        return self.info_cache.stats()
+
+    def _extract_info(self, url):
+        """Run the yt-dlp extraction behind get_info, raising on failure"""
+        # Cấu hình cơ bản cho yt-dlp với tối ưu hóa tốc độ
+        ydl_opts = {
+            'quiet': True,
+            'format': 'bestaudio/best',
+            'socket_timeout': 10,  # Giảm timeout xuống
+            'extractor_args': {
+                'soundcloud': {
+                    'client_id': SOUNDCLOUD_CLIENT_ID
+                }
+            },
+            'no_warnings': True,
+            'extract_flat': True,  # Chỉ lấy thông tin cơ bản
+            'force_generic_extractor': False,  # Tắt generic extractor
+            **self.ytdlp_cache.options(),
+        }
+
+        if is_soundcloud_url(url):
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # Lấy thông tin cơ bản trước
+                info_dict = ydl.extract_info(url, download=False, process=False)
+
+                if info_dict.get('_type') == 'playlist':
+                    self.emit('status', key='loading_album', args=())
+                    # Chỉ lấy danh sách thô, từng bài được kiểm tra sau bằng check_track
+                    info_dict['entries'] = list(info_dict.get('entries') or [])
+                else:
+                    # Đơn track, hiển thị loading track
+                    self.emit('status', key='loading_track', args=())
+        else:
+            # YouTube URL, hiển thị loading track
+            self.emit('status', key='loading_track', args=())
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info_dict = ydl.extract_info(url, download=False, process=False)
+
+        return info_dict
+
+    def _extract_track(self, url):
+        """Extract one track without processing it, the same data download_track starts from"""
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'socket_timeout': 10,
+            'geo_bypass': True,
+            'geo_bypass_country': 'US',
+            'extractor_args': {
+                'soundcloud': {
+                    'client_id': SOUNDCLOUD_CLIENT_ID
+                }
+            },
+            **self.ytdlp_cache.options(),
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+        if not info or not (info.get('formats') or info.get('url')):
+            raise ValueError("No downloadable audio")
+        return info
+
+    def check_track(self, url):
+        """Return the info of an album track, or None if it can't be downloaded (geo-restricted, removed...)
+
+        The result goes into the metadata cache, so download_track starts
+        from it instead of extracting the track a second time.
+        """
+        if not url:
+            return None
+        try:
+            return self.info_cache.get_or_load(
+                canonical_url(url),
+                lambda: yt_dlp.YoutubeDL.sanitize_info(
+                    self._timed_call('check', host_for_url(url), self._extract_track, url))
+            )
+        except Exception as e:
+            print(f"Error checking track {url}: {str(e)}")
+            return None
+
+    def _cached_track_info(self, url):
+        """Info from an earlier check of ``url`` if its stream URLs are still valid"""
+        info = self.info_cache.get(canonical_url(url))
+        if not info or not info.get('formats'):
+            return None
+        # process_ie_result sửa trực tiếp info, không được làm hỏng bản trong cache
+        return copy.deepcopy(info)
+
+    # -- hooks ------------------------------------------------------------
+
+    def _progress_hook(self, job_id):
+        def hook(d):
+            title = d.get('info_dict', {}).get('title', 'Unknown')
+            if d['status'] == 'downloading':
+                downloaded = d.get('downloaded_bytes', 0)
+                total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 1)
+                if total > 0:
+                    percentage = int((downloaded / total) * 100)
+                    self.emit('job_progress', job_id=job_id, title=title, percent=percentage,
+                              downloaded_bytes=downloaded, total_bytes=total, speed=d.get('speed'))
+            elif d['status'] == 'finished':
+                self.emit('job_converting', job_id=job_id, title=title)
+        return hook
+
+    def _postprocessor_hook(self, job_id, host):
+        started = {}
+
+        def hook(d):
+            # Gọi trước và sau mỗi postprocessor; bài chỉ xong khi giai đoạn transcode trả về
+            # Chỉ đo các bước ffmpeg đã biết, bỏ qua bước nội bộ của yt-dlp (MoveFiles...)
+            stage = POSTPROCESSOR_STAGES.get(d.get('postprocessor'))
+            if d['status'] == 'started':
+                if stage:
+                    started[stage] = time.monotonic()
+            elif d['status'] == 'finished':
+                if stage in started:
+                    self.metrics.observe(stage, host, time.monotonic() - started.pop(stage))
+                if 'info_dict' in d:
+                    title = d['info_dict'].get('title', '')
+                    self.emit('job_converting', job_id=job_id, title=title)
+        return hook
+
+    def mark_download_complete(self, job_id, info):
+        """Count a track as done once its final file is in place; later calls for the same job are ignored"""
+        title = (info or {}).get('title', 'Unknown')
+
+        with self.download_lock:
+            if job_id in self._resolved_jobs:
+                return
+            self._resolved_jobs.add(job_id)
+            if self.total_downloads > 0:
+                self.completed_downloads += 1
+
+        self.emit('job_finished', job_id=job_id, title=title)
+
+    def _mark_archived(self, job_id, url, path):
+        """Count a track that is already in the library as done without downloading it"""
+        with self.download_lock:
+            if job_id in self._resolved_jobs:
+                return
+            self._resolved_jobs.add(job_id)
+            self.completed_downloads += 1
+
+        title = os.path.splitext(os.path.basename(path))[0]
+        self.emit('job_archived', job_id=job_id, title=title, url=url, path=path)
+
+    def _mark_failed(self, job_id, url, error=None):
+        with self.download_lock:
+            if job_id in self._resolved_jobs:
+                return
+            self._resolved_jobs.add(job_id)
+            self.completed_downloads += 1
+            if error is not None:
+                self.failed_downloads += 1
+
+        self.emit('job_failed', job_id=job_id, url=url, error=error)
+
+    # -- downloads --------------------------------------------------------
+
+    def _postprocessors(self, audio_format, audio_quality):
+        if audio_format == 'original':
+            # 'best' chỉ remux luồng âm thanh (opus -> .opus, aac -> .m4a, vorbis -> .ogg), không mã hóa lại
+            extract_audio = {'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}
+        else:
+            extract_audio = {
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': audio_format,
+                'preferredquality': audio_quality,
+            }
+        # Ảnh bìa gắn sau cùng như yt-dlp: ffmpeg ghi lại file khi ghi metadata và làm mất ảnh bìa của .m4a
+        return [
+            extract_audio,
+            {
+                'key': 'FFmpegMetadata',
+                'add_metadata': True,
+            },
+            {
+                'key': 'EmbedThumbnail',
+            },
+        ]
+
+    def archived_path(self, url):
+        """Library file an earlier download of ``url`` went to, or None; never touches the network"""
+        if self.archive is None:
+            return None
+        key = archive_key(url)
+        if key is None:
+            return None
+        self.scan_library()
+        return self.archive.lookup(key)
+
+    def scan_library(self, folder=None):
+        """Archive the tracks of the save folder from their tags, once per batch (only new or changed files)"""
+        folder = folder or self.save_path
+        if self.archive is None:
+            return None
+        # Các job cùng chờ một lần quét thay vì mỗi job tự quét
+        with self._scan_lock:
+            if folder in self._scanned_folders:
+                return None
+            self._scanned_folders.add(folder)
+            try:
+                with self.metrics.timed('scan', None):
+                    return self.archive.scan(folder, find_ffprobe(self.ffmpeg_path))
+            except (OSError, sqlite3.Error) as e:
+                print(f"Library scan failed: {str(e)}")
+                return None
+
+    def _final_filename(self, job_id, base_path, title, audio_format):
+        """Reserve the output name of a job (the one it had before if it is resumed) and journal it"""
+        entry = self.journal.entry(job_id) if self.journal is not None else None
+        if entry is not None and entry.final_filename:
+            # Tên mà lần chạy bị ngắt đã chọn, để file dở của nó được dùng lại
+            if self.filenames.claim(entry.final_filename, _final_exts(entry.final_filename), entry.entry_id):
+                return entry.final_filename
+            print(f"{entry.final_filename} is taken, resuming under a new name")
+        final_filename = self._unique_filename(base_path, title, audio_format)
+        if self.journal is not None:
+            self.journal.set_file(job_id, final_filename)
+        return final_filename
+
+    def _unique_filename(self, base_path, title, audio_format):
+        """Tạo tên file duy nhất"""
+        # Giữ chỗ tên ngay lúc chọn: hai bài trùng tên tải song song không thể lấy cùng một tên
+        return self.filenames.reserve(base_path, title, audio_format, _taken_exts(audio_format))
+
+    def submit_url(self, url, job_id=None, output_path=None):
+        """Queue a pasted URL; the Future resolves once all of its tracks are done"""
+        if job_id is None:
+            job_id = self.new_job_id()
+            if self.journal is not None:
+                self.journal.add(job_id, url, output_path or self.save_path)
+        if not is_soundcloud_url(url):
+            return self._submit_job(host_for_url(url), self.download_youtube, url, job_id, output_path)
+
+        future = Future()
+        self._resolver.submit(self._profiled(self._resolve_soundcloud), url, future, job_id, output_path)
+        return future
+
+    def download_video(self, url):
+        """Download a single URL and block until it is done"""
+        return self.submit_url(url).result()
+
+    def _resolve_soundcloud(self, url, future, job_id=None, output_path=None):
+        try:
+            # Bài đơn đã có trong thư viện: bỏ qua trước khi gọi tới SoundCloud
+            archived = self.archived_path(url)
+            if archived:
+                self._mark_archived(job_id, url, archived)
+                future.set_result(True)
+                return
+            info = self.get_info(url)
+            if info and info.get('_type') == 'playlist':
+                _chain_future(self.submit_soundcloud_album(url, job_id, output_path), future)
+            else:
+                _chain_future(self._submit_job('soundcloud', self.download_track, url, output_path, job_id), future)
+        except Exception as e:
+            future.set_exception(e)
+
+    def _staging_path(self, job_id, url):
+        """Working directory of a job.
+
+        A journaled job is keyed by its journal entry and URL, so a resumed
+        job finds the partial files of the interrupted run and no other
+        track ever does, whatever final name it gets. Other jobs are keyed
+        by this process and their job ID.
+        """
+        entry_id = self.journal.entry_id(job_id) if self.journal is not None else None
+        owner = entry_id if entry_id is not None else f'{os.getpid()}-{job_id}'
+        return os.path.join(self.staging_dir, _staging_key(owner, canonical_url(url)))
+
+    def _entry_staging_path(self, entry):
+        return os.path.join(self.staging_dir, _staging_key(entry.entry_id, entry.canonical))
+
+    def _set_output(self, ydl, job):
+        """Point an instance at its output file once the title is known from extraction"""
+        try:
+            os.makedirs(job['staging_path'], exist_ok=True)
+            staging_base = os.path.join(job['staging_path'], STAGING_NAME)
+        except OSError as e:
+            print(f"Staging folder unavailable, staging next to the output file: {str(e)}")
+            staging_base = _staging_base(job['final_filename'])
+        # yt-dlp đọc outtmpl và postprocessor_args khi tải, nên có thể đặt sau khi trích xuất
+        # Giữ đuôi thật của luồng (.m4a, .webm...): khi không cần chuyển đổi (chế độ gốc), ffmpeg
+        # vẫn phải đoán được định dạng file khi ghi metadata
+        outtmpl = staging_base.replace('%', '%%') + '.%(ext)s'
+        ydl.params['outtmpl']['default'] = outtmpl
+        ydl.params['postprocessor_args'] = job['postprocessor_args']
+
+    def _submit_job(self, host, fn, *args):
+        """Queue a track on the extract stage; the Future resolves after its last stage"""
+        future = Future()
+        _chain_future(self.scheduler.submit(host, self._profiled(fn), *args), future)
+        return future
+
+    def download_youtube(self, url, job_id=None, output_path=None):
+        """Extract stage of a YouTube video, returns the Future of its later stages or False"""
+        if job_id is None:
+            job_id = self.new_job_id()
+        try:
+            archived = self.archived_path(url)
+            if archived:
+                self._mark_archived(job_id, url, archived)
+                return True
+
+            audio_format = self.audio_format
+            audio_quality = '320' if audio_format == 'mp3' else 'best'
+
+            # Simplified options focusing on basic functionality
+            ydl_opts = {
+                'format': 'bestaudio/best',
+                'progress_hooks': [self._progress_hook(job_id)],
+                'postprocessor_hooks': [self._postprocessor_hook(job_id, 'youtube')],
+                'socket_timeout': 60,
+                'nocheckcertificate': True,
+                'ffmpeg_location': self.ffmpeg_path,
+                'http_headers': HTTP_HEADERS,
+                # Shared yt-dlp cache: the player JS is only fetched once, not per track
+                **self.ytdlp_cache.options(),
+                'writethumbnail': True,
+                # Add custom metadata fields
+                'add_metadata': True,
+            }
+
+            with self.metrics.timed('extract', 'youtube'), \
+                    yt_dlp.YoutubeDL(dict(ydl_opts, logger=self._ydl_logger('extract', ydl_opts, 'youtube'))) as ydl:
+                # Trích xuất một lần duy nhất; tên file, metadata và bản tải đều dùng chung info này
+                info = ydl.extract_info(url, download=False, process=False)
+            self.scheduler.report_success('youtube')
+            if not info:
+                self._mark_failed(job_id, url)
+                return False
+
+            title = info.get('title', 'Unknown')
+            artist = info.get('artist', info.get('uploader', 'Unknown Artist'))
+            self.emit('job_started', job_id=job_id, title=title, url=url)
+
+            final_filename = self._final_filename(job_id, output_path or self.save_path, title, audio_format)
+            current_date = datetime.now().strftime("%Y-%m-%d")
+
+            postprocessor_args = [
+                '-metadata', f'title={title}',
+                '-metadata', f'artist={artist}',
+                '-metadata', f'album=Downloaded from YTMP3',
+                '-metadata', f'date={current_date}',
+                '-metadata', f'comment=Downloaded on {current_date}',
+                '-metadata', f'comment=Source: {url}',
+                # Alternative fields for source URL to ensure compatibility with different players
+                '-metadata', f'Where from={url}',
+                '-metadata', f'copyright=Source: {url}',
+            ]
+
+            # Add MP3-specific options if not using FLAC
+            if audio_format == 'mp3':
+                postprocessor_args.extend([
+                    '-b:a', '320k',  # Constant bitrate of 320kbps
+                    '-ar', '48000',  # 48kHz sample rate
+                    '-ac', '2'       # Stereo audio (2 channels)
+                ])
+
+            return self.download_stage.submit('youtube', self._profiled(self._download_stage), {
+                'job_id': job_id,
+                'url': url,
+                'host': 'youtube',
+                'info': info,
+                'opts': ydl_opts,
+                'final_filename': final_filename,
+                'staging_path': self._staging_path(job_id, url),
+                'postprocessors': self._postprocessors(audio_format, audio_quality),
+                'postprocessor_args': postprocessor_args,
+            })
+        except Exception as e:
+            if is_backoff_error(e):
+                self.scheduler.report_failure(host_for_url(url))
+            self._mark_failed(job_id, url, str(e))
+            print(f"Download error: {str(e)}")
+            return False
+
+    def download_track(self, url, output_path=None, job_id=None):
+        """Extract stage of a SoundCloud track, returns the Future of its later stages or False"""
+        if job_id is None:
+            job_id = self.new_job_id()
+        try:
+            archived = self.archived_path(url)
+            if archived:
+                self._mark_archived(job_id, url, archived)
+                return True
+
+            base_path = output_path or self.save_path
+            audio_format = self.audio_format
+
+            ydl_opts = {
+                'format': 'bestaudio/best',
+                'progress_hooks': [self._progress_hook(job_id)],
+                'postprocessor_hooks': [self._postprocessor_hook(job_id, 'soundcloud')],
+                'socket_timeout': 180,
+                'nocheckcertificate': True,
+                'ffmpeg_location': self.ffmpeg_path,
+                **self.ytdlp_cache.options(),
+                'writethumbnail': True,
+                'skip_download_archive': True,
+                'noplaylist': False,
+                'extract_flat': False,
+                'geo_bypass': True,
+                'geo_bypass_country': 'US',
+                'no_warnings': True,
+                'retries': 5,
+                'fragment_retries': 5,
+                'extractor_retries': 5,
+                'skip_unavailable_fragments': True,
+                'http_headers': HTTP_HEADERS,
+                'extractor_args': {
+                    'soundcloud': {
+                        'client_id': SOUNDCLOUD_CLIENT_ID
+                    }
+                },
+                'add_metadata': True,
+            }
+
+            # Dùng lại info của bước kiểm tra album nếu còn hạn, nếu không thì trích xuất một lần
+            info = self._cached_track_info(url)
+            if info is None:
+                with self.metrics.timed('extract', 'soundcloud'), \
+                        yt_dlp.YoutubeDL(dict(ydl_opts, logger=self._ydl_logger('extract', ydl_opts, 'soundcloud'))) as ydl:
+                    info = ydl.extract_info(url, download=False, process=False)
+                self.scheduler.report_success('soundcloud')
+            if not info:
+                self._mark_failed(job_id, url)
+                return False
+
+            title = info.get('title', 'Unknown Track')
+            self.emit('job_started', job_id=job_id, title=title, url=url)
+
+            final_filename = self._final_filename(job_id, base_path, title, audio_format)
+
+            # Define metadata
+            artist = info.get('artist', info.get('uploader', 'Unknown Artist'))
+            current_date = datetime.now().strftime("%Y-%m-%d")
+
+            postprocessor_args = []
+
+            # Thêm audio arguments nếu là MP3
+            if audio_format == 'mp3':
+                postprocessor_args.extend([
+                    '-b:a', '320k',
+                    '-ar', '48000',
+                    '-ac', '2'
+                ])
+
+            postprocessor_args.extend([
+                '-metadata', f'title={title}',
+                '-metadata', f'artist={artist}',
+                '-metadata', f'album=Downloaded from YTMP3',
+                '-metadata', f'date={current_date}',
+                '-metadata', f'comment=Downloaded on {current_date}',
+                '-metadata', f'source={url}',  # Thêm URL gốc vào trường source
+                '-metadata', f'purl={url}',    # Thêm URL gốc vào trường purl (purchase URL)
+                '-metadata', f'copyright=Source URL: {url}'  # Hiển thị rõ ràng hơn trong trường copyright
+            ])
+
+            return self.download_stage.submit('soundcloud', self._profiled(self._download_stage), {
+                'job_id': job_id,
+                'url': url,
+                'host': 'soundcloud',
+                'info': info,
+                'opts': ydl_opts,
+                'final_filename': final_filename,
+                'staging_path': self._staging_path(job_id, url),
+                'postprocessors': self._postprocessors(audio_format, 'best'),
+                'postprocessor_args': postprocessor_args,
+            })
+
+        except Exception as e:
+            if is_backoff_error(e):
+                self.scheduler.report_failure(host_for_url(url))
+            self._mark_failed(job_id, url, str(e))
+            print(f"Download error: {str(e)}")
+            return False
+
+    def _download_stage(self, job):
+        """Download stage: fetch the audio (and thumbnail) without running ffmpeg"""
+        connections = 0
+        try:
+            # Không có postprocessor ở đây, ffmpeg chạy ở giai đoạn transcode
+            opts = {k: v for k, v in job['opts'].items() if k != 'postprocessor_hooks'}
+            opts['logger'] = self._ydl_logger('download', opts, job['host'])
+            fragments = {}
+            with self.metrics.timed('download', job['host']) as sample:
+                with yt_dlp.YoutubeDL(opts) as ydl:
+                    self._set_output(ydl, job)
+                    mode, selected, total_bytes = self._plan_download(ydl, job)
+                    if mode == 'fragments':
+                        connections = self.connections.acquire(self.fragment_concurrency.limit(job['host']))
+                        ydl.params['concurrent_fragment_downloads'] = connections
+                        ydl.add_progress_hook(self._fragment_hook(fragments))
+                    elif mode == 'ranges':
+                        connections = self.connections.acquire(self.download_connections)
+                        if connections > 1:
+                            self._segmented_download(ydl, job, selected, total_bytes, connections)
+                    else:
+                        connections = self.connections.acquire(1)
+                    # Chọn định dạng và tải từ info đã có, không trích xuất lại
+                    info = ydl.process_ie_result(job['info'], download=True)
+
+                downloads = (info or {}).get('requested_downloads')
+                if not downloads or not downloads[0].get('filepath'):
+                    raise ValueError("Nothing was downloaded")
+                # requested_downloads chỉ giữ các khóa khác với info (filepath, định dạng...);
+                # postprocessor cần cả title, thumbnails, webpage_url... nên gộp lại như yt-dlp
+                downloaded = dict(info, **downloads[0])
+                downloaded.pop('requested_downloads', None)
+                with contextlib.suppress(OSError):
+                    sample['bytes'] = os.path.getsize(downloaded['filepath'])
+        except Exception as e:
+            if is_backoff_error(e):
+                self.download_stage.report_failure(job['host'])
+            self._mark_failed(job['job_id'], job['url'], str(e))
+            self._remove_staging_files(job['staging_path'], job['final_filename'])
+            print(f"Download error: {str(e)}")
+            return False
+        finally:
+            if connections:
+                self.connections.release(connections)
+
+        if fragments.get('count') and fragments.get('elapsed'):
+            self._report_fragments(job, connections, fragments)
+        # Thông lượng (byte) của bài vừa tải giúp điều chỉnh số lượng tải song song
+        if sample['bytes']:
+            self.download_stage.report_success(job['host'], sample['bytes'])
+        return self.transcode_stage.submit('ffmpeg', self._profiled(self._transcode_stage), job, downloaded)
+
+    def _plan_download(self, ydl, job):
+        """How the selected format is fetched: ('fragments' | 'ranges' | 'single', format, size)
+
+        'fragments' is a native HLS/DASH stream, 'ranges' a progressive
+        stream large enough for a segmented download. Anything unexpected
+        leaves the download to yt-dlp over one connection.
+        """
+        try:
+            selected = ydl.process_ie_result(copy.deepcopy(job['info']), download=False)
+            if selected.get('requested_formats'):
+                return 'single', selected, None  # separate audio/video streams
+            if selected.get('protocol') in FRAGMENT_PROTOCOLS:
+                return 'fragments', selected, None
+            if self.download_connections < 2 or selected.get('protocol') not in ('http', 'https'):
+                return 'single', selected, None
+            if os.path.exists(ydl.prepare_filename(selected) + '.part'):
+                return 'single', selected, None  # yt-dlp tải tiếp phần đã có từ lần chạy trước
+            # Có .ytmp3-seg thì SegmentedDownloader tải tiếp các đoạn đã lưu trong .ytmp3-seg.json
+            total_bytes = selected.get('filesize')
+            if not total_bytes:
+                with ydl.urlopen(Request(selected['url'], headers=selected.get('http_headers'), method='HEAD')) as response:
+                    if response.headers.get('Accept-Ranges') != 'bytes':
+                        return 'single', selected, None
+                    total_bytes = int(response.headers.get('Content-Length') or 0)
+            if total_bytes < 2 * MIN_RANGE_SIZE:
+                return 'single', selected, None
+            return 'ranges', selected, total_bytes
+        except Exception as e:
+            print(f"Download planning skipped: {str(e)}")
+            return 'single', None, None
+
+    def _segmented_download(self, ydl, job, selected, total_bytes, connections):
+        """Fetch a large progressive stream over several connections before yt-dlp would use one.
+
+        The file is written where yt-dlp expects its download, so the
+        process_ie_result that follows finds it already there and goes on
+        with the thumbnail. If it fails, yt-dlp downloads it again as usual.
+        """
+        hook = self._progress_hook(job['job_id'])
+
+        def progress(downloaded, total, speed):
+            hook({'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': total, 'speed': speed,
+                  'info_dict': selected})
+
+        downloader = SegmentedDownloader(ydl, connections, progress=progress)
+        try:
+            ranges = downloader.download(selected['url'], ydl.prepare_filename(selected), total_bytes,
+                                         selected.get('http_headers'))
+        except Exception as e:
+            # yt-dlp sẽ tải lại qua một kết nối như bình thường
+            print(f"Segmented download failed, falling back to one connection: {str(e)}")
+            return
+
+        for byte_range in ranges:
+            self.metrics.observe('connection', job['host'], byte_range.seconds, byte_range.fetched)
+            for _ in range(byte_range.retries):
+                self.metrics.count_retry('connection', job['host'])
+        self.emit('job_connections', job_id=job['job_id'], speeds=[byte_range.speed() for byte_range in ranges])
+
+    def _fragment_hook(self, fragments):
+        """Progress hook that fills ``fragments`` with the count, bytes and time of a HLS/DASH download"""
+        def hook(d):
+            if d['status'] == 'downloading' and d.get('fragment_count'):
+                fragments['count'] = d['fragment_count']
+            elif d['status'] == 'finished' and d.get('elapsed'):
+                fragments['bytes'] = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+                fragments['elapsed'] = d['elapsed']
+        return hook
+
+    def _report_fragments(self, job, connections, fragments):
+        # Mỗi kết nối tải lần lượt count / connections fragment trong thời gian elapsed
+        latency = fragments['elapsed'] * connections / fragments['count']
+        speed = fragments['bytes'] / fragments['elapsed']
+        self.metrics.observe('fragment', job['host'], latency, fragments['bytes'])
+        self.emit('job_fragments', job_id=job['job_id'], fragments=fragments['count'], connections=connections,
+                  latency=latency, speed=speed)
+        limit = self.fragment_concurrency.report(job['host'], latency)
+        if limit is not None:
+            self.emit('concurrency', stage='fragment', host=job['host'], limit=limit)
+
+    def _transcode_stage(self, job, downloaded):
+        """Transcode/tag stage: convert, embed the cover and write the metadata"""
+        try:
+            opts = dict(job['opts'], postprocessors=job['postprocessors'])
+            opts['logger'] = self._ydl_logger('transcode', opts, job['host'])
+            with self.metrics.timed('transcode', job['host']) as sample:
+                with yt_dlp.YoutubeDL(opts) as ydl:
+                    ydl.params['postprocessor_args'] = job['postprocessor_args']
+                    info = ydl.post_process(downloaded['filepath'], downloaded)
+                final_path = self._place_final_file(info['filepath'], job['final_filename'])
+                sample['bytes'] = os.path.getsize(final_path)
+            # Ảnh bìa và file trung gian còn lại trong thư mục tạm của bài
+            shutil.rmtree(job['staging_path'], ignore_errors=True)
+            key = archive_key(job['url'])
+            if self.archive is not None and key:
+                self.archive.add(key, final_path)
+        except Exception as e:
+            self._mark_failed(job['job_id'], job['url'], str(e))
+            self._remove_staging_files(job['staging_path'], job['final_filename'])
+            print(f"Conversion error: {str(e)}")
+            return False
+        self.mark_download_complete(job['job_id'], job['info'])
+        return True
+
+    def _place_final_file(self, staged_path, final_filename):
+        """Move the converted file to its final name in one step, keeping the extension ffmpeg gave it.
+
+        The move never overwrites: if another program created a file with
+        that name in the meantime, the next free name is used instead. A
+        staging folder on another drive is first copied next to the final
+        file under a staging name, so the file only ever appears complete.
+        """
+        ext = os.path.splitext(staged_path)[1]  # '.mp3', '.flac', '.opus'...
+        if ext == STAGING_SUFFIX:
+            ext = ''  # không có postprocessor nào đổi đuôi file
+        final_path = os.path.splitext(final_filename)[0] + ext
+        if os.stat(staged_path).st_dev != os.stat(os.path.dirname(final_path)).st_dev:
+            local_path = _staging_base(final_filename) + ext
+            shutil.copyfile(staged_path, local_path)
+            os.remove(staged_path)
+            staged_path = local_path
+        while True:
+            try:
+                # link() thất bại nếu tên đã tồn tại, khác với replace() sẽ ghi đè
+                os.link(staged_path, final_path)
+            except FileExistsError:
+                folder, name = os.path.split(final_path)
+                final_path = self.filenames.reserve(folder, os.path.splitext(name)[0], ext.lstrip('.'))
+                continue
+            except OSError:
+                # Ổ đĩa không hỗ trợ hard link (FAT, exFAT, một số ổ mạng)
+                os.replace(staged_path, final_path)
+                return final_path
+            os.remove(staged_path)
+            return final_path
+
+    def _remove_staging_files(self, staging_path, final_filename):
+        """Delete what a failed job left behind (partial download, thumbnail, unfinished conversion) and free its name"""
+        shutil.rmtree(staging_path, ignore_errors=True)
+        if not final_filename:
+            return
+        # Bản chép dở sang ổ đích, hoặc cả bài nếu không tạo được thư mục tạm
+        for path in glob.glob(glob.escape(_staging_base(final_filename)) + '*'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.filenames.release(final_filename, _final_exts(final_filename))
+
+    def sweep_staging(self):
+        """Delete the staging folders of jobs that are gone (crashed or discarded runs); returns how many"""
+        try:
+            names = os.listdir(self.staging_dir)
+        except OSError:
+            return 0
+        # Bài chưa xong trong nhật ký giữ lại file dở để tải tiếp
+        keep = {os.path.basename(self._entry_staging_path(entry)) for entry in self.unfinished_jobs()}
+        now = time.time()
+        removed = 0
+        for name in names:
+            path = os.path.join(self.staging_dir, name)
+            if name in keep or not os.path.isdir(path):
+                continue
+            try:
+                newest = max([os.path.getmtime(path)] +
+                             [os.path.getmtime(os.path.join(path, f)) for f in os.listdir(path)])
+            except OSError:
+                continue
+            if now - newest < STAGING_ORPHAN_AGE:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        return removed
+
+    def submit_soundcloud_album(self, url, job_id=None, output_path=None):
+        """Queue the selected tracks of an album; the Future resolves when all are done"""
+        album_future = Future()
+        album_job_id = job_id if job_id is not None else self.new_job_id()
+
+        # Get album info (using cached version if available)
+        info = self.get_info(url)
+        if not info:
+            self.emit('job_failed', job_id=album_job_id, url=url, error=None)
+            album_future.set_result(False)
+            return album_future
+
+        if info.get('_type') != 'playlist':
+            self._mark_failed(album_job_id, url, "Not an album or playlist")
+            album_future.set_result(False)
+            return album_future
+
+        album_title = info.get('title', 'Unknown Album')
+        self.emit('album_started', job_id=album_job_id, title=album_title)
+
+        album_path = os.path.join(output_path or self.save_path, sanitize_filename(album_title))
+        os.makedirs(album_path, exist_ok=True)
+
+        entries = info.get('entries', [])
+
+        # Album rỗng hoặc không đọc được danh sách bài
+        if not entries:
+            self.emit('album_restricted', job_id=album_job_id, title=album_title)
+            with self.download_lock:
+                self.completed_downloads += 1
+                self.failed_downloads += 1
+            album_future.set_result(False)
+            return album_future
+
+        # Kiểm tra từng bài ở nền; hộp thoại chọn bài mở ngay với danh sách thô
+        checks = [self._check_album_track(entry) for entry in entries]
+        for idx, (entry, check) in enumerate(zip(entries, checks)):
+            check.add_done_callback(self._track_checked(album_job_id, idx, entry))
+
+        if self.select_tracks:
+            tracks_to_download = self.select_tracks(album_title, entries, checks)
+        else:
+            tracks_to_download = list(range(len(entries)))
+
+        if tracks_to_download is None:
+            # Người dùng đã hủy chọn album
+            for check in checks:
+                check.cancel()
+            self.emit('album_canceled', job_id=album_job_id, title=album_title)
+            with self.download_lock:
+                self.completed_downloads += 1
+            album_future.set_result(False)
+            return album_future
+
+        # Không cần kiểm tra những bài không được chọn
+        for idx, check in enumerate(checks):
+            if idx not in tracks_to_download:
+                check.cancel()
+
+        self.emit('album_selected', job_id=album_job_id, title=album_title, selected=len(tracks_to_download))
+        if not tracks_to_download:
+            # Không chọn bài nào: coi như hủy album
+            self.emit('album_canceled', job_id=album_job_id, title=album_title)
+            with self.download_lock:
+                self.completed_downloads += 1
+            album_future.set_result(False)
+            return album_future
+
+        # Create a list of tracks to download
+        track_downloads = []
+        for idx, entry in enumerate(entries):
+            # Skip tracks that were removed by user
+            track_url = entry.get('url', entry.get('webpage_url'))
+            if not track_url or idx not in tracks_to_download:
+                continue
+            track_downloads.append((track_url, entry.get('title', 'Unknown Track'), checks[idx]))
+
+        # Lưu số lượng bài hát trong album để theo dõi tiến trình
+        album_tracks_count = len(track_downloads)
+        if not album_tracks_count:
+            # Các bài đã chọn đều không có link để tải
+            self.emit('album_restricted', job_id=album_job_id, title=album_title)
+            with self.download_lock:
+                self.completed_downloads += 1
+                self.failed_downloads += 1
+            album_future.set_result(False)
+            return album_future
+
+        track_jobs = []
+        for idx, (track_url, track_title, check) in enumerate(track_downloads):
+            job_id = self.new_job_id()
+            self.emit('job_added', job_id=job_id, title=track_title, index=idx, count=album_tracks_count)
+            track_jobs.append((job_id, track_url, track_title, check))
+        if self.journal is not None:
+            self.journal.add_tracks(album_job_id, [(job_id, track_url) for job_id, track_url, _, _ in track_jobs],
+                                    album_path)
+
+        # Điều chỉnh total_downloads để tính chính xác số lượng bài hát sẽ tải
+        with self.download_lock:
+            # Giảm đi 1 vì album chỉ tính là 1 download trong total_downloads ban đầu
+            self.total_downloads = self.total_downloads - 1 + album_tracks_count
+            total, completed = self.total_downloads, self.completed_downloads
+
+            self.albums_in_progress[album_title] = {
+                'total': album_tracks_count,
+                'completed': 0,
+                'failed': 0
+            }
+        self.emit('totals', total=total, completed=completed)
+
+        remaining = [album_tracks_count]
+        skipped = [0]
+
+        def finish_track(outcome):
+            # Cập nhật trạng thái album
+            with self.download_lock:
+                album_stats = self.albums_in_progress.get(album_title)
+                if outcome == 'skipped':
+                    # Bài không tải được (geo-restriction...) không tính vào tổng
+                    skipped[0] += 1
+                    self.total_downloads -= 1
+                    if album_stats:
+                        album_stats['total'] -= 1
+                elif album_stats:
+                    album_stats[outcome] += 1
+                remaining[0] -= 1
+                album_done = remaining[0] == 0
+                all_skipped = album_done and skipped[0] == album_tracks_count
+                if album_done:
+                    self.albums_in_progress.pop(album_title, None)
+                if all_skipped:
+                    # Album vẫn được tính là 1 lượt tải thất bại như trước
+                    self.total_downloads += 1
+                    self.completed_downloads += 1
+                    self.failed_downloads += 1
+                total, completed = self.total_downloads, self.completed_downloads
+
+            if outcome == 'skipped':
+                self.emit('totals', total=total, completed=completed)
+            if not album_done:
+                return
+
+            # Album tải xong, cập nhật trạng thái
+            if skipped[0]:
+                self.emit('album_skipped', job_id=album_job_id, count=skipped[0])
+            if all_skipped:
+                self.emit('album_restricted', job_id=album_job_id, title=album_title)
+                album_future.set_result(False)
+                return
+            if album_stats:
+                self.emit('album_finished', job_id=album_job_id, title=album_title,
+                          completed=album_stats['completed'], total=album_stats['total'])
+            album_future.set_result(bool(album_stats) and album_stats['failed'] == 0)
+
+        def track_done(future):
+            track_success = not future.cancelled() and not future.exception() and future.result()
+            finish_track('completed' if track_success else 'failed')
+
+        def queue_track(job_id, track_url, track_title):
+            def checked(check):
+                if check.cancelled() or check.result() is None:
+                    self.emit('job_skipped', job_id=job_id, title=track_title, url=track_url)
+                    finish_track('skipped')
+                    return
+                # Bài đã kiểm tra xong mới vào hàng đợi chung, scheduler giới hạn số lượng tải đồng thời
+                self._submit_job('soundcloud', self.download_track, track_url, album_path, job_id).add_done_callback(track_done)
+            return checked
+
+        for job_id, track_url, track_title, check in track_jobs:
+            check.add_done_callback(queue_track(job_id, track_url, track_title))
+
+        return album_future
+
+    def _check_album_track(self, entry):
+        """Future of the check of an album track; tracks already in the library need none"""
+        track_url = entry.get('url', entry.get('webpage_url'))
+        if track_url and self.archived_path(track_url):
+            # download_track sẽ bỏ qua bài này, không cần trích xuất để kiểm tra
+            check = Future()
+            check.set_result({'title': entry.get('title', 'Unknown Track')})
+            return check
+        return self._checker.submit(self._profiled(self.check_track), track_url)
+
+    def _track_checked(self, album_job_id, index, entry):
+        """Done callback of an album track check: fill in the entry and announce the result"""
+        def done(check):
+            if check.cancelled():
+                return
+            info = check.result()
+            if info:
+                entry['title'] = info.get('title', entry.get('title', 'Unknown'))
+                entry['artist'] = info.get('artist', info.get('uploader', 'Unknown Artist'))
+            self.emit('track_checked', job_id=album_job_id, index=index,
+                      title=entry.get('title', 'Unknown Track'), available=bool(info))
+        return done
+
+
+def _taken_exts(audio_format):
+    # Chế độ âm thanh gốc chưa biết đuôi file trước khi tải, giữ chỗ mọi đuôi có thể
+    return ORIGINAL_AUDIO_EXTS if audio_format == 'original' else (audio_format,)
+
+
+def _final_exts(final_filename):
+    # Đuôi của tên đã chọn là định dạng lúc chọn ('original' khi giữ âm thanh gốc)
+    return _taken_exts(os.path.splitext(final_filename)[1].lstrip('.'))
+
+
+def _staging_key(owner, canonical):
+    return hashlib.sha1(f'{owner} {canonical}'.encode('utf-8', 'surrogatepass')).hexdigest()[:16]
+
+
+def _staging_base(final_filename):
+    return os.path.splitext(final_filename)[0] + STAGING_SUFFIX
+
+
+def _chain_future(source, target):
+    """Copy the outcome of ``source`` into ``target`` once it is done.
+
+    A result that is itself a Future (the next pipeline stage of a job) is
+    followed until a plain result comes out.
+    """
+    def copy(future):
+        if future.cancelled():
+            target.cancel()
+        elif future.exception() is not None:
+            target.set_exception(future.exception())
+        elif isinstance(future.result(), Future):
+            future.result().add_done_callback(copy)
+        else:
+            target.set_result(future.result())
+    source.add_done_callback(copy)
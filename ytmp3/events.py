@@ -0,0 +1,94 @@
+"""Coalescing of high-frequency engine events (download progress) before they reach subscribers"""
+import threading
+import time
+
+DEFAULT_PROGRESS_RATE = 10  # progress batches published per second
+
+
+class EventCoalescer:
+    """Keep only the latest event per key and publish them at most ``max_rate`` times per second.
+
+    yt-dlp reports progress for every chunk it writes, hundreds of times per
+    second per track. ``offer`` only replaces the pending event of that key;
+    a background thread publishes everything pending in one batch, then
+    waits until ``1 / max_rate`` seconds have passed before the next batch.
+    The first event after a quiet period is published right away.
+    """
+
+    def __init__(self, publish, max_rate=DEFAULT_PROGRESS_RATE, name='progress'):
+        self.publish = publish
+        self.interval = 1.0 / max_rate
+        self.name = name
+
+        self._pending = {}  # key -> (event, data), in first-offered order
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._last_flush = 0.0
+
+        self.offered = 0
+        self.published = 0
+        self.merged = 0  # replaced by a newer event of the same key before publishing
+        self.dropped = 0  # discarded because the key moved on (e.g. download finished)
+        self.peak_pending = 0
+
+    def offer(self, key, event, data):
+        with self._cond:
+            if self._closed:
+                return
+            self.offered += 1
+            if key in self._pending:
+                self.merged += 1
+            self._pending[key] = (event, data)
+            self.peak_pending = max(self.peak_pending, len(self._pending))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'ytmp3-{self.name}', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def discard(self, key):
+        """Drop the pending event of ``key`` so it can't be published after a later event"""
+        with self._cond:
+            if self._pending.pop(key, None) is not None:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # Giới hạn tần suất: chờ đủ khoảng cách kể từ lần phát trước
+            delay = self._last_flush + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.flush()
+
+    def flush(self):
+        """Publish everything pending now"""
+        with self._cond:
+            batch = self._pending
+            self._pending = {}
+            self._last_flush = time.monotonic()
+            self.published += len(batch)
+        for event, data in batch.values():
+            self.publish(event, data)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._pending = {}
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_rate': 1.0 / self.interval,
+                'pending': len(self._pending),
+                'peak_pending': self.peak_pending,
+                'offered': self.offered,
+                'published': self.published,
+                'merged': self.merged,
+                'dropped': self.dropped,
+            }
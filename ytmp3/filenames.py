@@ -0,0 +1,84 @@
+"""Unique output filenames, reserved from an in-memory index of each output folder"""
+import os
+import threading
+
+from .urls import sanitize_filename
+
+
+class FilenameReservations:
+    """Pick and hold unique filenames per folder without a stat call per candidate.
+
+    The first reservation in a folder lists it once; after that only the
+    in-memory index is consulted, and every reservation updates it under
+    one lock, so two tracks with the same title never get the same name
+    even before either file exists. Names are compared case-insensitively
+    (macOS and Windows folders are). ``forget`` drops the listings so the
+    next batch sees files added in between.
+
+    A name chosen in an earlier run (a job being resumed) is held with
+    ``claim`` on behalf of its journal entry, which is the only one that
+    can claim it again.
+    """
+
+    def __init__(self):
+        self._folders = {}  # folder -> {casefolded name: owner}, owner None for files and plain reservations
+        self._counters = {}  # (folder, casefolded title) -> last "(n)" handed out
+        self._lock = threading.Lock()
+
+    def _names(self, folder):
+        names = self._folders.get(folder)
+        if names is None:
+            try:
+                listing = os.listdir(folder)
+            except FileNotFoundError:
+                listing = []
+            names = self._folders[folder] = dict.fromkeys(name.casefold() for name in listing)
+        return names
+
+    def reserve(self, folder, title, ext, taken_exts=None):
+        """Reserve "<title>.<ext>" in ``folder``, or "<title> (n).<ext>" with the first free n.
+
+        A name counts as taken if the file exists or was reserved with any
+        extension of ``taken_exts`` (default: just ``ext``); all of them are
+        reserved together. Returns the full path.
+        """
+        taken_exts = taken_exts or (ext,)
+        base = sanitize_filename(title)
+        with self._lock:
+            names = self._names(folder)
+            candidate = base
+            # Tiếp tục từ số đã dùng lần trước thay vì thử lại từ (1)
+            counter = self._counters.get((folder, base.casefold()), 0) + 1
+            while any(f"{candidate}.{taken}".casefold() in names for taken in taken_exts):
+                candidate = f"{base} ({counter})"
+                counter += 1
+            if candidate != base:
+                self._counters[(folder, base.casefold())] = counter - 1
+            names.update(dict.fromkeys(f"{candidate}.{taken}".casefold() for taken in taken_exts))
+        return os.path.join(folder, f"{candidate}.{ext}")
+
+    def claim(self, path, taken_exts, owner):
+        """Hold a name chosen earlier for ``owner`` (a journal entry ID); False if it is taken by anything else"""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        keys = [f"{stem}.{taken}".casefold() for taken in taken_exts]
+        with self._lock:
+            names = self._names(os.path.dirname(path))
+            if any(names.get(key, owner) != owner for key in keys):
+                return False
+            names.update(dict.fromkeys(keys, owner))
+        return True
+
+    def release(self, path, taken_exts):
+        """Give back the name of a job that failed before its file was created"""
+        folder, name = os.path.split(path)
+        stem = os.path.splitext(name)[0]
+        with self._lock:
+            names = self._folders.get(folder)
+            if names is not None:
+                for taken in taken_exts:
+                    names.pop(f"{stem}.{taken}".casefold(), None)
+
+    def forget(self):
+        with self._lock:
+            self._folders = {}
+            self._counters = {}
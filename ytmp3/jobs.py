@@ -0,0 +1,176 @@
+"""Registry of download jobs keyed by job ID, filled from engine events"""
+import threading
+import time
+
+# Trạng thái của một bài hát
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+CONVERTING = 'converting'
+FINISHED = 'finished'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+ARCHIVED = 'archived'  # already in the library, not downloaded again
+
+# Trạng thái của một album
+ALBUM_LOADING = 'loading'
+ALBUM_SELECTED = 'selected'
+ALBUM_CANCELED = 'canceled'
+ALBUM_RESTRICTED = 'restricted'
+ALBUM_FINISHED = 'finished'
+
+ACTIVE_STATES = (DOWNLOADING, CONVERTING)
+
+
+class JobRecord:
+    """State of one track or album; ``kind`` is 'track' or 'album'"""
+
+    __slots__ = (
+        'job_id', 'kind', 'title', 'url', 'state', 'error',
+        'index', 'count',  # position of an album track
+        'downloaded_bytes', 'total_bytes', 'speed', 'percent',
+        'connections', 'fragments', 'fragment_latency', 'fragment_speed',  # multi-connection downloads
+        'selected', 'completed', 'total', 'skipped',  # album counters
+        'created', 'started', 'finished', 'updated',
+    )
+
+    def __init__(self, job_id, kind='track'):
+        now = time.time()
+        self.job_id = job_id
+        self.kind = kind
+        self.title = None
+        self.url = None
+        self.state = QUEUED if kind == 'track' else ALBUM_LOADING
+        self.error = None
+        self.index = None
+        self.count = None
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.speed = None
+        self.percent = None
+        self.connections = 1
+        self.fragments = None
+        self.fragment_latency = None
+        self.fragment_speed = None
+        self.selected = None
+        self.completed = None
+        self.total = None
+        self.skipped = 0
+        self.created = now
+        self.started = None
+        self.finished = None
+        self.updated = now
+
+    @property
+    def active(self):
+        return self.state in ACTIVE_STATES
+
+
+class JobRegistry:
+    """Jobs by ID in creation order; every update is a dict lookup plus attribute writes"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def records(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for record in self._jobs.values() if record.active)
+
+    def clear(self):
+        with self._lock:
+            self._jobs = {}
+
+    def update(self, job_id, kind='track', **fields):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None:
+                record = self._jobs[job_id] = JobRecord(job_id, kind)
+            for name, value in fields.items():
+                setattr(record, name, value)
+            record.updated = time.time()
+            return record
+
+    def apply(self, event, data):
+        """Update the record an engine event is about; returns it, or None for other events"""
+        job_id = data.get('job_id')
+        if job_id is None:
+            return None
+        now = time.time()
+
+        if event == 'album_started':
+            return self.update(job_id, 'album', title=data['title'], state=ALBUM_LOADING, started=now)
+        if event == 'album_selected':
+            return self.update(job_id, 'album', state=ALBUM_SELECTED, selected=data['selected'])
+        if event == 'album_canceled':
+            return self.update(job_id, 'album', state=ALBUM_CANCELED, finished=now)
+        if event == 'album_restricted':
+            return self.update(job_id, 'album', state=ALBUM_RESTRICTED, finished=now)
+        if event == 'album_skipped':
+            return self.update(job_id, 'album', skipped=data['count'])
+        if event == 'album_finished':
+            return self.update(job_id, 'album', state=ALBUM_FINISHED, completed=data['completed'],
+                               total=data['total'], finished=now)
+
+        if event == 'job_added':
+            return self.update(job_id, title=data['title'], index=data['index'], count=data['count'])
+        if event == 'job_started':
+            return self.update(job_id, title=data['title'], url=data['url'], state=DOWNLOADING, started=now)
+        if event == 'job_progress':
+            return self.update(job_id, title=data['title'], state=DOWNLOADING, percent=data['percent'],
+                               downloaded_bytes=data.get('downloaded_bytes', 0),
+                               total_bytes=data.get('total_bytes'), speed=data.get('speed'))
+        if event == 'job_connections':
+            return self.update(job_id, connections=len(data['speeds']))
+        if event == 'job_fragments':
+            return self.update(job_id, connections=data['connections'], fragments=data['fragments'],
+                               fragment_latency=data['latency'], fragment_speed=data['speed'])
+        if event == 'job_converting':
+            return self.update(job_id, title=data['title'], state=CONVERTING)
+        if event == 'job_finished':
+            return self.update(job_id, title=data['title'], state=FINISHED, finished=now)
+        if event == 'job_failed':
+            return self.update(job_id, url=data['url'], error=data['error'], state=FAILED, finished=now)
+        if event == 'job_archived':
+            return self.update(job_id, title=data['title'], url=data['url'], state=ARCHIVED, finished=now)
+        if event == 'job_skipped':
+            return self.update(job_id, title=data['title'], url=data['url'], state=SKIPPED, finished=now)
+        return None
+
+
+class CountdownLatch:
+    """Call ``on_zero`` exactly once, from the thread that counts the last of ``count`` jobs down"""
+
+    def __init__(self, count, on_zero):
+        self._remaining = count
+        self._on_zero = on_zero
+        self._lock = threading.Lock()
+        if count <= 0:
+            self._fire()
+
+    def _fire(self):
+        try:
+            self._on_zero()
+        except Exception as e:
+            print(f"Error in batch completion callback: {str(e)}")
+
+    def count_down(self, *args):
+        # *args cho phép dùng trực tiếp làm done callback của Future
+        with self._lock:
+            if self._remaining <= 0:
+                return
+            self._remaining -= 1
+            done = self._remaining == 0
+        if done:
+            self._fire()
+
+    @property
+    def remaining(self):
+        with self._lock:
+            return self._remaining
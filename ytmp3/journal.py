@@ -0,0 +1,211 @@
+"""Crash-safe journal of the jobs of a batch, so a batch interrupted by a crash or restart can be resumed"""
+import os
+import sqlite3
+import threading
+import time
+
+from .urls import canonical_url
+
+# Giai đoạn của một mục; chỉ các giai đoạn chưa xong được tải lại ở lần chạy sau
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+TRANSCODING = 'transcoding'
+EXPANDED = 'expanded'  # album whose selected tracks have their own entries
+FINISHED = 'finished'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+CANCELED = 'canceled'
+
+UNFINISHED_STAGES = (QUEUED, DOWNLOADING, TRANSCODING)
+
+# Bài dở không được tải tiếp lâu như vậy thì bị bỏ (cùng file tạm và tên file đã giữ)
+UNFINISHED_MAX_AGE = 14 * 24 * 3600
+
+# Sự kiện của engine -> giai đoạn mới của mục tương ứng
+EVENT_STAGES = {
+    'job_started': DOWNLOADING,
+    'job_converting': TRANSCODING,
+    'job_finished': FINISHED,
+    'job_archived': FINISHED,
+    'job_failed': FAILED,
+    'job_skipped': SKIPPED,
+    'album_canceled': CANCELED,
+    'album_restricted': FAILED,
+}
+
+
+class JournalEntry:
+    """One journaled job; ``kind`` is 'url' (a pasted URL) or 'track' (a selected album track)"""
+
+    __slots__ = ('entry_id', 'kind', 'url', 'canonical', 'output_dir', 'title', 'stage', 'final_filename')
+
+    def __init__(self, entry_id, kind, url, canonical, output_dir, title, stage, final_filename):
+        self.entry_id = entry_id
+        self.kind = kind
+        self.url = url
+        self.canonical = canonical
+        self.output_dir = output_dir
+        self.title = title
+        self.stage = stage
+        self.final_filename = final_filename  # partial files are "<final base>.ytmp3-part*"
+
+
+class JobJournal:
+    """SQLite journal with one row per pasted URL and per selected album track.
+
+    Rows are written when a job is queued and moved through the stages by
+    the engine events (see ``apply``), so whatever was not finished when
+    the app was closed or crashed is listed by ``unfinished`` on the next
+    launch. The final filename is recorded as soon as it is chosen: a
+    resumed job downloads to the same name, where yt-dlp continues its
+    ``.part`` and fragment files instead of starting over.
+
+    WAL with synchronous=NORMAL: a crash of the app never loses a committed
+    row, a power cut at most the last few updates (those jobs run again).
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._rows = {}  # engine job ID -> row ID, for this run only
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' kind TEXT NOT NULL,'
+            ' url TEXT NOT NULL,'
+            ' canonical TEXT NOT NULL,'
+            ' output_dir TEXT NOT NULL,'
+            ' title TEXT,'
+            ' stage TEXT NOT NULL,'
+            ' final_filename TEXT,'
+            ' updated REAL NOT NULL)'
+        )
+
+    def _write(self, statements):
+        """Run ``[(sql, args), ...]`` in one transaction; a journal error never stops a download"""
+        with self._lock:
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    cursors = [self._conn.execute(sql, args) for sql, args in statements]
+                    self._conn.execute('COMMIT')
+                except BaseException:
+                    self._conn.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error as e:
+                print(f"Job journal write failed: {str(e)}")
+                return None
+            return cursors
+
+    def _insert(self, kind, url, output_dir):
+        return ('INSERT INTO jobs (kind, url, canonical, output_dir, stage, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (kind, url, canonical_url(url), output_dir, QUEUED, time.time()))
+
+    def add(self, job_id, url, output_dir):
+        """Journal a pasted URL that was just queued as ``job_id``"""
+        cursors = self._write([self._insert('url', url, output_dir)])
+        if cursors:
+            self._rows[job_id] = cursors[0].lastrowid
+
+    def add_tracks(self, album_job_id, tracks, output_dir):
+        """Journal the selected tracks of an album as ``[(job_id, url), ...]`` and retire the album's own row.
+
+        Both happen in one transaction: after a crash either the album is
+        resumed from its URL (selection included) or each track is.
+        """
+        statements = [self._insert('track', url, output_dir) for _, url in tracks]
+        album_row = self._rows.pop(album_job_id, None)
+        if album_row is not None:
+            statements.append(('UPDATE jobs SET stage = ?, updated = ? WHERE id = ?', (EXPANDED, time.time(), album_row)))
+        cursors = self._write(statements)
+        if cursors:
+            for (job_id, _), cursor in zip(tracks, cursors):
+                self._rows[job_id] = cursor.lastrowid
+
+    def bind(self, job_id, entry_id):
+        """Attach an entry left over from an earlier run to the job that resumes it"""
+        self._rows[job_id] = entry_id
+        # Được tải tiếp thì tính lại hạn của mục từ bây giờ
+        self._write([('UPDATE jobs SET updated = ? WHERE id = ?', (time.time(), entry_id))])
+
+    def entry_id(self, job_id):
+        """Row ID of the entry of ``job_id`` (stable across runs), or None if it isn't journaled"""
+        return self._rows.get(job_id)
+
+    def entry(self, job_id):
+        """The JournalEntry of ``job_id``, or None if it isn't journaled"""
+        entry_id = self._rows.get(job_id)
+        if entry_id is None:
+            return None
+        entries = self._select('WHERE id = ?', (entry_id,))
+        return entries[0] if entries else None
+
+    def set_file(self, job_id, final_filename):
+        """Record the final filename chosen for ``job_id``"""
+        entry_id = self._rows.get(job_id)
+        if entry_id is not None:
+            self._write([('UPDATE jobs SET final_filename = ?, updated = ? WHERE id = ?',
+                          (final_filename, time.time(), entry_id))])
+
+    def apply(self, event, data):
+        """Move the entry an engine event is about to its new stage"""
+        stage = EVENT_STAGES.get(event)
+        if event == 'album_selected' and not data['selected']:
+            stage = CANCELED  # không chọn bài nào, album không có gì để tải lại
+        if stage is None:
+            return  # job_progress và các sự kiện khác không đổi giai đoạn
+        entry_id = self._rows.get(data.get('job_id'))
+        if entry_id is None:
+            return
+        if stage not in UNFINISHED_STAGES:
+            self._rows.pop(data['job_id'], None)
+        if event == 'job_started':
+            self._write([('UPDATE jobs SET stage = ?, title = ?, updated = ? WHERE id = ?',
+                          (stage, data['title'], time.time(), entry_id))])
+        else:
+            self._write([('UPDATE jobs SET stage = ?, updated = ? WHERE id = ?', (stage, time.time(), entry_id))])
+
+    def _select(self, where, args=()):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, kind, url, canonical, output_dir, title, stage, final_filename FROM jobs '
+                + where + ' ORDER BY id', args
+            ).fetchall()
+        return [JournalEntry(*row) for row in rows]
+
+    def unfinished(self):
+        """Entries of jobs that were queued but never finished, failed or skipped"""
+        # Mục đang chạy trong lần này không tính là bị bỏ dở
+        running = set(self._rows.values())
+        placeholders = ', '.join('?' * len(UNFINISHED_STAGES))
+        return [entry for entry in self._select(f'WHERE stage IN ({placeholders})', UNFINISHED_STAGES)
+                if entry.entry_id not in running]
+
+    def expire(self, max_age=UNFINISHED_MAX_AGE):
+        """Delete the unfinished entries untouched for ``max_age`` seconds and return them"""
+        placeholders = ', '.join('?' * len(UNFINISHED_STAGES))
+        where = f'WHERE stage IN ({placeholders}) AND updated < ?'
+        args = UNFINISHED_STAGES + (time.time() - max_age,)
+        running = set(self._rows.values())
+        expired = [entry for entry in self._select(where, args) if entry.entry_id not in running]
+        if expired:
+            self._write([('DELETE FROM jobs WHERE id = ?', (entry.entry_id,)) for entry in expired])
+        return expired
+
+    def prune(self):
+        """Delete the entries that are done; unfinished ones stay for the next run"""
+        placeholders = ', '.join('?' * len(UNFINISHED_STAGES))
+        self._write([(f'DELETE FROM jobs WHERE stage NOT IN ({placeholders})', UNFINISHED_STAGES)])
+
+    def clear(self):
+        """Forget every entry (the user chose not to resume)"""
+        self._rows = {}
+        self._write([('DELETE FROM jobs', ())])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
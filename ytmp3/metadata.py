@@ -0,0 +1,280 @@
+"""Cache for get_info results: single-flight lookups, TTLs and a persistent SQLite store"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Các khóa chứa URL luồng đã ký, hết hạn nhanh hơn nhiều so với tiêu đề và danh sách bài
+STREAM_KEYS = (
+    'formats', 'url', 'manifest_url', 'fragments', 'fragment_base_url',
+    'http_headers', 'requested_formats', 'requested_downloads', 'downloader_options',
+)
+
+DEFAULT_METADATA_TTL = 7 * 24 * 3600  # titles, artists, album track lists
+DEFAULT_STREAM_TTL = 10 * 60  # signed stream URLs
+DEFAULT_MAX_ENTRIES = 512  # in-memory entries
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # on-disk store
+
+
+def split_streams(info):
+    """Split an info dict into its long-lived metadata and its short-lived stream part"""
+    if not isinstance(info, dict) or info.get('_type', 'video') != 'video':
+        # Playlists and url results only carry page URLs, nothing signed
+        return info, None
+    meta = {k: v for k, v in info.items() if k not in STREAM_KEYS}
+    streams = {k: info[k] for k in STREAM_KEYS if k in info}
+    return meta, streams or None
+
+
+def _merge(meta, streams):
+    if streams:
+        return dict(meta, **streams)
+    return meta
+
+
+class SQLiteMetadataStore:
+    """On-disk metadata store shared between runs, evicted least recently used first by size"""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' key TEXT PRIMARY KEY,'
+            ' meta TEXT NOT NULL,'
+            ' streams TEXT,'
+            ' meta_expires REAL NOT NULL,'
+            ' streams_expires REAL NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+
+    def get(self, key, now):
+        """Return (meta, streams, meta_expires, streams_expires) or None if missing/expired"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT meta, streams, meta_expires, streams_expires FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            meta, streams, meta_expires, streams_expires = row
+            if meta_expires <= now:
+                self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return None
+            self._conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (now, key))
+
+        if streams_expires <= now:
+            streams = None
+        return json.loads(meta), json.loads(streams) if streams else None, meta_expires, streams_expires
+
+    def put(self, key, entry, now):
+        meta, streams, meta_expires, streams_expires = entry
+        meta_json = json.dumps(meta, default=str)
+        streams_json = json.dumps(streams, default=str) if streams else None
+        size = len(meta_json) + len(streams_json or '')
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, meta_json, streams_json, meta_expires, streams_expires, size, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            self.evictions += 1
+
+    def purge_expired(self, now=None):
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM entries WHERE meta_expires <= ?', (now or time.time(),))
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.execute('VACUUM')
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': count, 'bytes': size, 'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MetadataCache:
+    """Metadata cache keyed by canonical URL.
+
+    Only one extraction per key runs at a time: callers that ask for a key
+    while it is being loaded wait for that result instead of starting their
+    own network extraction. Values expire after ``metadata_ttl``; the signed
+    stream part of a single track (see STREAM_KEYS) expires after
+    ``stream_ttl`` and is simply left out of the returned dict after that.
+    An optional ``store`` keeps entries across runs.
+    """
+
+    def __init__(self, store=None, metadata_ttl=DEFAULT_METADATA_TTL, stream_ttl=DEFAULT_STREAM_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.store = store
+        self.metadata_ttl = metadata_ttl
+        self.stream_ttl = stream_ttl
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # key -> (meta, streams, meta_expires, streams_expires)
+        self._inflight = {}  # key -> Future of the running lookup
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        meta, streams, meta_expires, streams_expires = entry
+        if meta_expires <= now:
+            del self._entries[key]
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return _merge(meta, streams if streams_expires > now else None)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _make_entry(self, value, now):
+        meta, streams = split_streams(value)
+        return meta, streams, now + self.metadata_ttl, now + self.stream_ttl
+
+    def get_or_load(self, key, loader, use_cache=True):
+        """Return the cached value for ``key`` or call ``loader()`` exactly once.
+
+        With ``use_cache=False`` the cached value is ignored and the result is
+        not stored, but a lookup that is already in flight is still shared.
+        Exceptions raised by ``loader`` are passed on to every waiting caller
+        and are never cached.
+        """
+        now = time.time()
+        with self._lock:
+            if use_cache:
+                value = self._lookup(key, now)
+                if value is not None:
+                    self.hits += 1
+                    return value
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                generation = self._generation
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            entry = None
+            if use_cache and self.store is not None:
+                try:
+                    entry = self.store.get(key, now)
+                except sqlite3.Error as e:
+                    print(f"Metadata cache read failed: {str(e)}")
+
+            if entry is not None:
+                value = _merge(entry[0], entry[1])
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, entry)
+            else:
+                with self._lock:
+                    self.misses += 1
+                value = loader()
+                if use_cache:
+                    self._store(key, value, generation)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def _store(self, key, value, generation):
+        now = time.time()
+        entry = self._make_entry(value, now)
+        with self._lock:
+            # Không lưu kết quả cũ nếu cache đã bị xóa trong lúc đang tải
+            if generation != self._generation:
+                return
+            self._remember(key, entry)
+        if self.store is not None:
+            try:
+                self.store.put(key, entry, now)
+            except sqlite3.Error as e:
+                print(f"Metadata cache write failed: {str(e)}")
+
+    def get(self, key):
+        with self._lock:
+            return self._lookup(key, time.time())
+
+    def put(self, key, value):
+        with self._lock:
+            generation = self._generation
+        self._store(key, value, generation)
+
+    def clear(self, persistent=False):
+        """Drop the in-memory entries, and the on-disk ones too with ``persistent=True``"""
+        with self._lock:
+            self._entries = OrderedDict()
+            self._generation += 1
+        if persistent and self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'in_flight': len(self._inflight),
+            }
+        if self.store is not None:
+            stats['disk'] = self.store.stats()
+        return stats
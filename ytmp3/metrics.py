@@ -0,0 +1,188 @@
+"""Per-stage timings of a batch, exported as a JSON report or in the Prometheus text format"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Tên postprocessor của yt-dlp -> giai đoạn trong báo cáo
+POSTPROCESSOR_STAGES = {
+    'ExtractAudio': 'convert',
+    'EmbedThumbnail': 'thumbnail',
+    'Metadata': 'metadata',
+}
+
+
+class StageStats:
+    """Counters of one (stage, host) pair"""
+
+    __slots__ = ('count', 'failures', 'retries', 'bytes', 'seconds', 'max_seconds', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)  # not cumulative, see prometheus_text
+
+    def observe(self, seconds, nbytes, failed):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes += nbytes
+        if failed:
+            self.failures += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+
+class BatchMetrics:
+    """Timings, bytes, failures and retries per pipeline stage and host.
+
+    Stages: info (get_info), check (album track check), scan (library tags
+    read for the download archive), extract, download and transcode (the
+    whole ffmpeg stage), which is split further into convert, thumbnail
+    and metadata (one per yt-dlp postprocessor).
+    Segmented downloads add one ``connection`` sample per byte range and
+    HLS/DASH downloads one ``fragment`` sample (mean seconds per fragment).
+    Durations use time.monotonic(); every method is thread-safe.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._started_monotonic = time.monotonic()
+        self._stages = {}  # (stage, host) -> StageStats
+        self._lock = threading.Lock()
+
+    def _get(self, stage, host):
+        key = (stage, host or 'other')
+        stats = self._stages.get(key)
+        if stats is None:
+            stats = self._stages[key] = StageStats()
+        return stats
+
+    def observe(self, stage, host, seconds, nbytes=0, failed=False):
+        with self._lock:
+            self._get(stage, host).observe(seconds, nbytes, failed)
+
+    def count_retry(self, stage, host):
+        with self._lock:
+            self._get(stage, host).retries += 1
+
+    @contextlib.contextmanager
+    def timed(self, stage, host):
+        """Time the block; it counts as failed if it raises. Set ``bytes`` on the yielded dict."""
+        sample = {'bytes': 0, 'failed': False}
+        start = time.monotonic()
+        try:
+            yield sample
+        except BaseException:
+            sample['failed'] = True
+            raise
+        finally:
+            self.observe(stage, host, time.monotonic() - start, sample['bytes'], sample['failed'])
+
+    def report(self, **extra):
+        """Plain dict of everything measured so far, ``extra`` keys are added at the top level"""
+        with self._lock:
+            stages = [
+                {
+                    'stage': stage,
+                    'host': host,
+                    'count': stats.count,
+                    'failures': stats.failures,
+                    'retries': stats.retries,
+                    'bytes': stats.bytes,
+                    'seconds_total': round(stats.seconds, 3),
+                    'seconds_mean': round(stats.seconds / stats.count, 3) if stats.count else 0.0,
+                    'seconds_max': round(stats.max_seconds, 3),
+                }
+                for (stage, host), stats in sorted(self._stages.items())
+            ]
+        report = {
+            'started': self.started,
+            'wall_seconds': round(time.monotonic() - self._started_monotonic, 3),
+            'stages': stages,
+        }
+        report.update(extra)
+        return report
+
+    def prometheus_text(self):
+        """Metrics in the Prometheus text exposition format (e.g. for node_exporter's textfile collector)"""
+        lines = [
+            '# HELP ytmp3_stage_seconds Time spent in a pipeline stage per track.',
+            '# TYPE ytmp3_stage_seconds histogram',
+        ]
+        with self._lock:
+            items = sorted(self._stages.items())
+            for (stage, host), stats in items:
+                labels = f'stage="{stage}",host="{host}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'ytmp3_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'ytmp3_stage_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f'ytmp3_stage_seconds_sum{{{labels}}} {stats.seconds:.6f}')
+                lines.append(f'ytmp3_stage_seconds_count{{{labels}}} {stats.count}')
+            for name, attr, help_text in (
+                ('ytmp3_stage_bytes_total', 'bytes', 'Bytes written by a pipeline stage.'),
+                ('ytmp3_stage_failures_total', 'failures', 'Failed runs of a pipeline stage.'),
+                ('ytmp3_stage_retries_total', 'retries', 'Retries reported by yt-dlp during a stage.'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (stage, host), stats in items:
+                    lines.append(f'{name}{{stage="{stage}",host="{host}"}} {getattr(stats, attr)}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        _write_atomic(path, self.prometheus_text())
+
+
+def write_json(path, report):
+    _write_atomic(path, json.dumps(report, indent=2, default=str))
+
+
+def _write_atomic(path, text):
+    # Ghi ra file tạm rồi đổi tên, bên đọc (Prometheus) không bao giờ thấy file ghi dở
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class YtDlpLogger:
+    """``logger`` for a YoutubeDL instance: counts retry warnings of one stage.
+
+    yt-dlp's progress and debug lines are dropped (the front-ends show their
+    own progress); warnings and errors are printed to stderr as before.
+    """
+
+    def __init__(self, metrics, stage, host, warnings=True):
+        self.metrics = metrics
+        self.stage = stage
+        self.host = host
+        self.warnings = warnings
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        if 'Retrying' in msg:
+            self.metrics.count_retry(self.stage, self.host)
+        if self.warnings:
+            print(f"WARNING: {msg}", file=sys.stderr)
+
+    def error(self, msg):
+        print(msg, file=sys.stderr)
@@ -0,0 +1,23 @@
+"""Per-user folders owned by YTMP3"""
+import os
+import sys
+
+
+def user_cache_dir():
+    """Cache folder for YTMP3, overridable with the YTMP3_CACHE_DIR environment variable"""
+    if os.environ.get('YTMP3_CACHE_DIR'):
+        return os.environ['YTMP3_CACHE_DIR']
+    if sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Caches/YTMP3')
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+        return os.path.join(base, 'YTMP3', 'Cache')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'ytmp3')
+
+
+def user_staging_dir(cache_dir=None):
+    """Working folder of the jobs being downloaded, overridable with YTMP3_STAGING_DIR (e.g. a tmpfs)"""
+    if os.environ.get('YTMP3_STAGING_DIR'):
+        return os.environ['YTMP3_STAGING_DIR']
+    return os.path.join(cache_dir or user_cache_dir(), 'staging')
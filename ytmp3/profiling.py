@@ -0,0 +1,125 @@
+"""Profiling of one batch: cProfile over every worker thread and tracemalloc snapshots"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from datetime import datetime
+
+TRACEMALLOC_FRAMES = 25
+TOP_ALLOCATIONS = 50
+TOP_FUNCTIONS = 60
+
+# Từ Python 3.12 cProfile dùng sys.monitoring: một profiler đo được mọi luồng và
+# không bật được profiler thứ hai cùng lúc (ValueError). Bản cũ hơn chỉ đo luồng
+# đã bật nó, nên mỗi luồng worker cần profiler riêng
+GLOBAL_PROFILER = sys.version_info >= (3, 12)
+
+
+class BatchProfiler:
+    """cProfile + tracemalloc around a batch, written to ``<base_dir>/<timestamp>/``.
+
+    Files: profile.pstats (for pstats, snakeviz, or flameprof/gprof2dot to
+    draw a flame graph), profile.txt (top functions by cumulative time),
+    tracemalloc-start.snap / tracemalloc-end.snap and allocations.txt (the
+    lines whose allocations grew the most during the batch).
+
+    ``start`` and ``stop`` must be called from the same thread. Work that
+    runs on other threads is profiled when it goes through ``wrap``: up to
+    Python 3.11 each worker thread gets its own profiler, from 3.12 the
+    profiler started by ``start`` already records every thread. On 3.12+
+    nothing else may profile at the same time (another BatchProfiler, a
+    debugger's profiler), cProfile refuses to start a second one. ``stop``
+    checks that the functions that went through ``wrap`` were recorded and
+    says so at the top of profile.txt if some weren't.
+    """
+
+    def __init__(self, base_dir):
+        self.directory = os.path.join(base_dir, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        self._profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+        self._snapshot = None
+        self._main_profile = None
+        self._called = set()  # names of wrapped functions that ran, for the check in stop
+        self.running = False
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._snapshot = tracemalloc.take_snapshot()
+        self._main_profile = self._new_profile()
+        self._main_profile.enable()
+        self.running = True
+        return self
+
+    def _new_profile(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def wrap(self, fn):
+        """Return ``fn`` profiled on whatever thread it ends up running on"""
+        name = getattr(fn, '__name__', None)
+
+        def profiled(*args, **kwargs):
+            if self.running and name:
+                self._called.add(name)
+            if GLOBAL_PROFILER or not self.running or getattr(self._local, 'depth', 0):
+                return fn(*args, **kwargs)
+            profile = getattr(self._local, 'profile', None)
+            if profile is None:
+                profile = self._local.profile = self._new_profile()
+            self._local.depth = 1
+            profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._local.depth = 0
+        return profiled
+
+    def stop(self):
+        """Write every report and return the output directory"""
+        self.running = False
+        self._main_profile.disable()
+        end = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        with self._lock:
+            profiles = list(self._profiles)
+        text = io.StringIO()
+        stats = pstats.Stats(*profiles, stream=text)
+        missing = sorted(self._called - {name for _, _, name in stats.stats})
+        if missing:
+            # Không được xảy ra; nếu có thì cProfile không đo được luồng worker trên bản Python này
+            message = (f"WARNING: functions run on worker threads are missing from the profile "
+                       f"(Python {sys.version.split()[0]}): {', '.join(missing)}")
+            print(message)
+            text.write(message + '\n\n')
+        stats.dump_stats(os.path.join(self.directory, 'profile.pstats'))
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        with open(os.path.join(self.directory, 'profile.txt'), 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+
+        self._snapshot.dump(os.path.join(self.directory, 'tracemalloc-start.snap'))
+        end.dump(os.path.join(self.directory, 'tracemalloc-end.snap'))
+        # Bỏ qua bộ nhớ của chính tracemalloc và của việc nạp module
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ]
+        diff = end.filter_traces(filters).compare_to(self._snapshot.filter_traces(filters), 'lineno')
+        with open(os.path.join(self.directory, 'allocations.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"Top {TOP_ALLOCATIONS} allocation changes during the batch (size, count):\n")
+            for stat in diff[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+        return self.directory
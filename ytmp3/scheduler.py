@@ -0,0 +1,360 @@
+"""Bounded worker pools used by the stages of the download pipeline"""
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from .urls import is_soundcloud_url
+
+# Số lượng tải đồng thời tối đa cho mỗi nguồn (giới hạn trên khi tự điều chỉnh)
+DEFAULT_HOST_LIMITS = {
+    'youtube': 8,
+    'soundcloud': 8,
+}
+
+ADAPTIVE_INITIAL_LIMIT = 2
+ADAPTIVE_IMPROVEMENT = 1.1  # a round must be 10% faster than the last one to add a slot
+ADAPTIVE_COOLDOWN = 5.0  # seconds; errors within this window only back off once
+
+# Kết nối HTTP mở cùng lúc của mọi bài (khoảng byte, fragment HLS/DASH, tải thường)
+DEFAULT_CONNECTION_BUDGET = 32
+
+FRAGMENT_INITIAL_CONCURRENCY = 4
+FRAGMENT_MAX_CONCURRENCY = 16
+FRAGMENT_LATENCY_GROWTH = 1.25  # fragments within 25% of the host's best latency: one more in parallel
+FRAGMENT_LATENCY_BACKOFF = 2.0  # twice the best latency or worse: halve
+
+
+def host_for_url(url):
+    return 'soundcloud' if is_soundcloud_url(url) else 'youtube'
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit for one host.
+
+    After every round of ``limit`` successful jobs the throughput of the
+    round (units per second, e.g. bytes) is compared with the round before:
+    if it improved the limit goes up by one. A job that hits throttling, a
+    server error or a timeout halves the limit.
+    """
+
+    def __init__(self, maximum, initial=ADAPTIVE_INITIAL_LIMIT, minimum=1):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = max(minimum, min(initial, self.maximum))
+        self._last_rate = None
+        self._backoff_until = 0
+        self._new_round(time.monotonic())
+
+    def _new_round(self, now):
+        self._round_start = now
+        self._round_units = 0
+        self._round_jobs = 0
+
+    def success(self, units=1):
+        """Record a finished job; returns True if the limit went up"""
+        self._round_units += units
+        self._round_jobs += 1
+        if self._round_jobs < self.limit:
+            return False
+
+        now = time.monotonic()
+        rate = self._round_units / max(now - self._round_start, 1e-6)
+        improved = self._last_rate is None or rate > self._last_rate * ADAPTIVE_IMPROVEMENT
+        self._last_rate = rate
+        self._new_round(now)
+        if improved and self.limit < self.maximum and now >= self._backoff_until:
+            self.limit += 1
+            return True
+        return False
+
+    def failure(self):
+        """Record a throttled/failed job; returns True if the limit went down"""
+        now = time.monotonic()
+        if now < self._backoff_until:
+            return False
+        self._backoff_until = now + ADAPTIVE_COOLDOWN
+        old_limit = self.limit
+        self.limit = max(self.minimum, self.limit // 2)
+        self._last_rate = None
+        self._new_round(now)
+        return self.limit != old_limit
+
+
+class DownloadScheduler:
+    """Fixed pool of worker threads with a global and a per-host concurrency limit.
+
+    Every job (single track or album track) is queued here, so the number of
+    concurrent yt-dlp sessions stays at ``max_workers`` however many URLs are
+    pasted. Jobs start in submission order, skipping over hosts that are at
+    their own limit.
+
+    With ``max_pending`` the queue is bounded: ``submit`` blocks while it is
+    full, so a faster stage in front of this one waits instead of piling up
+    work (and stream URLs that expire). ``stats`` shows where work backs up.
+
+    With ``adaptive=True`` the per-host limits are only ceilings: each host
+    starts low and an AdaptiveLimit moves its limit from what jobs report
+    through ``report_success`` / ``report_failure``. ``on_limit_change`` is
+    called as ``on_limit_change(host, limit)`` whenever it moves.
+    """
+
+    def __init__(self, max_workers=4, host_limits=None, max_pending=None, name=None,
+                 adaptive=False, on_limit_change=None):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending
+        self.host_limits = dict(DEFAULT_HOST_LIMITS)
+        self.host_limits.update(host_limits or {})
+        self.adaptive = adaptive
+        self.on_limit_change = on_limit_change
+
+        self._queues = {}  # host -> deque of (seq, future, fn, args)
+        self._active = {}  # host -> running job count
+        self._limits = {}  # host -> AdaptiveLimit
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+
+        self._pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.full_waits = 0  # submits that had to wait for a free queue slot
+        self.full_wait_time = 0.0
+
+    def submit(self, host, fn, *args):
+        """Queue ``fn(*args)`` for ``host`` and return a Future with its result"""
+        future = Future()
+        with self._cond:
+            if self.max_pending and self._pending >= self.max_pending and not self._shutdown:
+                # Hàng đợi đầy: chờ giai đoạn này xử lý bớt
+                self.full_waits += 1
+                started = time.monotonic()
+                while self._pending >= self.max_pending and not self._shutdown:
+                    self._cond.wait()
+                self.full_wait_time += time.monotonic() - started
+            if self._shutdown:
+                raise RuntimeError("scheduler has been shut down")
+            self._queues.setdefault(host, deque()).append((next(self._seq), future, fn, args))
+            self._pending += 1
+            self.peak_pending = max(self.peak_pending, self._pending)
+            self._start_workers()
+            self._cond.notify()
+        return future
+
+    def pending_count(self):
+        with self._cond:
+            return self._pending
+
+    def active_count(self, host=None):
+        with self._cond:
+            if host is not None:
+                return self._active.get(host, 0)
+            return sum(self._active.values())
+
+    def _host_limit(self, host):
+        ceiling = min(self.host_limits.get(host, self.max_workers), self.max_workers)
+        if not self.adaptive:
+            return ceiling
+        if host not in self._limits:
+            self._limits[host] = AdaptiveLimit(ceiling)
+        return self._limits[host].limit
+
+    def host_limit(self, host):
+        """Current concurrency limit of ``host``"""
+        with self._cond:
+            return self._host_limit(host)
+
+    def report_success(self, host, units=1):
+        """Tell the adaptive limit of ``host`` that a job went through (``units`` of work, e.g. bytes)"""
+        self._report(host, lambda limit: limit.success(units))
+
+    def report_failure(self, host):
+        """Tell the adaptive limit of ``host`` that a job was throttled or timed out"""
+        self._report(host, lambda limit: limit.failure())
+
+    def _report(self, host, update):
+        if not self.adaptive:
+            return
+        with self._cond:
+            self._host_limit(host)
+            changed = update(self._limits[host])
+            limit = self._limits[host].limit
+            if changed:
+                self._cond.notify_all()
+        if changed and self.on_limit_change:
+            self.on_limit_change(host, limit)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'limits': {host: limit.limit for host, limit in self._limits.items()},
+                'active': sum(self._active.values()),
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'peak_pending': self.peak_pending,
+                'completed': self.completed,
+                'full_waits': self.full_waits,
+                'full_wait_time': self.full_wait_time,
+            }
+
+    def shutdown(self, wait=True):
+        """Stop the workers; jobs that have not started yet are canceled"""
+        with self._cond:
+            self._shutdown = True
+            for pending in self._queues.values():
+                while pending:
+                    pending.popleft()[1].cancel()
+            self._pending = 0
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _start_workers(self):
+        # Workers are created lazily, up to the global limit
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._worker, daemon=True,
+                                      name=f'ytmp3-{self.name}' if self.name else None)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_job(self):
+        """Pop the oldest job whose host has a free slot, or return None"""
+        best_host = None
+        best_seq = None
+        for host, pending in self._queues.items():
+            if not pending:
+                continue
+            if self._active.get(host, 0) >= self._host_limit(host):
+                continue
+            if best_seq is None or pending[0][0] < best_seq:
+                best_host, best_seq = host, pending[0][0]
+
+        if best_host is None:
+            return None
+
+        _, future, fn, args = self._queues[best_host].popleft()
+        self._pending -= 1
+        self._active[best_host] = self._active.get(best_host, 0) + 1
+        return best_host, future, fn, args
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._shutdown:
+                        return
+                    job = self._next_job()
+                    if job:
+                        if self.max_pending:
+                            # Một chỗ trong hàng đợi vừa trống, đánh thức submit đang chờ
+                            self._cond.notify_all()
+                        break
+                    self._cond.wait()
+
+            host, future, fn, args = job
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = fn(*args)
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self._cond:
+                    self._active[host] -= 1
+                    self.completed += 1
+                    self._cond.notify_all()
+
+
+class ConnectionBudget:
+    """Number of HTTP connections the downloads of every job may have open at once.
+
+    Each running download holds at least one. Segmented and fragmented
+    (HLS/DASH) downloads ask for more and get what is free, never fewer
+    than one; ``acquire`` only blocks while the whole budget is in use.
+    """
+
+    def __init__(self, total=DEFAULT_CONNECTION_BUDGET):
+        self.total = max(1, total)
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0  # downloads that had to wait for a free connection
+        self.shortfalls = 0  # downloads that got fewer connections than they asked for
+        self._cond = threading.Condition()
+
+    def acquire(self, wanted=1):
+        """Take up to ``wanted`` connections (at least one) and return how many were granted"""
+        with self._cond:
+            if self.in_use >= self.total:
+                self.waits += 1
+                while self.in_use >= self.total:
+                    self._cond.wait()
+            granted = max(1, min(wanted, self.total - self.in_use))
+            if granted < wanted:
+                self.shortfalls += 1
+            self.in_use += granted
+            self.peak = max(self.peak, self.in_use)
+            return granted
+
+    def release(self, count):
+        with self._cond:
+            self.in_use -= count
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'total': self.total,
+                'in_use': self.in_use,
+                'peak': self.peak,
+                'waits': self.waits,
+                'shortfalls': self.shortfalls,
+            }
+
+
+class FragmentConcurrency:
+    """Fragments fetched in parallel by a HLS/DASH download, tuned per host from fragment latency.
+
+    After each fragmented download the mean time one fragment took is
+    compared with the best seen for the host. Close to it means the server
+    keeps up with more parallel requests, so the next download gets one
+    more; much slower means the extra connections only queue behind each
+    other, so the next download gets half as many.
+    """
+
+    def __init__(self, initial=FRAGMENT_INITIAL_CONCURRENCY, maximum=FRAGMENT_MAX_CONCURRENCY):
+        self.initial = initial
+        self.maximum = max(1, maximum)
+        self._limits = {}  # host -> fragments in parallel
+        self._best = {}  # host -> lowest mean fragment latency (seconds)
+        self._lock = threading.Lock()
+
+    def limit(self, host):
+        with self._lock:
+            return self._limits.get(host, min(self.initial, self.maximum))
+
+    def report(self, host, latency):
+        """Record the mean fragment latency of a download; returns the new limit if it moved, else None"""
+        with self._lock:
+            limit = self._limits.get(host, min(self.initial, self.maximum))
+            best = min(self._best.get(host, latency), latency)
+            self._best[host] = best
+            if latency <= best * FRAGMENT_LATENCY_GROWTH:
+                new_limit = min(limit + 1, self.maximum)
+            elif latency >= best * FRAGMENT_LATENCY_BACKOFF:
+                new_limit = max(1, limit // 2)
+            else:
+                new_limit = limit
+            self._limits[host] = new_limit
+            return new_limit if new_limit != limit else None
+
+    def stats(self):
+        with self._lock:
+            return {host: {'limit': limit, 'best_latency': round(self._best.get(host, 0.0), 3)}
+                    for host, limit in self._limits.items()}
@@ -0,0 +1,191 @@
+"""Multi-connection download of one progressive (non-fragmented) file using HTTP byte ranges"""
+import json
+import os
+import threading
+import time
+
+from yt_dlp.networking import Request
+
+DEFAULT_CONNECTIONS = 4
+MIN_RANGE_SIZE = 4 * 1024 * 1024  # smaller files (and ranges) aren't worth an extra connection
+CHUNK_SIZE = 256 * 1024
+RANGE_RETRIES = 5
+SAVE_INTERVAL = 1.0  # seconds between two writes of the ranges file
+
+
+class RangeNotSupported(Exception):
+    """The server ignored the Range header; download the file over one connection instead"""
+
+
+class ByteRange:
+    """One part of the file, fetched by one connection; ``pos`` is the next byte to write"""
+
+    __slots__ = ('start', 'end', 'pos', 'resumed', 'retries', 'seconds')
+
+    def __init__(self, start, end, pos=None):
+        self.start = start
+        self.end = end  # inclusive
+        self.pos = start if pos is None else pos
+        self.resumed = self.pos - start  # bytes already written by an earlier run
+        self.retries = 0
+        self.seconds = 0.0
+
+    @property
+    def done(self):
+        return self.pos > self.end
+
+    @property
+    def downloaded(self):
+        return self.pos - self.start
+
+    @property
+    def fetched(self):
+        """Bytes fetched by this run"""
+        return self.downloaded - self.resumed
+
+    def speed(self):
+        return self.fetched / self.seconds if self.seconds else 0.0
+
+
+def split_ranges(total_bytes, connections, min_size=MIN_RANGE_SIZE):
+    """Split ``total_bytes`` into at most ``connections`` ranges of at least ``min_size`` bytes"""
+    count = max(1, min(connections, total_bytes // min_size))
+    size = -(-total_bytes // count)
+    return [ByteRange(start, min(start + size, total_bytes) - 1) for start in range(0, total_bytes, size)]
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_ranges(temp_path, total_bytes):
+    """Ranges saved next to ``temp_path`` by an interrupted run, or None if it can't be resumed"""
+    try:
+        with open(temp_path + '.json', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved['total_bytes'] != total_bytes or os.path.getsize(temp_path) != total_bytes:
+            return None
+        ranges = [ByteRange(start, end, pos) for start, end, pos in saved['ranges']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not ranges or any(not r.start <= r.pos <= r.end + 1 for r in ranges):
+        return None
+    return ranges
+
+
+class SegmentedDownloader:
+    """Fetch a file over several connections, each writing its own range in place.
+
+    The ranges are written into ``<filepath>.ytmp3-seg``, which is created at
+    full size up front and renamed to ``filepath`` once every range is
+    complete. A range that fails is retried from the last byte it wrote,
+    not from its start. How far each range got is saved in
+    ``<filepath>.ytmp3-seg.json``, so a run that was killed picks up the
+    ranges where they stopped instead of starting the file over. Requests go through ``ydl.urlopen``, so the
+    instance's proxy, cookies and headers apply.
+    """
+
+    def __init__(self, ydl, connections=DEFAULT_CONNECTIONS, min_range_size=MIN_RANGE_SIZE,
+                 retries=RANGE_RETRIES, progress=None):
+        self.ydl = ydl
+        self.connections = connections
+        self.min_range_size = min_range_size
+        self.retries = retries
+        self.progress = progress  # progress(downloaded_bytes, total_bytes, speed)
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    def download(self, url, filepath, total_bytes, headers=None):
+        """Download ``url`` to ``filepath`` and return the ranges (with their speed and retries)"""
+        temp_path = f'{filepath}.ytmp3-seg'
+        ranges = load_ranges(temp_path, total_bytes)
+        if ranges is None:
+            ranges = split_ranges(total_bytes, self.connections, self.min_range_size)
+            with open(temp_path, 'wb') as f:
+                f.truncate(total_bytes)
+            self._save(temp_path, ranges, total_bytes)
+
+        errors = []
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=self._fetch_range, args=(url, headers or {}, temp_path, r, ranges, total_bytes,
+                                                             started, errors),
+                             name=f'ytmp3-range-{i}', daemon=True)
+            for i, r in enumerate(ranges) if not r.done
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+            os.replace(temp_path, filepath)
+        except BaseException:
+            _remove(temp_path, temp_path + '.json')
+            raise
+        _remove(temp_path + '.json')
+        return ranges
+
+    def _save(self, temp_path, ranges, total_bytes):
+        # Ghi ra file tạm rồi đổi tên, để bị tắt giữa chừng cũng không hỏng file đã lưu
+        data = {'total_bytes': total_bytes, 'ranges': [[r.start, r.end, r.pos] for r in ranges]}
+        try:
+            with open(temp_path + '.json.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path + '.json.tmp', temp_path + '.json')
+        except OSError as e:
+            print(f"Could not save download progress: {str(e)}")
+        self._saved_at = time.monotonic()
+
+    def _fetch_range(self, url, headers, temp_path, byte_range, ranges, total_bytes, started, errors):
+        # Không đệm: byte nào đã tính vào pos (và file .json) thì đã nằm trong file
+        with open(temp_path, 'r+b', buffering=0) as f:
+            while not byte_range.done:
+                if errors:
+                    return  # một kết nối khác đã thất bại hẳn, không cần tải tiếp
+                range_started = time.monotonic()
+                delay = 0
+                try:
+                    request = Request(url, headers=dict(headers, Range=f'bytes={byte_range.pos}-{byte_range.end}'))
+                    with self.ydl.urlopen(request) as response:
+                        if response.status != 206:
+                            raise RangeNotSupported(f'HTTP {response.status} for a range request')
+                        f.seek(byte_range.pos)
+                        while not byte_range.done:
+                            data = response.read(min(CHUNK_SIZE, byte_range.end - byte_range.pos + 1))
+                            if not data:
+                                raise ConnectionError('Connection closed before the end of the range')
+                            view = memoryview(data)
+                            while view:
+                                view = view[f.write(view):]
+                            byte_range.pos += len(data)
+                            self._report(temp_path, ranges, total_bytes, started)
+                except RangeNotSupported as e:
+                    errors.append(e)
+                    return
+                except Exception as e:
+                    byte_range.retries += 1
+                    if byte_range.retries > self.retries:
+                        errors.append(e)
+                        return
+                    delay = min(2 ** byte_range.retries * 0.5, 10)
+                finally:
+                    byte_range.seconds += time.monotonic() - range_started
+                # Tải tiếp từ byte cuối đã ghi, không tải lại cả đoạn
+                time.sleep(delay)
+
+    def _report(self, temp_path, ranges, total_bytes, started):
+        with self._lock:
+            if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+                self._save(temp_path, ranges, total_bytes)
+            if self.progress is None:
+                return
+            downloaded = sum(r.downloaded for r in ranges)
+            fetched = sum(r.fetched for r in ranges)
+            elapsed = time.monotonic() - started
+            self.progress(downloaded, total_bytes, fetched / elapsed if elapsed else None)
@@ -0,0 +1,118 @@
+"""URL helpers shared by the GUI and the headless engine"""
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+YOUTUBE_WATCH_PATTERN = re.compile(r'(?:youtube\.com/watch\?v=|youtu\.be/)([a-zA-Z0-9_-]{11})')
+YOUTU_BE_PATTERN = re.compile(r'^(https?://)?(www\.)?youtu\.be/([a-zA-Z0-9_-]{11})')
+SHORTS_PATTERN = re.compile(r'^(https?://)?(www\.|m\.)?youtube\.com/shorts/([a-zA-Z0-9_-]{11})')
+YOUTUBE_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_-]{11}$')
+VALID_URL_PATTERN = re.compile(
+    r'^(https?://)?(www\.)?(youtube\.com|youtu\.be|soundcloud\.com)/.+',
+    re.IGNORECASE
+)
+
+
+def normalize_url(raw_url):
+    """Chuẩn hóa URL từ nhiều định dạng khác nhau thành URL chính thức"""
+    # Bỏ khoảng trắng ở đầu và cuối URL
+    url = raw_url.strip()
+
+    # Xử lý URL có ký tự @ ở đầu
+    if url.startswith('@'):
+        # Kiểm tra xem sau @ có phải là URL đầy đủ không
+        if url[1:].strip().startswith(('http://', 'https://', 'www.')):
+            url = url[1:].strip()
+        # Nếu @ là một phần của tên kênh YouTube thì giữ nguyên
+
+    # Xử lý URL thiếu phần domain (ví dụ: "watch?v=nsm32kHAaEA&list=...")
+    if url.startswith('watch?v='):
+        url = 'https://www.youtube.com/' + url
+
+    # Chuyển YouTube mobile (m.youtube.com) sang desktop
+    if 'm.youtube.com' in url:
+        url = url.replace('m.youtube.com', 'www.youtube.com')
+
+    # Chuyển YouTube Music sang link thường
+    if 'music.youtube.com' in url:
+        url = url.replace('music.youtube.com', 'www.youtube.com')
+
+    # Đảm bảo URL YouTube có giao thức
+    if 'youtube.com' in url or 'youtu.be' in url:
+        if not url.startswith(('http://', 'https://')):
+            if url.startswith('www.'):
+                url = 'https://' + url
+            else:
+                url = 'https://www.' + url
+
+    # Trích xuất video ID từ URL YouTube
+    youtube_match = YOUTUBE_WATCH_PATTERN.search(url)
+    if youtube_match:
+        return f"https://www.youtube.com/watch?v={youtube_match.group(1)}"
+
+    # Kiểm tra nếu URL là link rút gọn youtu.be
+    youtu_be_match = YOUTU_BE_PATTERN.match(url)
+    if youtu_be_match:
+        return f"https://www.youtube.com/watch?v={youtu_be_match.group(3)}"
+
+    # Chuyển YouTube Shorts sang link chính
+    shorts_match = SHORTS_PATTERN.match(url)
+    if shorts_match:
+        return f"https://www.youtube.com/watch?v={shorts_match.group(3)}"
+
+    # Kiểm tra nếu URL là ID video YouTube trực tiếp
+    if YOUTUBE_ID_PATTERN.match(url):
+        return f"https://www.youtube.com/watch?v={url}"
+
+    # Đảm bảo URL SoundCloud có giao thức
+    if 'soundcloud.com' in url and not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+
+    # Nếu không có quy tắc nào áp dụng, trả về URL gốc
+    return url
+
+
+def is_valid_url(url):
+    """Check if the input is a valid YouTube or SoundCloud URL"""
+    return bool(VALID_URL_PATTERN.match(normalize_url(url)))
+
+
+def validate_urls(urls):
+    """Validate a list of URLs, returning valid ones and invalid ones"""
+    valid_urls = []
+    invalid_urls = []
+
+    for raw_url in urls:
+        if not raw_url.strip():  # Skip empty lines
+            continue
+
+        url = normalize_url(raw_url)
+        if is_valid_url(url):
+            valid_urls.append(url)  # Lưu URL đã chuẩn hóa
+        else:
+            invalid_urls.append(raw_url)  # Giữ nguyên URL gốc cho thông báo lỗi
+
+    return valid_urls, invalid_urls
+
+
+def is_soundcloud_url(url):
+    return 'soundcloud.com' in url.lower()
+
+
+def sanitize_filename(filename):
+    return re.sub(r'[\\/*?:"<>|]', "_", filename)
+
+
+def canonical_url(url):
+    """Key that identifies the same track or album however its URL was pasted"""
+    url = normalize_url(url)
+    if not is_soundcloud_url(url):
+        # YouTube links are already reduced to watch?v=<id> by normalize_url
+        return url
+
+    parts = urlsplit(url)
+    # Bỏ các tham số theo dõi (si, utm_*...), chỉ giữ secret_token của link riêng tư
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k == 'secret_token']
+    canonical = f"https://soundcloud.com{parts.path.rstrip('/')}"
+    if query:
+        canonical += '?' + urlencode(query)
+    return canonical
@@ -0,0 +1,106 @@
+"""App-owned yt-dlp cache folder (YouTube player/signature data, SoundCloud client id)"""
+import contextlib
+import os
+import shutil
+import threading
+import time
+
+import yt_dlp
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+WARM_UP_INTERVAL = 6 * 3600  # seconds before a host is warmed up again
+TEMP_FILE_MAX_AGE = 3600  # leftovers of interrupted atomic writes
+
+# Video dùng để tải trước player JS của YouTube (video đầu tiên trên YouTube, rất nhẹ)
+YOUTUBE_WARM_UP_URL = 'https://www.youtube.com/watch?v=jNQXAC9IVRw'
+
+
+class YtDlpCache:
+    """The ``cachedir`` given to every YoutubeDL instance of the engine.
+
+    yt-dlp writes cache entries atomically (temp file + rename), so worker
+    threads can share the folder. This class keeps it under a size limit,
+    clears it on demand and fills it once per session before the workers
+    start, so they don't all fetch the same player JS at the same time.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._warm_up_lock = threading.Lock()
+
+    def options(self):
+        return {'cachedir': self.root}
+
+    def _files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st
+
+    def size(self):
+        return sum(st.st_size for _, st in self._files())
+
+    def prune(self):
+        """Remove stale temp files, then the least recently used entries above the size limit"""
+        now = time.time()
+        files = []
+        for path, st in self._files():
+            if path.endswith('.tmp') and now - st.st_mtime > TEMP_FILE_MAX_AGE:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                continue
+            files.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+                total -= size
+                removed += 1
+        return removed
+
+    def clear(self):
+        """Invalidate everything yt-dlp has cached"""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _marker(self, host):
+        return os.path.join(self.root, f'.warm-{host}')
+
+    def needs_warm_up(self, host):
+        try:
+            return time.time() - os.path.getmtime(self._marker(host)) > WARM_UP_INTERVAL
+        except OSError:
+            return True
+
+    def warm_up(self, hosts=('youtube', 'soundcloud'), ydl_opts=None):
+        """Fill the cache for ``hosts`` unless that was done recently"""
+        with self._warm_up_lock:
+            os.makedirs(self.root, exist_ok=True)
+            opts = {'quiet': True, 'no_warnings': True, 'socket_timeout': 10}
+            opts.update(ydl_opts or {})
+            opts.update(self.options())
+
+            for host in hosts:
+                if not self.needs_warm_up(host):
+                    continue
+                try:
+                    with yt_dlp.YoutubeDL(opts) as ydl:
+                        if host == 'youtube':
+                            # Tải và lưu player JS cùng các hàm giải mã chữ ký
+                            ydl.extract_info(YOUTUBE_WARM_UP_URL, download=False)
+                        elif host == 'soundcloud':
+                            # Lấy client_id của SoundCloud và lưu vào cache
+                            ydl.get_info_extractor('Soundcloud').initialize()
+                    with open(self._marker(host), 'w') as f:
+                        f.write(str(time.time()))
+                except Exception as e:
+                    print(f"Cache warm-up for {host} failed: {str(e)}")
+